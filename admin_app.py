@@ -1,18 +1,60 @@
-import json
+import io
 from datetime import time
 
-from flask import Flask, render_template, redirect, url_for, request, flash, session
-from functools import wraps
-from config_redis import get_redis_client
+from flask import Flask, render_template, redirect, url_for, request, flash, session, Response, stream_with_context, jsonify
+from functools import partial, wraps
+from config_redis import get_read_client, get_redis_client
+from key_schema import key_id, schema
+from live_events import StreamBroadcaster
+from order_index import (
+    ORDER_STATUSES,
+    ORDERS_BY_TIME,
+    load_orders,
+    page_order_ids,
+    query_order_index,
+    set_order_status,
+)
+from product_bulk import (
+    apply_adjustments,
+    check_utf8,
+    detect_format,
+    export_csv,
+    export_jsonl,
+    import_products,
+    iter_products,
+    upsert_products,
+)
+from order_records import order_lines, order_summary, unpack_order, unpack_seckill_order
+from sales_analytics import DEFAULT_REPORT_DAYS, sales_report
+from stats_counters import dashboard_stats, record_product_created
+from read_routing import install_read_your_writes, reader_for_request
+from request_cache import (
+    get_product,
+    get_stock,
+    get_user,
+    install as install_request_cache,
+    invalidate_product,
+    invalidate_stock,
+    prefetch_products,
+)
+from user_summary import read_summary
 
 app = Flask(__name__)
 app.secret_key = "admin-secret-key-change-this"
 
-# 共用同一顆雲端 Redis
-r = get_redis_client()
+# 共用的 Redis 連線池（web 角色：回應逾時短、連線數有上限，設定見 config_redis.py）
+r = get_redis_client("web")
+# 列表 / 報表這類唯讀頁面用的 client：有設 replica 就讀 replica（見 read_routing.py）
+rr = get_read_client("web")
 
-SHIPPING_THRESHOLD = 150   # 滿多少免運
-SHIPPING_FEE = 60          # 未滿門檻運費
+# 同一個 request 內重複讀的商品 / 庫存 / 使用者資料走 g 上的快取
+install_request_cache(app)
+# 管理員改完資料後幾秒內，他看到的列表 / 明細固定讀主節點
+install_read_your_writes(app)
+
+
+def read_client():
+    return reader_for_request(r, rr)
 
 
 # ================== 管理員帳密 ==================
@@ -30,6 +72,47 @@ def parse_time_hm(s: str):
         return None
 
 
+# ================== 搶購名額調整 ==================
+
+# 改名額跟扣名額（前台搶購）在 Redis 裡原子完成，活動進行中也能放心加名額：
+#   KEYS = [seckill:event:{pid}, seckill:stock:{pid}, seckill:users:{pid}]
+#   ARGV = [新名額, 開始時間, 結束時間, 商品編號]
+# 剩餘名額直接加上「新名額 - 舊名額」；舊設定沒有名額時才用 quota - 已成功人數。
+# 回傳 [剩餘名額, 已成功人數]；新名額比已成功人數還少時回傳 [-1, 已成功人數]，什麼都不改。
+_REBALANCE_SECKILL_SCRIPT = """
+local new_quota = tonumber(ARGV[1])
+local winners = redis.call('SCARD', KEYS[3])
+if new_quota < winners then
+  return {-1, winners}
+end
+
+local old_quota = tonumber(redis.call('HGET', KEYS[1], 'quota') or '')
+local stock
+if old_quota then
+  stock = tonumber(redis.call('GET', KEYS[2]) or '0') + (new_quota - old_quota)
+else
+  stock = new_quota - winners
+end
+if stock < 0 then
+  stock = 0
+end
+
+redis.call('HSET', KEYS[1], 'product_id', ARGV[4], 'start', ARGV[2], 'end', ARGV[3], 'quota', new_quota)
+redis.call('SET', KEYS[2], stock)
+return {stock, winners}
+"""
+rebalance_seckill = r.register_script(_REBALANCE_SECKILL_SCRIPT)
+
+
+def update_seckill_config(pid: str, start_str: str, end_str: str, quota: int):
+    """更新活動時間 / 名額，剩餘名額依名額差調整；回傳 (剩餘名額, 已成功人數)，名額不夠時剩餘名額是 -1。"""
+    stock, winners = rebalance_seckill(
+        keys=[schema.seckill_event(pid), schema.seckill_stock(pid), schema.seckill_users(pid)],
+        args=[quota, start_str, end_str, pid],
+    )
+    return int(stock), int(winners)
+
+
 def is_admin():
     return session.get("is_admin") is True
 
@@ -83,24 +166,14 @@ def admin_logout():
 @app.route("/admin")
 @admin_required
 def admin_dashboard():
-    product_count = len(r.keys("product:*"))
-    order_count = len(r.keys("order:*"))
-
-    # 只計算型態是 HASH 的 user:u_* 帳號
-    user_keys = [
-        key
-        for key in r.scan_iter("user:u_*")
-        if r.type(key) == "hash"   # 這裡改成 "hash"
-    ]
-    user_count = len(user_keys)
+    # 商品 / 訂單 / 用戶 / 今日訂單與營收：寫入時就維護好的計數器，一次 MGET
+    stats = dashboard_stats(read_client())
 
     return render_template(
         "admin_dashboard.html",
         title="管理後台",
         subtitle="快速查看系統概況",
-        product_count=product_count,
-        order_count=order_count,
-        user_count=user_count,
+        **stats,
     )
 
 
@@ -110,13 +183,16 @@ def admin_dashboard():
 @app.route("/admin/products")
 @admin_required
 def admin_products():
-    product_keys = r.keys("product:*")
+    reader = read_client()
+    product_keys = reader.keys(schema.product("*"))
     products = []
 
-    for key in sorted(product_keys):
-        pid = key.split(":")[1]
-        info = r.hgetall(key)
-        stock = int(r.get(f"stock:{pid}") or 0)
+    pids = sorted(key_id(key) for key in product_keys)
+    prefetch_products(reader, pids)
+
+    for pid in pids:
+        info = get_product(reader, pid)
+        stock = get_stock(reader, pid)
 
         products.append(
             {
@@ -150,11 +226,6 @@ def admin_new_product():
             flash("商品編號與名稱必填。", "error")
             return redirect(url_for("admin_new_product"))
 
-        # 不可以重複
-        if r.exists(f"product:{pid}"):
-            flash(f"商品編號 {pid} 已存在。", "error")
-            return redirect(url_for("admin_new_product"))
-
         try:
             price = int(price_raw)
             stock = int(stock_raw)
@@ -177,8 +248,12 @@ def admin_new_product():
             if val:
                 data[field] = val
 
-        r.hset(f"product:{pid}", mapping=data)
-        r.set(f"stock:{pid}", stock)
+        # 不可以重複：查存在、寫入、商品數 +1 在同一個 script 裡（跟大量匯入同一套）
+        if upsert_products(r, [(pid, data, stock)], create_only=True)[0] == "exists":
+            flash(f"商品編號 {pid} 已存在。", "error")
+            return redirect(url_for("admin_new_product"))
+        invalidate_product(r, pid)
+        invalidate_stock(r, pid)
 
         flash(f"已新增商品 {pid} - {name}", "success")
         return redirect(url_for("admin_products"))
@@ -191,37 +266,156 @@ def admin_new_product():
     )
 
 
+@app.route("/admin/products/import", methods=["GET", "POST"])
+@admin_required
+def admin_import_products():
+    """CSV / JSONL 大量匯入：邊讀邊驗證，分批 pipeline 寫入，列出被退回的列。"""
+    result = None
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("請選擇要匯入的檔案。", "error")
+            return redirect(url_for("admin_import_products"))
+
+        fmt = request.form.get("format") or detect_format(upload.filename)
+        create_only = request.form.get("mode") == "create"
+
+        # 邊讀邊寫，所以先整個檔案檢查編碼，不然讀到一半才出錯時前面的列已經寫進去了
+        try:
+            check_utf8(upload.stream)
+        except UnicodeDecodeError:
+            flash("檔案必須是 UTF-8 編碼，沒有匯入任何資料。", "error")
+            return redirect(url_for("admin_import_products"))
+
+        # utf-8-sig：Excel 存的 CSV 開頭常有 BOM
+        text_stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        result = import_products(r, text_stream, fmt=fmt, create_only=create_only)
+
+        flash(
+            f"匯入完成：新增 {result['created']} 筆、更新 {result['updated']} 筆、"
+            f"退回 {result['rejected']} 筆。",
+            "error" if result["rejected"] else "success",
+        )
+
+    return render_template(
+        "admin_product_import.html",
+        title="匯入商品",
+        subtitle="上傳 CSV / JSONL 一次建立或更新大量商品",
+        result=result,
+    )
+
+
+@app.route("/admin/products/export")
+@admin_required
+def admin_export_products():
+    """串流匯出所有商品（SCAN 分批讀，不會一次把全部商品放進記憶體）。"""
+    fmt = request.args.get("format", "csv")
+    reader = read_client()
+    if fmt == "jsonl":
+        body, mimetype, filename = export_jsonl(reader), "application/x-ndjson", "products.jsonl"
+    else:
+        body, mimetype, filename = export_csv(reader), "text/csv", "products.csv"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @app.route("/admin/products/<pid>/update", methods=["POST"])
 @admin_required
 def admin_update_product(pid):
-    price_raw = request.form.get("price", "")
-    stock_raw = request.form.get("stock", "")
+    # 跟批次調整走同一個 script：檢查 + 改價格 + 改庫存一次完成
+    change = {
+        "pid": pid,
+        "price": request.form.get("price", ""),
+        "stock": request.form.get("stock", ""),
+    }
+    row = apply_adjustments(r, [change])["results"][0]
+    invalidate_product(r, pid)
+    invalidate_stock(r, pid)
+
+    if row["ok"]:
+        flash(f"已更新商品 {pid} 的價格 / 庫存。", "success")
+    else:
+        flash(f"商品 {pid} 更新失敗：{row['error']}", "error")
+    return redirect(url_for("admin_products"))
 
-    info = r.hgetall(f"product:{pid}")
-    if not info:
-        flash(f"找不到商品 {pid}", "error")
-        return redirect(url_for("admin_products"))
 
-    # 更新價格
-    try:
-        price = int(price_raw)
-        if price < 0:
-            raise ValueError
-        r.hset(f"product:{pid}", "price", price)
-    except ValueError:
-        flash("價格必須是非負整數。", "error")
+def _invalidate_adjusted(result):
+    """批次調整套用成功的商品，request 快取裡的商品 / 庫存要丟掉。"""
+    pids = [row["pid"] for row in result["results"] if row["ok"]]
+    invalidate_product(r, *pids)
+    invalidate_stock(r, *pids)
 
-    # 更新庫存
-    try:
-        stock = int(stock_raw)
-        if stock < 0:
-            raise ValueError
-        r.set(f"stock:{pid}", stock)
-    except ValueError:
-        flash("庫存必須是非負整數。", "error")
 
-    flash(f"已更新商品 {pid} 的價格 / 庫存。", "success")
-    return redirect(url_for("admin_products"))
+def _bulk_changes_from_form(form):
+    """批次調整表單：每列 pid / price / stock_mode / stock_value，空白的列略過。"""
+    changes = []
+    rows = zip(
+        form.getlist("pid"),
+        form.getlist("price"),
+        form.getlist("stock_mode"),
+        form.getlist("stock_value"),
+    )
+    for pid, price, mode, value in rows:
+        price, value = price.strip(), value.strip()
+        if not price and not value:
+            continue
+        change = {"pid": pid, "price": price}
+        change["stock_delta" if mode == "delta" else "stock"] = value
+        changes.append(change)
+    return changes
+
+
+@app.route("/admin/products/bulk", methods=["GET", "POST"])
+@admin_required
+def admin_bulk_products():
+    """批次調整價格 / 庫存（例如進貨後一次補很多商品的庫存）。"""
+    outcomes = {}
+
+    if request.method == "POST":
+        changes = _bulk_changes_from_form(request.form)
+        if not changes:
+            flash("沒有填任何要調整的欄位。", "error")
+        else:
+            result = apply_adjustments(r, changes)
+            _invalidate_adjusted(result)
+            outcomes = {row["pid"]: row for row in result["results"]}
+            flash(
+                f"已套用 {result['applied']} 筆調整，失敗 {result['failed']} 筆。",
+                "error" if result["failed"] else "success",
+            )
+
+    products = sorted(iter_products(read_client()), key=lambda p: p["id"])
+
+    return render_template(
+        "admin_products_bulk.html",
+        title="批次調整",
+        subtitle="一次調整多個商品的價格與庫存",
+        products=products,
+        outcomes=outcomes,
+    )
+
+
+@app.route("/admin/api/products/bulk", methods=["POST"])
+@admin_required
+def admin_api_bulk_products():
+    """
+    批次調整 API：
+        {"changes": [{"pid": "2001", "price": 25, "stock_delta": 30}, {"pid": "2002", "stock": 0}, ...]}
+    回傳每一列的結果與成功 / 失敗筆數。
+    """
+    payload = request.get_json(silent=True) or {}
+    changes = payload.get("changes")
+    if not isinstance(changes, list) or not all(isinstance(c, dict) for c in changes):
+        return jsonify({"error": "changes 必須是物件陣列"}), 400
+
+    result = apply_adjustments(r, changes)
+    _invalidate_adjusted(result)
+    return jsonify(result)
 
 
 # ================== 訂單管理 ==================
@@ -229,69 +423,73 @@ def admin_update_product(pid):
 @app.route("/admin/orders")
 @admin_required
 def admin_orders():
-    """訂單列表（含運費）"""
-
-    # 抓出所有 order:* 的 key
-    order_keys = r.keys("order:*")
-    orders = []
-
-    if order_keys:
-        # 從 key 取出訂單編號部分：order:2025... -> 2025...
-        order_ids = [k.split(":", 1)[1] for k in order_keys]
+    """訂單列表（含運費），新到舊分頁；可依狀態 / 使用者 / 日期區間篩選。"""
+    filters = {
+        "status": request.args.get("status", "").strip(),
+        "user": request.args.get("user", "").strip(),
+        "from": request.args.get("from", "").strip(),
+        "to": request.args.get("to", "").strip(),
+    }
+
+    # 有篩選條件時先在 Redis 裡交集出結果（orders:by_time 或暫存的 sorted set）
+    index_key = query_order_index(
+        r,
+        status=filters["status"],
+        user=filters["user"],
+        date_from=filters["from"],
+        date_to=filters["to"],
+        # 第一頁每次重算；翻頁才重用暫存結果
+        reuse=bool(request.args.get("before") or request.args.get("after")),
+    )
 
-        # 讓新的在上面，因為你的 order_id 是用時間字串
-        order_ids.sort(reverse=True)
+    # 沒有篩選時直接讀 orders:by_time，可以走 replica；
+    # 有篩選時結果是剛在主節點上寫的暫存 key，replica 不一定已經同步，要讀主節點
+    reader = read_client() if index_key == ORDERS_BY_TIME else r
+
+    # 查某個使用者時，順便顯示 projector 維護好的摘要（一次 HGETALL）
+    customer = None
+    if filters["user"]:
+        customer = {
+            "id": filters["user"],
+            "name": reader.hget(schema.user(filters["user"]), "name") or "",
+            **read_summary(reader, filters["user"]),
+        }
 
-        for oid in order_ids:
-            key = f"order:{oid}"
-            data = r.hgetall(key)
-            if not data:
-                continue
+    # 拿這一頁的訂單編號，再用一個 pipeline 撈回訂單內容
+    order_ids, prev_cursor, next_cursor = page_order_ids(
+        reader,
+        before=request.args.get("before"),
+        after=request.args.get("after"),
+        key=index_key,
+    )
 
-            # 商品金額小計：checkout 存的 total
-            try:
-                items_total = int(data.get("total", 0))
-            except ValueError:
-                items_total = 0
-
-            # 運費：跟前台一樣規則（滿 150 免運，未滿收 60）
-            if items_total == 0:
-                shipping_fee = 0
-            elif items_total >= SHIPPING_THRESHOLD:
-                shipping_fee = 0
-            else:
-                shipping_fee = SHIPPING_FEE
-
-            grand_total = items_total + shipping_fee
-
-            # 商品數量
-            items_json = data.get("items", "{}")
-            try:
-                items_map = json.loads(items_json or "{}")
-            except json.JSONDecodeError:
-                items_map = {}
-            items_count = sum(
-                int(q) for q in items_map.values() if str(q).isdigit()
-            )
+    orders = []
+    for oid, data in load_orders(reader, order_ids):
+        # 小計 / 運費 / 應付（含運費）/ 件數：結帳時已存好
+        summary = order_summary(data)
 
-            orders.append(
-                {
-                    "id": oid,
-                    "created_at": data.get("created_at", ""),
-                    "user_id": data.get("user_id", ""),
-                    "status": data.get("status", "created"),
-                    "items_count": items_count,
-                    "items_total": items_total,
-                    "shipping_fee": shipping_fee,
-                    "grand_total": grand_total,  # ✅ 含運費金額
-                }
-            )
+        orders.append(
+            {
+                "id": oid,
+                "created_at": data.get("created_at", ""),
+                "user_id": data.get("user_id", ""),
+                "status": data.get("status", "created"),
+                **summary,
+            }
+        )
 
     return render_template(
         "admin_orders.html",
         title="訂單管理",
         subtitle="查看與管理所有訂單",
         orders=orders,
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+        filters=filters,
+        customer=customer,
+        # 翻頁連結要帶著篩選條件
+        filter_args={k: v for k, v in filters.items() if v},
+        statuses=ORDER_STATUSES,
     )
 
 
@@ -299,55 +497,19 @@ def admin_orders():
 @admin_required
 def admin_order_detail(order_id):
     """單筆訂單明細（含運費計算）"""
-    key = f"order:{order_id}"
-    data = r.hgetall(key)
+    reader = read_client()
+    key = schema.order(order_id)
+    data = unpack_order(reader.hgetall(key))
     if not data:
         flash(f"找不到訂單 {order_id}", "error")
         return redirect(url_for("admin_orders"))
 
-    # 解析 items（pid -> qty）
-    try:
-        items_map = json.loads(data.get("items", "{}") or "{}")
-    except json.JSONDecodeError:
-        items_map = {}
-
-    items = []
-    items_total = 0
-    for pid, qty_str in items_map.items():
-        info = r.hgetall(f"product:{pid}") or {}
-
-        try:
-            price = int(info.get("price", 0) or 0)
-        except ValueError:
-            price = 0
-
-        try:
-            qty = int(qty_str)
-        except ValueError:
-            qty = 0
-
-        subtotal = price * qty
-        items_total += subtotal
-
-        items.append(
-            {
-                "id": pid,
-                "name": info.get("name", pid),
-                "price": price,
-                "qty": qty,
-                "subtotal": subtotal,
-            }
-        )
-
-    # 運費：跟前台一樣的規則
-    if items_total == 0:
-        shipping_fee = 0
-    elif items_total >= SHIPPING_THRESHOLD:
-        shipping_fee = 0
-    else:
-        shipping_fee = SHIPPING_FEE
-
-    grand_total = items_total + shipping_fee
+    # 明細用結帳當下的價格快照（舊訂單才會補查商品）
+    items = order_lines(data, reader)
+    summary = order_summary(data)
+    items_total = summary["items_total"]
+    shipping_fee = summary["shipping_fee"]
+    grand_total = summary["grand_total"]
 
     return render_template(
         "admin_order_detail.html",
@@ -367,20 +529,63 @@ def admin_order_detail(order_id):
 def admin_update_order_status(order_id):
     """修改訂單狀態（例如 created/paid/shipped...）"""
     new_status = request.form.get("status", "").strip()
-    key = f"order:{order_id}"
 
-    if not r.exists(key):
+    # 狀態和 orders:status:* 索引在同一個 Lua script 裡更新
+    result = set_order_status(r, order_id, new_status)
+    if result == 0:
         flash(f"找不到訂單 {order_id}", "error")
+    elif result == -1:
+        flash("訂單狀態剛好被其他人修改，請重新整理後再試一次。", "error")
     else:
-        r.hset(key, "status", new_status)
         flash("已更新訂單狀態。", "success")
 
     return redirect(url_for("admin_order_detail", order_id=order_id))
 
 
+# ================== 即時看板（SSE） ==================
+
+# 每個 process 一個背景 reader，所有開著的看板共用
+# 背景 thread 會 XREAD BLOCK，用 worker 角色的連線池（socket timeout 比 BLOCK 長）
+live_broadcaster = StreamBroadcaster(partial(get_redis_client, "worker"))
+
+
+@app.route("/admin/live")
+@admin_required
+def admin_live_events():
+    """Server-Sent Events：新訂單 / 搶購成功即時推給後台頁面。"""
+    last_event_id = request.headers.get("Last-Event-ID")
+    return Response(
+        stream_with_context(live_broadcaster.sse(last_event_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ================== 銷售報表 ==================
+
+@app.route("/admin/reports")
+@admin_required
+def admin_reports():
+    """每日營收 / 熱銷商品 / 分類統計：直接讀結帳時累加好的 sales:* 彙總。"""
+    try:
+        days = int(request.args.get("days", DEFAULT_REPORT_DAYS))
+    except ValueError:
+        days = DEFAULT_REPORT_DAYS
+
+    report = sales_report(read_client(), days=days)
+
+    return render_template(
+        "admin_reports.html",
+        title="銷售報表",
+        subtitle=f"最近 {len(report['days'])} 天的銷售概況",
+        report=report,
+        days=len(report["days"]),
+    )
+
+
 # ================== 搶購管理 ==================
 
-def get_seckill_admin_status():
+def get_seckill_admin_status(client):
     """
     給後台用的搶購活動狀態：
     - 每個商品的名額 / 已成功 / 剩餘名額
@@ -389,11 +594,11 @@ def get_seckill_admin_status():
     events = []
 
     # 所有搶購訂單 id（建立訂單時有 rpush("seckill:orders", order_id)）
-    all_order_ids = r.lrange("seckill:orders", 0, -1)
+    all_order_ids = client.lrange(schema.seckill_orders, 0, -1)
 
     # 1. 從 Redis 撈出所有 seckill:event:* 的設定
-    for cfg_key in r.keys("seckill:event:*"):
-        cfg = r.hgetall(cfg_key)
+    for cfg_key in client.keys(schema.seckill_event("*")):
+        cfg = client.hgetall(cfg_key)
         pid = cfg.get("product_id")
         if not pid:
             continue
@@ -403,7 +608,7 @@ def get_seckill_admin_status():
         quota     = int(cfg.get("quota", 0) or 0)
 
         # 商品基本資訊
-        info = r.hgetall(f"product:{pid}") or {}
+        info = get_product(client, pid)
         product_name = info.get("name", f"商品 {pid}")
 
         price_str = info.get("price", "0")
@@ -413,14 +618,14 @@ def get_seckill_admin_status():
             price = 0
 
         # 活動剩餘名額（還在 seckill:stock:{pid} 裡）
-        stock_key = f"seckill:stock:{pid}"
-        stock = int(r.get(stock_key) or 0)
+        stock_key = schema.seckill_stock(pid)
+        stock = int(client.get(stock_key) or 0)
 
         # 2. 找出這個商品的所有成功紀錄
         success_records = []
         for oid in all_order_ids:
-            order_key = f"seckill:order:{oid}"
-            data = r.hgetall(order_key)
+            order_key = schema.seckill_order(oid)
+            data = unpack_seckill_order(client.hgetall(order_key))
             if not data:
                 continue
 
@@ -432,7 +637,8 @@ def get_seckill_admin_status():
             created_at = data.get("created_at", "")
 
             # 去 user:{user_id} 撈使用者名稱
-            user_info = r.hgetall(f"user:{user_id}") or {}
+            # 同一個人搶到好幾檔活動很常見，走 request 快取只讀一次
+            user_info = get_user(client, user_id)
             user_name = user_info.get("name", user_id)
 
             success_records.append(
@@ -472,7 +678,7 @@ def get_seckill_admin_status():
 @app.route("/admin/seckill")
 @admin_required
 def admin_seckill():
-    events = get_seckill_admin_status()
+    events = get_seckill_admin_status(read_client())
     return render_template(
         "admin_seckill.html",
         title="搶購管理",
@@ -517,7 +723,7 @@ def admin_new_seckill():
             return redirect(url_for("admin_new_seckill"))
 
         # 如果 Redis 裡還沒有這個商品，就順便幫你建立一個「限量商品」
-        product_key = f"product:{pid}"
+        product_key = schema.product(pid)
         if not r.exists(product_key):
             if not name:
                 name = f"限量商品 {pid}"
@@ -528,6 +734,7 @@ def admin_new_seckill():
                 "category": "限量商品",   # 很重要：標成限量商品，前台一般商品不會顯示
                 "stock": stock,           # 👈 新增商品時就帶入庫存
             })
+            record_product_created(r)
         else:
             # 商品已存在，如果有填新名稱或價格，就順便更新
             update_data = {
@@ -538,7 +745,9 @@ def admin_new_seckill():
                 update_data["name"] = name
             r.hset(product_key, mapping=update_data)
 
-        r.set(f"stock:{pid}", stock)
+        r.set(schema.stock(pid), stock)
+        invalidate_product(r, pid)
+        invalidate_stock(r, pid)
 
         # --- 解析開始 / 結束時間 ---
         start_t = parse_time_hm(start_str)
@@ -557,7 +766,7 @@ def admin_new_seckill():
             return redirect(url_for("admin_new_seckill"))
 
         # --- 寫入這個商品的搶購設定（seckill:event:{pid}）---
-        cfg_key = f"seckill:event:{pid}"
+        cfg_key = schema.seckill_event(pid)
         r.hset(cfg_key, mapping={
             "product_id": pid,
             "start": start_str,
@@ -568,8 +777,8 @@ def admin_new_seckill():
 
         # --- 初始化搶購名額 & 清掉舊的成功名單 ---
         # 這裡用「名額 quota」來當搶購可用數量，是 OK 的
-        r.set(f"seckill:stock:{pid}", quota)
-        r.delete(f"seckill:users:{pid}")
+        r.set(schema.seckill_stock(pid), quota)
+        r.delete(schema.seckill_users(pid))
 
         flash(f"已建立商品 {pid} 的搶購活動。", "success")
         return redirect(url_for("admin_seckill"))
@@ -584,14 +793,14 @@ def admin_new_seckill():
 @app.route("/admin/seckill/<product_id>/edit", methods=["GET", "POST"])
 @admin_required
 def admin_edit_seckill(product_id):
-    cfg_key = f"seckill:event:{product_id}"
+    cfg_key = schema.seckill_event(product_id)
     cfg = r.hgetall(cfg_key)
     if not cfg:
         flash(f"找不到商品 {product_id} 的搶購活動。", "error")
         return redirect(url_for("admin_seckill"))
 
-    product_key = f"product:{product_id}"
-    product = r.hgetall(product_key) or {}
+    product_key = schema.product(product_id)
+    product = get_product(r, product_id)
 
     price_str = product.get("price", "0")
     try:
@@ -631,6 +840,12 @@ def admin_edit_seckill(product_id):
             flash("活動名額必須是正整數。", "error")
             return redirect(url_for("admin_edit_seckill", product_id=product_id))
 
+        # 更新活動設定 + 剩餘名額（一個 script 完成，搶購進行中也不會超賣）
+        new_stock, success_count = update_seckill_config(product_id, start_str, end_str, quota)
+        if new_stock < 0:
+            flash(f"已有 {success_count} 人搶購成功，名額不能少於這個數字。", "error")
+            return redirect(url_for("admin_edit_seckill", product_id=product_id))
+
         # 更新商品資料
         update_data = {"price": price}
         if name:
@@ -638,19 +853,7 @@ def admin_edit_seckill(product_id):
         if not product.get("category"):
             update_data["category"] = "限量商品"
         r.hset(product_key, mapping=update_data)
-
-        # 更新活動設定
-        r.hset(cfg_key, mapping={
-            "product_id": product_id,
-            "start": start_str,
-            "end": end_str,
-            "quota": quota,
-        })
-
-        # 重新計算剩餘名額：quota - 已成功人數
-        success_count = int(r.scard(f"seckill:users:{product_id}") or 0)
-        new_stock = max(quota - success_count, 0)
-        r.set(f"seckill:stock:{product_id}", new_stock)
+        invalidate_product(r, product_id)
 
         flash(f"已更新商品 {product_id} 的搶購活動設定。", "success")
         return redirect(url_for("admin_seckill"))
@@ -677,12 +880,12 @@ def admin_update_seckill(pid):
     quota_raw = request.form.get("quota", "").strip()
 
     # 商品存在嗎？
-    if not r.exists(f"product:{pid}"):
+    if not r.exists(schema.product(pid)):
         flash(f"找不到商品 {pid}", "error")
         return redirect(url_for("admin_seckill"))
 
     # 秒殺活動設定存在嗎？
-    cfg_key = f"seckill:event:{pid}"
+    cfg_key = schema.seckill_event(pid)
     if not r.exists(cfg_key):
         flash(f"找不到商品 {pid} 的搶購活動設定。", "error")
         return redirect(url_for("admin_seckill"))
@@ -704,27 +907,15 @@ def admin_update_seckill(pid):
         flash("售價必須是非負整數，名額必須是正整數。", "error")
         return redirect(url_for("admin_seckill"))
 
-    # 目前已成功的人數（用 set 來算）
-    success_users_key = f"seckill:users:{pid}"
-    success_count = int(r.scard(success_users_key) or 0)
-
-    # 剩餘名額 = 新總名額 - 已成功，最低 0
-    remain = max(quota - success_count, 0)
-
-    # 寫回 Redis
-    # 1) 更新商品售價
-    r.hset(f"product:{pid}", "price", price)
-
-    # 2) 更新搶購活動設定
-    r.hset(cfg_key, mapping={
-        "product_id": pid,
-        "start": start_str,
-        "end":   end_str,
-        "quota": quota,
-    })
+    # 1) 更新搶購活動設定 + 剩餘名額：依新舊名額的差調整，跟前台搶購不會互相蓋掉
+    remain, success_count = update_seckill_config(pid, start_str, end_str, quota)
+    if remain < 0:
+        flash(f"已有 {success_count} 人搶購成功，名額不能少於這個數字。", "error")
+        return redirect(url_for("admin_seckill"))
 
-    # 3) 更新搶購剩餘名額
-    r.set(f"seckill:stock:{pid}", remain)
+    # 2) 更新商品售價
+    r.hset(schema.product(pid), "price", price)
+    invalidate_product(r, pid)
 
     flash(f"已更新商品 {pid} 的搶購活動設定。", "success")
     return redirect(url_for("admin_seckill"))
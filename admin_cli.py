@@ -1,29 +1,34 @@
 from config_redis import get_redis_client
+from key_schema import key_id, schema
+from order_index import ORDERS_BY_TIME, load_orders
+from stats_counters import record_product_created
 
 r = get_redis_client()
 
+ORDER_PAGE_SIZE = 200  # 列出所有訂單時，每次撈幾筆
+
 
 
 def list_products():
     print("\n=== 商品列表（Admin） ===")
-    product_keys = r.keys("product:*")
+    product_keys = r.keys(schema.product("*"))
     if not product_keys:
         print("目前沒有商品。")
         return
 
-    product_ids = sorted(k.split(":")[1] for k in product_keys)
+    product_ids = sorted(key_id(k) for k in product_keys)
 
     for pid in product_ids:
-        info = r.hgetall(f"product:{pid}")
-        stock = r.get(f"stock:{pid}") or "0"
+        info = r.hgetall(schema.product(pid))
+        stock = r.get(schema.stock(pid)) or "0"
         print(f"{pid}. {info.get('name')} - ${info.get('price')} (庫存：{stock})")
 
 
 def _get_next_product_id():
-    product_keys = r.keys("product:*")
+    product_keys = r.keys(schema.product("*"))
     if not product_keys:
         return "1001"
-    ids = sorted(int(k.split(":")[1]) for k in product_keys)
+    ids = sorted(int(key_id(k)) for k in product_keys)
     return str(ids[-1] + 1)
 
 
@@ -47,8 +52,9 @@ def add_product():
     stock = int(stock_str)
 
     pid = _get_next_product_id()
-    r.hset(f"product:{pid}", mapping={"name": name, "price": price})
-    r.set(f"stock:{pid}", stock)
+    r.hset(schema.product(pid), mapping={"name": name, "price": price})
+    r.set(schema.stock(pid), stock)
+    record_product_created(r)
 
     print(f"✅ 已新增商品：{pid} {name} 價格：{price} 庫存：{stock}")
 
@@ -58,7 +64,7 @@ def update_price():
     list_products()
     pid = input("請輸入要調整價格的商品編號：").strip()
 
-    if not r.exists(f"product:{pid}"):
+    if not r.exists(schema.product(pid)):
         print("❌ 找不到這個商品")
         return
 
@@ -68,8 +74,8 @@ def update_price():
         return
 
     price = int(price_str)
-    r.hset(f"product:{pid}", "price", price)
-    info = r.hgetall(f"product:{pid}")
+    r.hset(schema.product(pid), "price", price)
+    info = r.hgetall(schema.product(pid))
     print(f"✅ 已更新 {pid} {info.get('name')} 的價格為 {price}")
 
 
@@ -78,8 +84,8 @@ def update_stock():
     list_products()
     pid = input("請輸入要調整庫存的商品編號：").strip()
 
-    stock_key = f"stock:{pid}"
-    if not r.exists(f"product:{pid}"):
+    stock_key = schema.stock(pid)
+    if not r.exists(schema.product(pid)):
         print("❌ 找不到這個商品")
         return
 
@@ -93,27 +99,29 @@ def update_stock():
 
     new_stock = int(stock_str)
     r.set(stock_key, new_stock)
-    info = r.hgetall(f"product:{pid}")
+    info = r.hgetall(schema.product(pid))
     print(f"✅ 已將 {info.get('name')} 的庫存更新為 {new_stock}")
 
 
 def list_all_orders():
     print("\n=== 所有訂單列表 ===")
-    order_keys = r.keys("order:*")
-    if not order_keys:
+    if not r.zcard(ORDERS_BY_TIME):
         print("目前沒有任何訂單。")
         return
 
-    order_ids = sorted(k.split(":")[1] for k in order_keys)
-
-    for oid in order_ids:
-        key = f"order:{oid}"
-        data = r.hgetall(key)
-        user_id = data.get("user_id", "")
-        total = data.get("total", "0")
-        status = data.get("status", "unknown")
-        created_at = data.get("created_at", "")
-        print(f"- 訂單 {oid} / 使用者：{user_id} / 金額：${total} / 狀態：{status} / 建立時間：{created_at}")
+    # 依建立時間由舊到新，一次拿一段，每段一個 pipeline 撈訂單內容
+    start = 0
+    while True:
+        order_ids = r.zrange(ORDERS_BY_TIME, start, start + ORDER_PAGE_SIZE - 1)
+        if not order_ids:
+            break
+        start += len(order_ids)
+        for oid, data in load_orders(r, order_ids):
+            user_id = data.get("user_id", "")
+            total = data.get("total", "0")
+            status = data.get("status", "unknown")
+            created_at = data.get("created_at", "")
+            print(f"- 訂單 {oid} / 使用者：{user_id} / 金額：${total} / 狀態：{status} / 建立時間：{created_at}")
 
 
 def main():
@@ -1,31 +1,70 @@
-from datetime import datetime, time, timedelta
-import json
 import uuid
 
 from flask import Flask, render_template, redirect, url_for, request, flash, session
 from redis.exceptions import WatchError
-from config_redis import get_redis_client
+from config_redis import get_read_client, get_redis_client
+from key_schema import CLUSTER, key_id, schema
+from read_routing import install_read_your_writes, reader_for_request
+from request_cache import (
+    get_product,
+    get_stock,
+    get_user,
+    install as install_request_cache,
+    invalidate_stock,
+    invalidate_user,
+    prefetch_products,
+)
+from stats_counters import record_user_created
+from storefront import (
+    IDEMPOTENCY_TTL,
+    ORDERS_CHANNEL,
+    SECKILL_CHANNEL,
+    SECRET_KEY,
+    cart_lines,
+    checkout_event,
+    checkout_notice,
+    find_shortage,
+    idempotency_result,
+    new_idempotency_token,
+    new_order,
+    new_seckill_order,
+    parse_idempotency_record,
+    parse_seckill_configs,
+    product_entry,
+    queue_checkout,
+    queue_seckill_order,
+    queue_user_checkout,
+    seckill_event,
+    seckill_is_open,
+    seckill_message,
+    seckill_notice,
+    seckill_status,
+    seckill_token,
+    shortage_message,
+)
+from tw_time import now_tw_iso
+from user_history import load_profile
+from order_records import (
+    SHIPPING_THRESHOLD,
+    build_order_summary,
+    calc_shipping_fee,
+    order_lines,
+    order_summary,
+    unpack_order,
+)
 
 app = Flask(__name__)
-app.secret_key = "dev-secret-key-please-change"  # 隨便一串字就好，用來支援 flash 訊息
+app.secret_key = SECRET_KEY  # 跟 app_async.py 共用，兩邊的 session cookie 互通
 
-# 使用共用的雲端 Redis 連線設定
-r = get_redis_client()
+# 共用的 Redis 連線池（web 角色：回應逾時短、連線數有上限，設定見 config_redis.py）
+r = get_redis_client("web")
+# 唯讀頁面用的 client：有設 replica 就讀 replica，沒設就是 r（見 read_routing.py）
+rr = get_read_client("web")
 
-
-def now_tw():
-    """取得台灣現在時間（Render 用 UTC，所以手動 +8 小時）。"""
-    return datetime.utcnow() + timedelta(hours=8)
-
-
-def now_tw_iso():
-    """台灣時間的 ISO 字串，例如 2025-12-09T21:30:00。"""
-    return now_tw().isoformat(timespec="seconds")
-
-
-def now_tw_order_id():
-    """用台灣時間做出訂單編號用的時間字串。"""
-    return now_tw().strftime("%Y%m%d%H%M%S%f")
+# 同一個 request 內重複讀的商品 / 庫存 / 使用者資料走 g 上的快取
+install_request_cache(app)
+# 使用者送出寫入後幾秒內，他自己的讀取固定走主節點（剛結帳完一定看得到訂單）
+install_read_your_writes(app)
 
 
 def get_current_user_id():
@@ -35,7 +74,12 @@ def get_current_user_id():
 
 def get_cart_key():
     """每個使用者有自己的購物車 key。"""
-    return f"cart:{get_current_user_id()}"
+    return schema.cart(get_current_user_id())
+
+
+def read_client():
+    """唯讀頁面用哪個 client：一般是 rr，剛寫過資料的使用者是主節點 r。"""
+    return reader_for_request(r, rr)
 
 
 def require_user():
@@ -50,78 +94,64 @@ def require_user():
     return user_id, None
 
 
-def load_seckill_config():
-    """從 Redis 讀所有搶購活動設定，回傳 dict: {pid: {'start': time, 'end': time}}"""
-    events = {}
-    for key in r.keys("seckill:event:*"):
-        cfg = r.hgetall(key)
-        pid = cfg.get("product_id")
-        if not pid:
-            continue
+def idempotency_begin(user_id: str, token: str):
+    """
+    第一次看到這個 token 時回傳 None（呼叫端照常執行交易）；
+    重複送出時回傳第一次存下的結果 dict，還在處理中則回傳 {"pending": True}。
+    沒帶 token（舊表單）一律當作第一次。
+    """
+    if not token:
+        return None
 
-        start = cfg.get("start")
-        end = cfg.get("end")
-        if not start or not end:
-            continue
+    key = schema.idem(user_id, token)
+    if r.set(key, "pending", nx=True, ex=IDEMPOTENCY_TTL):
+        return None
 
-        try:
-            sh, sm = [int(x) for x in start.split(":")]
-            eh, em = [int(x) for x in end.split(":")]
-            events[pid] = {
-                "start": time(sh, sm),
-                "end": time(eh, em),
-            }
-        except Exception:
-            continue
+    return parse_idempotency_record(r.get(key))
 
-    return events
 
+def idempotency_finish(user_id: str, token: str, result: dict):
+    """把這次交易的結果存起來，重複送出時直接回傳同一個結果。"""
+    if not token:
+        return
+    r.set(schema.idem(user_id, token), idempotency_result(result), ex=IDEMPOTENCY_TTL)
 
-def is_seckill_open_for(product_id: str) -> bool:
-    cfgs = load_seckill_config()
-    cfg = cfgs.get(product_id)
-    if not cfg:
-        return False
 
-    # 用台灣時間來判斷活動是否開放
-    now = now_tw().time()
-    return cfg["start"] <= now <= cfg["end"]
+def idempotency_abort(user_id: str, token: str):
+    """交易沒有完成（例外），刪掉 pending 標記讓下一次送出可以重跑。"""
+    if token:
+        r.delete(schema.idem(user_id, token))
 
 
-def get_products_by_category():
+def load_seckill_config(client=None):
+    """從 Redis 讀所有搶購活動設定，回傳 dict: {pid: {'start': time, 'end': time}}"""
+    client = r if client is None else client
+    return parse_seckill_configs(client.hgetall(key) for key in client.keys(schema.seckill_event("*")))
+
+
+def is_seckill_open_for(product_id: str, client=None) -> bool:
+    cfg = load_seckill_config(client).get(product_id)
+    return bool(cfg) and seckill_is_open(cfg)
+
+
+def get_products_by_category(client):
     """從 Redis 抓出商品，依分類整理成 dict。"""
-    product_keys = r.keys("product:*")
+    product_keys = client.keys(schema.product("*"))
     if not product_keys:
         return {}
 
-    product_ids = sorted(k.split(":")[1] for k in product_keys)
+    product_ids = sorted(key_id(k) for k in product_keys)
     products_by_cat = {}
+    prefetch_products(client, product_ids)
 
     for pid in product_ids:
-        info = r.hgetall(f"product:{pid}")
+        info = get_product(client, pid)
         if not info:
             continue
-        stock = int(r.get(f"stock:{pid}") or 0)
-        category = info.get("category", "未分類")
-
         # 限量商品只給搶購用，不出現在一般商品列表
-        if category == "限量商品":
-            continue
-
-        product_data = {
-            "id": pid,
-            "name": info.get("name"),
-            "price": int(info.get("price", 0)),
-            "stock": stock,
-            "category": category,
-            "image_url": f"images/products/{pid}.jpg",
-            "net_weight": info.get("net_weight"),
-            "mfg": info.get("mfg"),
-            "exp": info.get("exp"),
-            "origin": info.get("origin"),
-        }
-
-        products_by_cat.setdefault(category, []).append(product_data)
+        product_data = product_entry(pid, info, get_stock(client, pid))
+        if product_data:
+            products_by_cat.setdefault(product_data["category"], []).append(product_data)
 
     return products_by_cat
 
@@ -131,21 +161,22 @@ def get_cart():
     if resp:
         return resp
 
-    cart_key = f"cart:{user_id}"
+    cart_key = schema.cart(user_id)
 
     """從 Redis 抓出購物車內容，整理成清單＋總金額。"""
     cart_items = r.hgetall(cart_key)
     items = []
     total = 0
+    prefetch_products(r, cart_items.keys())
 
     for pid, qty_str in cart_items.items():
-        info = r.hgetall(f"product:{pid}")
+        info = get_product(r, pid)
         if not info:
             continue
 
         price = int(info.get("price", 0))
         qty = int(qty_str)
-        stock = int(r.get(f"stock:{pid}") or 0)
+        stock = get_stock(r, pid)
         subtotal = price * qty
         total += subtotal
 
@@ -163,39 +194,17 @@ def get_cart():
     return items, total
 
 
-def get_seckill_status_list():
+def get_seckill_status_list(client):
     """取得所有搶購活動狀態（從 Redis 設定來）。"""
-    cfgs = load_seckill_config()
+    cfgs = load_seckill_config(client)
     events = []
 
-    for pid, cfg in cfgs.items():
-        info = r.hgetall(f"product:{pid}")
-        product_name = info.get("name", f"商品 {pid}")
-        price = info.get("price", "?")
+    prefetch_products(client, cfgs.keys(), with_stock=False)
 
-        stock_key = f"seckill:stock:{pid}"
-        users_key = f"seckill:users:{pid}"
-
-        stock = int(r.get(stock_key) or 0)
-        success_users = sorted(list(r.smembers(users_key)))
-        success_count = len(success_users)
-        total_quota = success_count + stock
-
-        open_now = is_seckill_open_for(pid)
-
-        events.append(
-            {
-                "product_id": pid,
-                "product_name": product_name,
-                "price": price,
-                "stock": stock,
-                "success_count": success_count,
-                "total_quota": total_quota,
-                "start_time": cfg["start"].strftime("%H:%M"),
-                "end_time": cfg["end"].strftime("%H:%M"),
-                "open_now": open_now,
-            }
-        )
+    for pid, cfg in cfgs.items():
+        stock = client.get(schema.seckill_stock(pid))
+        success_users = client.smembers(schema.seckill_users(pid))
+        events.append(seckill_status(pid, cfg, get_product(client, pid), stock, success_users))
 
     events.sort(key=lambda e: e["product_id"])
     return events
@@ -209,11 +218,11 @@ def seckill_attempt(product_id: str, user_id: str) -> str:
       - "no_quota"
       - "already_success"
     """
-    stock_key = f"seckill:stock:{product_id}"
-    users_key = f"seckill:users:{product_id}"
+    stock_key = schema.seckill_stock(product_id)
+    users_key = schema.seckill_users(product_id)
 
     try:
-        with r.pipeline() as pipe:
+        with r.pipeline(transaction=True) as pipe:
             # 1) 監看庫存 & 成功名單
             pipe.watch(stock_key, users_key)
 
@@ -232,41 +241,24 @@ def seckill_attempt(product_id: str, user_id: str) -> str:
             pipe.sadd(users_key, user_id)  # 成功名單加入
 
             # 建立搶購訂單
-            order_id = now_tw_order_id()
-            order_key = f"seckill:order:{order_id}"
+            order_id, order_data = new_seckill_order(product_id, user_id)
 
-            order_data = {
-                "product_id": product_id,
-                "user_id": user_id,
-                "created_at": now_tw_iso(),
-            }
-
-            pipe.hset(order_key, mapping=order_data)
-            pipe.rpush("seckill:orders", order_id)
-            pipe.rpush(f"user:{user_id}:seckill_orders", order_id)
+            # cluster 模式下訂單 / 列表 / 報表不在這個活動的 slot，不能放進同一個 MULTI：
+            # 名額扣成功後再用一個 pipeline 寫（防超賣靠的是上面扣名額的交易）
+            follow = r.pipeline(transaction=False) if CLUSTER else pipe
+            queue_seckill_order(follow, order_id, order_data)
 
             pipe.execute()
+        if follow is not pipe:
+            follow.execute()
 
         # 3) Transaction 成功之後，再發 Pub/Sub & Streams 事件
 
         # Pub/Sub：讓 subscriber.py 即時看到搶購成功
-        notice = {
-            "type": "seckill_success",
-            "user_id": user_id,
-            "product_id": product_id,
-            "time": now_tw_iso(),
-        }
-        r.publish("channel:seckill", json.dumps(notice, ensure_ascii=False))
+        r.publish(SECKILL_CHANNEL, seckill_notice(order_data))
 
         # Streams：寫一筆搶購成功事件，給 view_streams.py 查看
-        r.xadd(
-            "stream:seckill",
-            {
-                "user_id": user_id,
-                "product_id": product_id,
-                "result": "success",
-            },
-        )
+        r.xadd(schema.seckill_events_stream, seckill_event(order_id, order_data))
 
         return "ok"
 
@@ -303,16 +295,19 @@ def profile_setup():
         # 把 user_id 放進 session，之後就能分辨誰是誰
         session["user_id"] = user_id
 
-        # 存到 Redis：user:{user_id}
-        r.hset(
-            f"user:{user_id}",
-            mapping={
-                "name": name,
-                "phone": phone,
-                "address": address,
-                "created_at": now_tw_iso(),
-            },
-        )
+        # 存到 Redis：user:{user_id}（順便更新後台的用戶總數；cluster 模式兩個 key 不同 slot，不包 MULTI）
+        with r.pipeline(transaction=not CLUSTER) as pipe:
+            pipe.hset(
+                schema.user(user_id),
+                mapping={
+                    "name": name,
+                    "phone": phone,
+                    "address": address,
+                    "created_at": now_tw_iso(),
+                },
+            )
+            record_user_created(pipe)
+            pipe.execute()
 
         flash("個人檔案建立完成，歡迎來逛逛～", "success")
         return redirect(url_for("products"))
@@ -339,8 +334,7 @@ def login():
         flash("請輸入 user id。", "error")
         return redirect(url_for("profile_setup"))
 
-    user_key = f"user:{user_id}"
-    if not r.exists(user_key):
+    if not get_user(r, user_id):
         flash("找不到這個 user id，請確認是否輸入正確。", "error")
         return redirect(url_for("profile_setup"))
 
@@ -356,102 +350,28 @@ def profile():
     if resp:
         return resp
 
-    user_key = f"user:{user_id}"
-    user_info = r.hgetall(user_key) or {}
-
-    # ==== 歷史訂單：從 user:{user_id}:orders 撈出最近幾筆 ====
-    orders_key = f"user:{user_id}:orders"
-    order_ids = r.lrange(orders_key, 0, 19)  # 最多 20 筆
-
-    orders = []
-    for oid in order_ids:
-        order_key = f"order:{oid}"
-        od = r.hgetall(order_key)
-        if not od:
-            continue
-
-        # 解析「商品金額小計」（checkout 時存的 total）
-        try:
-            items_total = int(od.get("total", 0))
-        except ValueError:
-            items_total = 0
-
-        # 運費：跟 cart() 一樣的規則
-        if items_total == 0:
-            shipping_fee = 0
-        elif items_total >= SHIPPING_THRESHOLD:
-            shipping_fee = 0
-        else:
-            shipping_fee = SHIPPING_FEE
-
-        grand_total = items_total + shipping_fee
-
-        # 解析商品數量
-        items_json = od.get("items", "{}")
-        try:
-            items_dict = json.loads(items_json)
-        except json.JSONDecodeError:
-            items_dict = {}
-        items_count = sum(
-            int(q) for q in items_dict.values() if str(q).isdigit()
-        )
-
-        orders.append(
-            {
-                "id": oid,
-                "items_total": items_total,  # 商品小計（純商品）
-                "shipping_fee": shipping_fee,  # 運費
-                "grand_total": grand_total,  # 含運費的應付金額
-                "created_at": od.get("created_at", ""),
-                "status": od.get("status", "已建立"),
-                "items_count": items_count,
-            }
-        )
-
-    # 讓最新的訂單排在最上面
-    orders = list(reversed(orders))
-
-    # ==== 搶購活動紀錄：user:{user_id}:seckill_orders ====
-    seckill_list_key = f"user:{user_id}:seckill_orders"
-    seckill_order_ids = r.lrange(seckill_list_key, 0, 19)  # 最多 20 筆
-
-    seckill_records = []
-    for soid in seckill_order_ids:
-        skey = f"seckill:order:{soid}"
-        sod = r.hgetall(skey)
-        if not sod:
-            continue
-
-        pid = sod.get("product_id")
-        created_at = sod.get("created_at", "")
-
-        # 商品名稱
-        pinfo = r.hgetall(f"product:{pid}") if pid else {}
-        if pid:
-            pname = pinfo.get("name", f"商品 {pid}") if pinfo else f"商品 {pid}"
-        else:
-            pname = "商品"
-
-        seckill_records.append(
-            {
-                "order_id": soid,
-                "product_id": pid,
-                "product_name": pname,
-                "created_at": created_at,
-            }
-        )
-
-    # 讓最新的搶購紀錄排前面
-    seckill_records = list(reversed(seckill_records))
+    # 個人資料 + 這一頁的訂單 / 搶購紀錄（新到舊，三次往返讀完）
+    history = load_profile(
+        read_client(),
+        user_id,
+        orders_before=request.args.get("orders_before"),
+        seckill_before=request.args.get("seckill_before"),
+    )
 
     return render_template(
         "profile.html",
         title="個人檔案",
         subtitle="查看你的基本資料、歷史訂單與搶購紀錄",
         user_id=user_id,
-        user=user_info,
-        orders=orders,
-        seckill_records=seckill_records,
+        user=history["user"],
+        summary=history["summary"],
+        orders=history["orders"],
+        orders_total=history["orders_total"],
+        orders_next=history["orders_next"],
+        seckill_records=history["seckill_records"],
+        seckill_total=history["seckill_total"],
+        seckill_next=history["seckill_next"],
+        paged=bool(request.args.get("orders_before") or request.args.get("seckill_before")),
     )
 
 
@@ -462,7 +382,7 @@ def profile_edit():
     if resp:
         return resp
 
-    user_key = f"user:{user_id}"
+    user_key = schema.user(user_id)
 
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -474,7 +394,7 @@ def profile_edit():
             return redirect(url_for("profile_edit"))
 
         # 更新資料（保留原本的 created_at）
-        existing = r.hgetall(user_key) or {}
+        existing = get_user(r, user_id)
         created_at = existing.get("created_at")
 
         data = {
@@ -490,12 +410,13 @@ def profile_edit():
         data["updated_at"] = now_tw_iso()
 
         r.hset(user_key, mapping=data)
+        invalidate_user(r, user_id)
 
         flash("個人資料已更新。", "success")
         return redirect(url_for("profile"))
 
     # GET：顯示編輯表單
-    user_info = r.hgetall(user_key) or {}
+    user_info = get_user(r, user_id)
 
     return render_template(
         "profile_edit.html",
@@ -513,8 +434,9 @@ def order_detail(order_id):
     if resp:
         return resp
 
-    order_key = f"order:{order_id}"
-    od = r.hgetall(order_key)
+    reader = read_client()
+    order_key = schema.order(order_id)
+    od = unpack_order(reader.hgetall(order_key))
     if not od:
         flash("找不到這筆訂單。", "error")
         return redirect(url_for("profile"))
@@ -524,54 +446,12 @@ def order_detail(order_id):
         flash("你沒有權限查看這筆訂單。", "error")
         return redirect(url_for("profile"))
 
-    # 解析 items（pid -> qty）
-    items_json = od.get("items", "{}")
-    try:
-        items_dict = json.loads(items_json)
-    except json.JSONDecodeError:
-        items_dict = {}
-
-    items = []
-    items_total = 0
-    for pid, qty_str in items_dict.items():
-        try:
-            qty = int(qty_str)
-        except ValueError:
-            qty = 0
-
-        pinfo = r.hgetall(f"product:{pid}")
-        if not pinfo:
-            name = f"商品 {pid}"
-            price = 0
-        else:
-            name = pinfo.get("name", f"商品 {pid}")
-            try:
-                price = int(pinfo.get("price", 0))
-            except ValueError:
-                price = 0
-
-        subtotal = price * qty
-        items_total += subtotal
-
-        items.append(
-            {
-                "id": pid,
-                "name": name,
-                "price": price,
-                "qty": qty,
-                "subtotal": subtotal,
-            }
-        )
-
-    # 運費：跟 cart() 使用相同規則
-    if items_total == 0:
-        shipping_fee = 0
-    elif items_total >= SHIPPING_THRESHOLD:
-        shipping_fee = 0
-    else:
-        shipping_fee = SHIPPING_FEE
-
-    grand_total = items_total + shipping_fee
+    # 明細用結帳當下的商品快照（名稱 / 單價），不再回頭查商品
+    items = order_lines(od, reader)
+    summary = order_summary(od)
+    items_total = summary["items_total"]
+    shipping_fee = summary["shipping_fee"]
+    grand_total = summary["grand_total"]
 
     return render_template(
         "order_detail.html",
@@ -606,7 +486,7 @@ def products():
         return resp
 
     # 從 Redis 抓商品，依類別分組
-    products_by_category = get_products_by_category()
+    products_by_category = get_products_by_category(read_client())
     categories_order = list(products_by_category.keys())
 
     return render_template(
@@ -624,7 +504,7 @@ def add_to_cart():
     if resp:
         return resp
 
-    cart_key = f"cart:{user_id}"
+    cart_key = schema.cart(user_id)
 
     """從商品列表加入購物車，會依庫存限制最大可加入數量。"""
     pid = request.form.get("product_id")
@@ -643,13 +523,13 @@ def add_to_cart():
         qty = 1
 
     # 讀商品資訊與庫存
-    info = r.hgetall(f"product:{pid}")
+    info = get_product(r, pid)
     if not info:
         flash("找不到該商品。", "error")
         return redirect(url_for("products"))
 
     name = info.get("name", pid)
-    stock = int(r.get(f"stock:{pid}") or 0)
+    stock = get_stock(r, pid)
 
     # 已經在購物車裡的數量
     current_in_cart = int(r.hget(cart_key, pid) or 0)
@@ -683,7 +563,7 @@ def cart_update():
     if resp:
         return resp
 
-    cart_key = f"cart:{user_id}"
+    cart_key = schema.cart(user_id)
 
     """在購物車中更新某個商品的數量（0 代表移除）。"""
     pid = request.form.get("product_id")
@@ -694,12 +574,12 @@ def cart_update():
         return redirect(url_for("cart"))
 
     # 確認商品存在
-    info = r.hgetall(f"product:{pid}")
+    info = get_product(r, pid)
     if not info:
         flash("找不到該商品。", "error")
         return redirect(url_for("cart"))
     name = info.get("name", pid)
-    stock = int(r.get(f"stock:{pid}") or 0)
+    stock = get_stock(r, pid)
 
     # 把輸入的數量轉成整數
     try:
@@ -730,7 +610,7 @@ def cart_remove():
     if resp:
         return resp
 
-    cart_key = f"cart:{user_id}"
+    cart_key = schema.cart(user_id)
 
     """從購物車移除某個商品。"""
     pid = request.form.get("product_id")
@@ -738,63 +618,31 @@ def cart_remove():
         flash("商品資料有誤。", "error")
         return redirect(url_for("cart"))
 
-    name = r.hget(f"product:{pid}", "name") or pid
+    name = get_product(r, pid).get("name") or pid
     r.hdel(cart_key, pid)
     flash(f"已從購物車移除 {name}。", "success")
     return redirect(url_for("cart"))
 
 
-SHIPPING_THRESHOLD = 150  # 滿多少免運
-SHIPPING_FEE = 60  # 未滿門檻的運費
-
-
 @app.route("/cart")
 def cart():
     user_id, resp = require_user()
     if resp:
         return resp
 
-    cart_key = f"cart:{user_id}"
+    cart_key = schema.cart(user_id)
 
     """顯示購物車頁面。"""
-    cart_data = r.hgetall(cart_key)
+    reader = read_client()
+    cart_data = reader.hgetall(cart_key)
 
-    items = []
-    total = 0
-
-    for pid, qty_str in cart_data.items():
-        info = r.hgetall(f"product:{pid}")
-        if not info:
-            continue
-
-        price = int(info.get("price", 0))
-        qty = int(qty_str or 0)
-
-        stock = int(r.get(f"stock:{pid}") or 0)
-
-        subtotal = price * qty
-        total += subtotal
-
-        items.append(
-            {
-                "id": pid,
-                "name": info.get("name", ""),
-                "price": price,
-                "qty": qty,
-                "subtotal": subtotal,
-                "image": info.get("image", ""),
-                "stock": stock,
-            }
-        )
+    prefetch_products(reader, cart_data.keys())
+    infos = {pid: get_product(reader, pid) for pid in cart_data.keys()}
+    stocks = {pid: get_stock(reader, pid) for pid, info in infos.items() if info}
+    items, total = cart_lines(cart_data, infos, stocks)
 
     # 運費計算：滿 150 免運，未滿收 60；如果購物車是空的就不用運費
-    if total == 0:
-        shipping_fee = 0
-    elif total >= SHIPPING_THRESHOLD:
-        shipping_fee = 0
-    else:
-        shipping_fee = SHIPPING_FEE
-
+    shipping_fee = calc_shipping_fee(total)
     grand_total = total + shipping_fee
 
     return render_template(
@@ -804,119 +652,102 @@ def cart():
         shipping_fee=shipping_fee,
         grand_total=grand_total,
         SHIPPING_THRESHOLD=SHIPPING_THRESHOLD,
+        idem_token=new_idempotency_token(),
         title="購物車",
         subtitle="查看購物內容",
     )
 
 
-@app.route("/checkout", methods=["POST"])
-def checkout():
-    user_id, resp = require_user()
-    if resp:
-        return resp
-
-    cart_key = f"cart:{user_id}"
+def checkout_attempt(user_id: str):
+    """
+    執行一次結帳交易（WATCH 庫存 → MULTI 扣庫存、建訂單、清購物車）。
+    回傳 (flash 訊息, 類別)，讓 route 跟防重複送出共用同一份結果。
+    """
+    cart_key = schema.cart(user_id)
 
     cart_items = r.hgetall(cart_key)
     if not cart_items:
-        flash("購物車是空的，無法結帳。", "error")
-        return redirect(url_for("cart"))
+        return "購物車是空的，無法結帳。", "error"
 
-    # 直接在這裡重新計算總金額
-    total = 0
-    for pid, qty_str in cart_items.items():
-        info = r.hgetall(f"product:{pid}")
-        if not info:
-            continue
-        price = int(info.get("price", 0))
-        qty = int(qty_str or 0)
-        total += price * qty
+    # 直接在這裡重新計算總金額，順便留下商品名稱 / 單價當訂單快照
+    products = {}
+    prefetch_products(r, cart_items.keys(), with_stock=False)
+    for pid in cart_items.keys():
+        info = get_product(r, pid)
+        if info:
+            products[pid] = info
+    summary = build_order_summary(cart_items, products)
 
-    stock_keys = [f"stock:{pid}" for pid in cart_items.keys()]
+    stock_keys = [schema.stock(pid) for pid in cart_items.keys()]
 
     try:
-        with r.pipeline() as pipe:
+        with r.pipeline(transaction=True) as pipe:
             # 1) 監看庫存
             pipe.watch(*stock_keys)
 
-            # 2) 讀取目前庫存
+            # 2) 讀取目前庫存（WATCH 之後要讀最新值，不走 request 快取）
             current_stocks = {}
             for pid in cart_items.keys():
-                val = r.get(f"stock:{pid}")
+                val = r.get(schema.stock(pid))
                 current_stocks[pid] = int(val or 0)
 
             # 3) 檢查庫存是否足夠
-            shortage = []
-            for pid, qty_str in cart_items.items():
-                qty = int(qty_str)
-                if current_stocks[pid] < qty:
-                    shortage.append((pid, current_stocks[pid], qty))
+            shortage = find_shortage(cart_items, current_stocks)
             if shortage:
                 pipe.unwatch()
-                msg_lines = ["庫存不足，無法結帳："]
-                for pid, have, need in shortage:
-                    info = r.hgetall(f"product:{pid}")
-                    name = info.get("name", pid)
-                    msg_lines.append(f"{name} 需要 {need}，目前只有 {have}")
-                flash("；".join(msg_lines), "error")
-                return redirect(url_for("cart"))
-
-            # 4) 開始交易：扣庫存 + 建訂單 + 清空購物車
-            pipe.multi()
-
-            # 扣庫存
-            for pid, qty_str in cart_items.items():
-                qty = int(qty_str)
-                pipe.decrby(f"stock:{pid}", qty)
-
-            # 建訂單 id
-            order_id = now_tw_order_id()
-            order_key = f"order:{order_id}"
-
-            order_data = {
-                "user_id": user_id,
-                "items": json.dumps(cart_items),
-                "total": str(total),
-                "status": "已建立",
-                "created_at": now_tw_iso(),
-            }
+                return shortage_message(shortage, products), "error"
 
-            pipe.hset(order_key, mapping=order_data)
-            # 每個使用者自己的訂單列表
-            pipe.rpush(f"user:{user_id}:orders", order_id)
+            # 4) 開始交易：扣庫存 + 建訂單（統計 / 報表 / 索引 / 處理佇列一起）+ 清空購物車
+            pipe.multi()
+            order_id, order_data = new_order(user_id, summary)
+            queue_checkout(pipe, cart_items, order_id, order_data, products)
 
-            # 清空購物車
-            pipe.delete(cart_key)
+            # 使用者自己的訂單列表 + 清空購物車；cluster 模式下它們在使用者的 slot，
+            # 等扣庫存 / 建訂單的交易成功後再用另一個 MULTI 寫
+            user_pipe = r.pipeline(transaction=True) if CLUSTER else pipe
+            queue_user_checkout(user_pipe, user_id, order_id)
 
             pipe.execute()
-
-        # 交易成功後，丟進 queue，給 worker_orders.py 用（如果有開）
-        r.rpush("queue:orders", order_id)
+        if user_pipe is not pipe:
+            user_pipe.execute()
+        invalidate_stock(r, *cart_items.keys())
 
         # 發 Pub/Sub 訂單通知
-        notice = {
-            "type": "order_created",
-            "order_id": order_id,
-            "user_id": user_id,
-            "total": total,
-        }
-        r.publish("channel:orders", json.dumps(notice, ensure_ascii=False))
+        r.publish(ORDERS_CHANNEL, checkout_notice(order_id, order_data))
 
         # 將訂單事件寫入 Stream
-        r.xadd(
-            "stream:orders",
-            {
-                "order_id": order_id,
-                "user_id": user_id,
-                "total": str(total),
-                "status": "created",
-            },
-        )
+        r.xadd(schema.order_events_stream, checkout_event(order_id, order_data))
 
-        flash(f"結帳成功！訂單編號：{order_id}", "success")
+        return f"結帳成功！訂單編號：{order_id}", "success"
     except WatchError:
-        flash("結帳過程中庫存被修改，請再試一次。", "error")
+        return "結帳過程中庫存被修改，請再試一次。", "error"
+
 
+@app.route("/checkout", methods=["POST"])
+def checkout():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    # 同一個 token 重複送出（連點、瀏覽器重送）→ 直接回傳第一次的結果
+    token = request.form.get("idem_token", "").strip()
+    previous = idempotency_begin(user_id, token)
+    if previous is not None:
+        if previous.get("pending"):
+            flash("這筆結帳正在處理中，請稍候再重新整理。", "error")
+        else:
+            flash(previous["message"], previous["category"])
+        return redirect(url_for("cart"))
+
+    try:
+        message, category = checkout_attempt(user_id)
+    except Exception:
+        # 交易途中出錯（例如連線中斷）→ 放掉 token，讓使用者可以重試
+        idempotency_abort(user_id, token)
+        raise
+    idempotency_finish(user_id, token, {"message": message, "category": category})
+
+    flash(message, category)
     return redirect(url_for("cart"))
 
 
@@ -927,10 +758,11 @@ def seckill():
     if resp:
         return resp
 
-    events = get_seckill_status_list()
+    reader = read_client()
+    events = get_seckill_status_list(reader)
 
     # 撈出這個 user 的名字，畫面上可以顯示「目前登入：OOO」
-    user_info = r.hgetall(f"user:{user_id}") or {}
+    user_info = get_user(reader, user_id)
 
     return render_template(
         "seckill.html",
@@ -939,6 +771,7 @@ def seckill():
         events=events,
         user_id=user_id,
         user=user_info,
+        idem_token=new_idempotency_token(),
     )
 
 
@@ -961,16 +794,25 @@ def seckill_join():
         flash("目前不在該商品的搶購時間內，無法參加。", "error")
         return redirect(url_for("seckill"))
 
-    result = seckill_attempt(product_id, user_id)
+    # 重複送出同一張表單時，不再跑一次 WATCH，直接沿用第一次的結果
+    # （同一頁有多個活動表單，token 要跟商品綁在一起）
+    token = seckill_token(request.form.get("idem_token", "").strip(), product_id)
+    previous = idempotency_begin(user_id, token)
+    if previous is not None and previous.get("pending"):
+        flash("這次搶購正在處理中，請稍候再重新整理。", "error")
+        return redirect(url_for("seckill"))
 
-    if result == "ok":
-        flash("恭喜搶購成功！", "success")
-    elif result == "no_quota":
-        flash("名額已被搶光或同時競爭失敗，請再試試其他活動。", "error")
-    elif result == "already_success":
-        flash("你已經在本活動中搶購成功過一次囉。", "error")
+    if previous is not None:
+        result = previous.get("result")
     else:
-        flash("搶購時發生未知錯誤。", "error")
+        try:
+            result = seckill_attempt(product_id, user_id)
+        except Exception:
+            idempotency_abort(user_id, token)
+            raise
+        idempotency_finish(user_id, token, {"result": result})
+
+    flash(*seckill_message(result))
 
     return redirect(url_for("seckill"))
 
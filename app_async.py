@@ -0,0 +1,698 @@
+"""
+前台的 asyncio 版本：Quart（Flask 相容的 ASGI 框架）+ redis.asyncio。
+路由、模板、Redis 資料格式都跟 app.py 一樣，兩個可以並排跑、輪流切換。
+
+    hypercorn app_async:app --bind 0.0.0.0:5002 --workers 4
+
+跟同步版的差別：
+- 等 Redis 回應時 event loop 可以去處理別的 request，一個 worker 能同時服務很多連線
+- 一個 request 裡彼此獨立的讀取用 asyncio.gather 同時送出（例如搶購頁的活動狀態和使用者資料）
+- 同一種資料的批次讀取（所有商品 + 庫存）用一個 pipeline，一次往返
+
+session cookie 的格式和 secret key 跟 app.py 相同，同一個瀏覽器在兩邊都是登入狀態。
+跟 app.py 比較的 benchmark 見 bench_storefront_async.py。
+"""
+import asyncio
+import uuid
+
+from quart import Quart, flash, redirect, render_template, request, session, url_for
+from redis.exceptions import WatchError
+
+from config_redis import get_async_redis_client
+from key_schema import CLUSTER, key_id, schema
+from order_records import (
+    SHIPPING_THRESHOLD,
+    build_order_summary,
+    calc_shipping_fee,
+    order_line_pids,
+    order_lines,
+    order_summary,
+    unpack_order,
+)
+from stats_counters import record_user_created
+from storefront import (
+    IDEMPOTENCY_TTL,
+    ORDERS_CHANNEL,
+    SECKILL_CHANNEL,
+    SECRET_KEY,
+    cart_lines,
+    checkout_event,
+    checkout_notice,
+    find_shortage,
+    idempotency_result,
+    new_idempotency_token,
+    new_order,
+    new_seckill_order,
+    parse_idempotency_record,
+    parse_seckill_configs,
+    product_entry,
+    queue_checkout,
+    queue_seckill_order,
+    queue_user_checkout,
+    seckill_event,
+    seckill_is_open,
+    seckill_message,
+    seckill_notice,
+    seckill_status,
+    seckill_token,
+    shortage_message,
+)
+from tw_time import now_tw_iso
+from user_history import load_profile_async
+
+app = Quart(__name__)
+app.secret_key = SECRET_KEY  # 跟同步版共用 session cookie
+
+r = get_async_redis_client("web")
+
+
+def get_current_user_id():
+    return session.get("user_id")
+
+
+def require_user():
+    """跟 app.py 一樣：回傳 (user_id, None) 或 (None, 導去註冊頁)。"""
+    user_id = get_current_user_id()
+    if not user_id:
+        return None, redirect(url_for("profile_setup"))
+    return user_id, None
+
+
+async def idempotency_begin(user_id: str, token: str):
+    """同 app.idempotency_begin。"""
+    if not token:
+        return None
+
+    key = schema.idem(user_id, token)
+    if await r.set(key, "pending", nx=True, ex=IDEMPOTENCY_TTL):
+        return None
+
+    return parse_idempotency_record(await r.get(key))
+
+
+async def idempotency_finish(user_id: str, token: str, result: dict):
+    if not token:
+        return
+    await r.set(schema.idem(user_id, token), idempotency_result(result), ex=IDEMPOTENCY_TTL)
+
+
+async def idempotency_abort(user_id: str, token: str):
+    if token:
+        await r.delete(schema.idem(user_id, token))
+
+
+async def fetch_products(pids, with_stock: bool = True):
+    """一個 pipeline 讀這些商品的 hash（和庫存），回傳 ({pid: info}, {pid: stock})。"""
+    pids = list(pids)
+    if not pids:
+        return {}, {}
+    async with r.pipeline(transaction=False) as pipe:
+        for pid in pids:
+            pipe.hgetall(schema.product(pid))
+        if with_stock:
+            for pid in pids:
+                pipe.get(schema.stock(pid))
+        results = await pipe.execute()
+    infos = dict(zip(pids, results[: len(pids)]))
+    stocks = {pid: int(v or 0) for pid, v in zip(pids, results[len(pids):])}
+    return infos, stocks
+
+
+async def load_seckill_config():
+    """同 app.load_seckill_config：{pid: {'start': time, 'end': time}}，設定 hash 用一個 pipeline 讀。"""
+    keys = await r.keys(schema.seckill_event("*"))
+    if not keys:
+        return {}
+    async with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        cfgs = await pipe.execute()
+    return parse_seckill_configs(cfgs)
+
+
+async def get_products_by_category():
+    """同 app.get_products_by_category，所有商品和庫存一個 pipeline 讀完。"""
+    product_keys = await r.keys(schema.product("*"))
+    if not product_keys:
+        return {}
+
+    product_ids = sorted(key_id(k) for k in product_keys)
+    infos, stocks = await fetch_products(product_ids)
+    products_by_cat = {}
+
+    for pid in product_ids:
+        info = infos.get(pid)
+        if not info:
+            continue
+        product_data = product_entry(pid, info, stocks[pid])
+        if product_data:
+            products_by_cat.setdefault(product_data["category"], []).append(product_data)
+
+    return products_by_cat
+
+
+async def get_seckill_status_list(cfgs=None):
+    """同 app.get_seckill_status_list：所有活動的商品 / 剩餘名額 / 成功名單一個 pipeline 讀完。"""
+    if cfgs is None:
+        cfgs = await load_seckill_config()
+    pids = list(cfgs.keys())
+    if not pids:
+        return []
+
+    async with r.pipeline(transaction=False) as pipe:
+        for pid in pids:
+            pipe.hgetall(schema.product(pid))
+            pipe.get(schema.seckill_stock(pid))
+            pipe.smembers(schema.seckill_users(pid))
+        results = await pipe.execute()
+
+    events = []
+    for i, pid in enumerate(pids):
+        info, stock, users = results[3 * i: 3 * i + 3]
+        events.append(seckill_status(pid, cfgs[pid], info, stock, users))
+
+    events.sort(key=lambda e: e["product_id"])
+    return events
+
+
+async def seckill_attempt(product_id: str, user_id: str) -> str:
+    """同 app.seckill_attempt：回傳 "ok" / "no_quota" / "already_success"。"""
+    stock_key = schema.seckill_stock(product_id)
+    users_key = schema.seckill_users(product_id)
+
+    try:
+        async with r.pipeline(transaction=True) as pipe:
+            await pipe.watch(stock_key, users_key)
+
+            # WATCH 之後的讀取在同一條連線上立即執行，只能一個接一個
+            if int(await pipe.get(stock_key) or 0) <= 0:
+                await pipe.unwatch()
+                return "no_quota"
+            if await pipe.sismember(users_key, user_id):
+                await pipe.unwatch()
+                return "already_success"
+
+            pipe.multi()
+            pipe.decr(stock_key)
+            pipe.sadd(users_key, user_id)
+
+            order_id, order_data = new_seckill_order(product_id, user_id)
+            # cluster 模式：訂單 / 列表 / 報表在別的 slot，扣名額成功後再寫（同 app.seckill_attempt）
+            follow = r.pipeline(transaction=False) if CLUSTER else pipe
+            queue_seckill_order(follow, order_id, order_data)
+
+            await pipe.execute()
+        if follow is not pipe:
+            await follow.execute()
+    except WatchError:
+        return "no_quota"
+
+    # 交易成功後的通知：Pub/Sub 和 Stream 互不相干，同時送
+    await asyncio.gather(
+        r.publish(SECKILL_CHANNEL, seckill_notice(order_data)),
+        r.xadd(schema.seckill_events_stream, seckill_event(order_id, order_data)),
+    )
+    return "ok"
+
+
+# ================== 使用者 ==================
+
+@app.route("/profile/setup", methods=["GET", "POST"])
+async def profile_setup():
+    if request.method == "GET" and get_current_user_id():
+        return redirect(url_for("products"))
+
+    if request.method == "POST":
+        form = await request.form
+        name = form.get("name", "").strip()
+        phone = form.get("phone", "").strip()
+        address = form.get("address", "").strip()
+
+        if not name or not phone or not address:
+            await flash("請完整填寫姓名、電話與地址。", "error")
+            return redirect(url_for("profile_setup"))
+
+        user_id = "u_" + uuid.uuid4().hex[:8]
+        session["user_id"] = user_id
+
+        async with r.pipeline(transaction=not CLUSTER) as pipe:
+            pipe.hset(
+                schema.user(user_id),
+                mapping={
+                    "name": name,
+                    "phone": phone,
+                    "address": address,
+                    "created_at": now_tw_iso(),
+                },
+            )
+            record_user_created(pipe)
+            await pipe.execute()
+
+        await flash("個人檔案建立完成，歡迎來逛逛～", "success")
+        return redirect(url_for("products"))
+
+    return await render_template(
+        "profile_setup.html",
+        title="🍬歡迎來到甜蜜魔法零食小舖🛒",
+        subtitle="購買專屬你的療癒魔法！🪄✨",
+    )
+
+
+@app.route("/login", methods=["POST"])
+async def login():
+    form = await request.form
+    user_id = form.get("user_id", "").strip()
+
+    if not user_id:
+        await flash("請輸入 user id。", "error")
+        return redirect(url_for("profile_setup"))
+
+    if not await r.exists(schema.user(user_id)):
+        await flash("找不到這個 user id，請確認是否輸入正確。", "error")
+        return redirect(url_for("profile_setup"))
+
+    session["user_id"] = user_id
+    await flash("登入成功！", "success")
+    return redirect(url_for("products"))
+
+
+@app.route("/profile")
+async def profile():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    history = await load_profile_async(
+        r,
+        user_id,
+        orders_before=request.args.get("orders_before"),
+        seckill_before=request.args.get("seckill_before"),
+    )
+
+    return await render_template(
+        "profile.html",
+        title="個人檔案",
+        subtitle="查看你的基本資料、歷史訂單與搶購紀錄",
+        user_id=user_id,
+        user=history["user"],
+        summary=history["summary"],
+        orders=history["orders"],
+        orders_total=history["orders_total"],
+        orders_next=history["orders_next"],
+        seckill_records=history["seckill_records"],
+        seckill_total=history["seckill_total"],
+        seckill_next=history["seckill_next"],
+        paged=bool(request.args.get("orders_before") or request.args.get("seckill_before")),
+    )
+
+
+@app.route("/profile/edit", methods=["GET", "POST"])
+async def profile_edit():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    user_key = schema.user(user_id)
+
+    if request.method == "POST":
+        form = await request.form
+        name = form.get("name", "").strip()
+        phone = form.get("phone", "").strip()
+        address = form.get("address", "").strip()
+
+        if not name:
+            await flash("姓名不能空白。", "error")
+            return redirect(url_for("profile_edit"))
+
+        # 保留原本的 created_at
+        created_at = await r.hget(user_key, "created_at")
+        now = now_tw_iso()
+        await r.hset(
+            user_key,
+            mapping={
+                "name": name,
+                "phone": phone,
+                "address": address,
+                "created_at": created_at or now,
+                "updated_at": now,
+            },
+        )
+
+        await flash("個人資料已更新。", "success")
+        return redirect(url_for("profile"))
+
+    return await render_template(
+        "profile_edit.html",
+        title="編輯個人檔案",
+        subtitle="更新你的聯絡資訊與收件地址",
+        user_id=user_id,
+        user=await r.hgetall(user_key) or {},
+    )
+
+
+@app.route("/orders/<order_id>")
+async def order_detail(order_id):
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    od = unpack_order(await r.hgetall(schema.order(order_id)))
+    if not od:
+        await flash("找不到這筆訂單。", "error")
+        return redirect(url_for("profile"))
+
+    if od.get("user_id") != user_id:
+        await flash("你沒有權限查看這筆訂單。", "error")
+        return redirect(url_for("profile"))
+
+    # 有商品快照就不用查；沒有快照的舊訂單才補讀商品
+    legacy_pids = order_line_pids(od)
+    products = (await fetch_products(legacy_pids, with_stock=False))[0] if legacy_pids else None
+    items = order_lines(od, products=products)
+    summary = order_summary(od)
+
+    return await render_template(
+        "order_detail.html",
+        title=f"訂單明細 #{order_id}",
+        subtitle="查看此訂單的商品內容",
+        order_id=order_id,
+        order=od,
+        items=items,
+        items_total=summary["items_total"],
+        shipping_fee=summary["shipping_fee"],
+        grand_total=summary["grand_total"],
+    )
+
+
+@app.route("/logout")
+async def logout():
+    session.pop("user_id", None)
+    await flash("已登出。", "success")
+    return redirect(url_for("profile_setup"))
+
+
+# ================== 商品 / 購物車 ==================
+
+@app.route("/")
+async def index():
+    if get_current_user_id():
+        return redirect(url_for("products"))
+    return redirect(url_for("profile_setup"))
+
+
+@app.route("/products")
+async def products():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    products_by_category = await get_products_by_category()
+
+    return await render_template(
+        "products.html",
+        products_by_category=products_by_category,
+        categories_order=list(products_by_category.keys()),
+        title="商品列表",
+        subtitle="依商品分類顯示",
+    )
+
+
+@app.route("/add_to_cart", methods=["POST"])
+async def add_to_cart():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    cart_key = schema.cart(user_id)
+    form = await request.form
+    pid = form.get("product_id")
+
+    if not pid:
+        await flash("商品資料有誤，請重新操作。", "error")
+        return redirect(url_for("products"))
+
+    try:
+        qty = int(form.get("qty", "1"))
+    except ValueError:
+        qty = 1
+    if qty <= 0:
+        qty = 1
+
+    # 商品、庫存、購物車裡已有的數量互不相依，同時讀
+    info, stock, current_in_cart = await asyncio.gather(
+        r.hgetall(schema.product(pid)),
+        r.get(schema.stock(pid)),
+        r.hget(cart_key, pid),
+    )
+    if not info:
+        await flash("找不到該商品。", "error")
+        return redirect(url_for("products"))
+
+    name = info.get("name", pid)
+    stock = int(stock or 0)
+    current_in_cart = int(current_in_cart or 0)
+    max_can_add = stock - current_in_cart
+
+    if max_can_add <= 0:
+        await flash(f"{name} 庫存只剩 {stock}，購物車裡已經放到上限。", "error")
+        return redirect(url_for("cart"))
+
+    if qty > max_can_add:
+        qty = max_can_add
+        await flash(
+            f"{name} 庫存剩 {stock}，購物車已有 {current_in_cart} 件，"
+            f"最多再加 {max_can_add} 件，已自動幫你調整。",
+            "error",
+        )
+
+    await r.hincrby(cart_key, pid, qty)
+    await flash(f"已將 {name} x {qty} 加入購物車。", "success")
+    return redirect(url_for("cart"))
+
+
+@app.route("/cart/update", methods=["POST"])
+async def cart_update():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    cart_key = schema.cart(user_id)
+    form = await request.form
+    pid = form.get("product_id")
+
+    if not pid:
+        await flash("商品資料有誤。", "error")
+        return redirect(url_for("cart"))
+
+    info, stock = await asyncio.gather(r.hgetall(schema.product(pid)), r.get(schema.stock(pid)))
+    if not info:
+        await flash("找不到該商品。", "error")
+        return redirect(url_for("cart"))
+    name = info.get("name", pid)
+    stock = int(stock or 0)
+
+    try:
+        qty = int(form.get("qty", "1"))
+    except ValueError:
+        qty = 1
+
+    if qty <= 0:
+        await r.hdel(cart_key, pid)
+        await flash(f"已從購物車移除 {name}。", "success")
+        return redirect(url_for("cart"))
+
+    if qty > stock:
+        qty = stock
+        await flash(f"{name} 庫存只有 {stock} 件，已幫你調整數量。", "error")
+
+    await r.hset(cart_key, pid, qty)
+    await flash(f"已更新 {name} 數量為 {qty}。", "success")
+    return redirect(url_for("cart"))
+
+
+@app.route("/cart/remove", methods=["POST"])
+async def cart_remove():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    form = await request.form
+    pid = form.get("product_id")
+    if not pid:
+        await flash("商品資料有誤。", "error")
+        return redirect(url_for("cart"))
+
+    name, _ = await asyncio.gather(
+        r.hget(schema.product(pid), "name"),
+        r.hdel(schema.cart(user_id), pid),
+    )
+    await flash(f"已從購物車移除 {name or pid}。", "success")
+    return redirect(url_for("cart"))
+
+
+@app.route("/cart")
+async def cart():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    cart_data = await r.hgetall(schema.cart(user_id))
+    infos, stocks = await fetch_products(cart_data.keys())
+    items, total = cart_lines(cart_data, infos, stocks)
+    shipping_fee = calc_shipping_fee(total)
+
+    return await render_template(
+        "cart.html",
+        items=items,
+        total=total,
+        shipping_fee=shipping_fee,
+        grand_total=total + shipping_fee,
+        SHIPPING_THRESHOLD=SHIPPING_THRESHOLD,
+        idem_token=new_idempotency_token(),
+        title="購物車",
+        subtitle="查看購物內容",
+    )
+
+
+async def checkout_attempt(user_id: str):
+    """同 app.checkout_attempt：WATCH 庫存 → MULTI 扣庫存、建訂單、清購物車。"""
+    cart_key = schema.cart(user_id)
+
+    cart_items = await r.hgetall(cart_key)
+    if not cart_items:
+        return "購物車是空的，無法結帳。", "error"
+
+    infos, _ = await fetch_products(cart_items.keys(), with_stock=False)
+    products = {pid: info for pid, info in infos.items() if info}
+    summary = build_order_summary(cart_items, products)
+
+    pids = list(cart_items.keys())
+    stock_keys = [schema.stock(pid) for pid in pids]
+
+    try:
+        async with r.pipeline(transaction=True) as pipe:
+            await pipe.watch(*stock_keys)
+
+            # WATCH 之後一次 MGET 讀所有庫存（同步版是一個一個 GET）
+            current_stocks = {pid: int(v or 0) for pid, v in zip(pids, await pipe.mget(stock_keys))}
+
+            shortage = find_shortage(cart_items, current_stocks)
+            if shortage:
+                await pipe.unwatch()
+                return shortage_message(shortage, products), "error"
+
+            pipe.multi()
+            order_id, order_data = new_order(user_id, summary)
+            queue_checkout(pipe, cart_items, order_id, order_data, products)
+
+            # cluster 模式：使用者的訂單列表 / 購物車在另一個 slot，交易成功後再寫（同 app.checkout_attempt）
+            user_pipe = r.pipeline(transaction=True) if CLUSTER else pipe
+            queue_user_checkout(user_pipe, user_id, order_id)
+
+            await pipe.execute()
+        if user_pipe is not pipe:
+            await user_pipe.execute()
+    except WatchError:
+        return "結帳過程中庫存被修改，請再試一次。", "error"
+
+    await asyncio.gather(
+        r.publish(ORDERS_CHANNEL, checkout_notice(order_id, order_data)),
+        r.xadd(schema.order_events_stream, checkout_event(order_id, order_data)),
+    )
+    return f"結帳成功！訂單編號：{order_id}", "success"
+
+
+@app.route("/checkout", methods=["POST"])
+async def checkout():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    form = await request.form
+    token = form.get("idem_token", "").strip()
+    previous = await idempotency_begin(user_id, token)
+    if previous is not None:
+        if previous.get("pending"):
+            await flash("這筆結帳正在處理中，請稍候再重新整理。", "error")
+        else:
+            await flash(previous["message"], previous["category"])
+        return redirect(url_for("cart"))
+
+    try:
+        message, category = await checkout_attempt(user_id)
+    except Exception:
+        await idempotency_abort(user_id, token)
+        raise
+    await idempotency_finish(user_id, token, {"message": message, "category": category})
+
+    await flash(message, category)
+    return redirect(url_for("cart"))
+
+
+# ================== 搶購 ==================
+
+@app.route("/seckill")
+async def seckill():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    # 活動狀態和使用者名稱互不相依，同時讀
+    events, user_info = await asyncio.gather(
+        get_seckill_status_list(),
+        r.hgetall(schema.user(user_id)),
+    )
+
+    return await render_template(
+        "seckill.html",
+        title="限量搶購活動",
+        subtitle="不同商品有不同搶購時段",
+        events=events,
+        user_id=user_id,
+        user=user_info or {},
+        idem_token=new_idempotency_token(),
+    )
+
+
+@app.route("/seckill/join", methods=["POST"])
+async def seckill_join():
+    user_id, resp = require_user()
+    if resp:
+        return resp
+
+    form = await request.form
+    product_id = form.get("product_id")
+
+    cfgs = await load_seckill_config()
+    if not product_id or product_id not in cfgs:
+        await flash("搶購活動商品資料有誤。", "error")
+        return redirect(url_for("seckill"))
+
+    if not seckill_is_open(cfgs[product_id]):
+        await flash("目前不在該商品的搶購時間內，無法參加。", "error")
+        return redirect(url_for("seckill"))
+
+    token = seckill_token(form.get("idem_token", "").strip(), product_id)
+    previous = await idempotency_begin(user_id, token)
+    if previous is not None and previous.get("pending"):
+        await flash("這次搶購正在處理中，請稍候再重新整理。", "error")
+        return redirect(url_for("seckill"))
+
+    if previous is not None:
+        result = previous.get("result")
+    else:
+        try:
+            result = await seckill_attempt(product_id, user_id)
+        except Exception:
+            await idempotency_abort(user_id, token)
+            raise
+        await idempotency_finish(user_id, token, {"result": result})
+
+    await flash(*seckill_message(result))
+
+    return redirect(url_for("seckill"))
+
+
+if __name__ == "__main__":
+    # 開發用；正式環境用 hypercorn（見最上面）
+    app.run(port=5002, debug=True)
@@ -0,0 +1,64 @@
+"""
+把既有的 order:* 補進後台用的訂單索引：
+    orders:by_time / orders:status:{status}
+時間直接從訂單編號算；狀態每批用一個 pipeline HGET。
+用 SCAN 分批，不會卡住 Redis，重複執行也沒關係。
+舊版還有 orders:day:{YYYY-MM-DD}（日期篩選現在直接用 orders:by_time 的 score 範圍），順便刪掉。
+"""
+from config_redis import get_redis_client
+from key_schema import key_id, schema
+from order_index import ORDERS_BY_TIME, order_score, status_key
+
+r = get_redis_client()
+
+BATCH_SIZE = 500
+
+
+def index_batch(order_ids):
+    with r.pipeline(transaction=False) as pipe:
+        for oid in order_ids:
+            pipe.hget(schema.order(oid), "status")
+        statuses = pipe.execute()
+
+    with r.pipeline(transaction=False) as pipe:
+        for oid, status in zip(order_ids, statuses):
+            score = order_score(oid)
+            pipe.zadd(ORDERS_BY_TIME, {oid: score})
+            pipe.zadd(status_key(status or "created"), {oid: score})
+        pipe.execute()
+
+
+def drop_day_sets() -> int:
+    """刪掉舊版的 orders:day:*（沒有 TTL、也沒人讀了），回傳刪了幾個。"""
+    dropped = 0
+    batch = []
+    for key in r.scan_iter(schema.shop("orders:day:*"), count=BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= BATCH_SIZE:
+            dropped += r.unlink(*batch)
+            batch = []
+    if batch:
+        dropped += r.unlink(*batch)
+    return dropped
+
+
+def main():
+    print(f"開始補齊 {ORDERS_BY_TIME} / orders:status:* ...")
+    done = 0
+    batch = []
+    for key in r.scan_iter(schema.order("*"), count=BATCH_SIZE):
+        batch.append(key_id(key))
+        if len(batch) >= BATCH_SIZE:
+            index_batch(batch)
+            done += len(batch)
+            batch = []
+    if batch:
+        index_batch(batch)
+        done += len(batch)
+
+    print(f"完成！共 {done} 筆訂單，索引目前有 {r.zcard(ORDERS_BY_TIME)} 筆。")
+    print(f"刪掉舊的 orders:day:* {drop_day_sets()} 個。")
+
+
+if __name__ == "__main__":
+    main()
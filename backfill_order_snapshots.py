@@ -0,0 +1,78 @@
+import json
+
+from config_redis import get_redis_client
+from key_schema import schema
+from order_records import build_order_summary, calc_shipping_fee, has_summary, unpack_order
+
+r = get_redis_client()
+
+BATCH_SIZE = 200
+
+
+def backfill_batch(order_keys):
+    """把一批舊訂單補上 lines / items_count / shipping_fee / grand_total。"""
+    with r.pipeline(transaction=False) as pipe:
+        for key in order_keys:
+            pipe.hgetall(key)
+        orders = [unpack_order(h) for h in pipe.execute()]
+
+    todo = []
+    pids = set()
+    for key, od in zip(order_keys, orders):
+        if not od or has_summary(od):
+            continue
+        try:
+            items = json.loads(od.get("items", "{}") or "{}")
+        except json.JSONDecodeError:
+            items = {}
+        todo.append((key, od, items))
+        pids.update(items.keys())
+
+    if not todo:
+        return 0
+
+    # 舊訂單沒有價格快照，只能用目前的商品資料補（一次 pipeline 撈完）
+    pids = sorted(pids)
+    with r.pipeline(transaction=False) as pipe:
+        for pid in pids:
+            pipe.hgetall(schema.product(pid))
+        products = {pid: info for pid, info in zip(pids, pipe.execute()) if info}
+
+    with r.pipeline(transaction=False) as pipe:
+        for key, od, items in todo:
+            summary = build_order_summary(items, products)
+            # 保留原本結帳時存的 total，運費 / 應付金額以它為準
+            items_total = int(od.get("total") or summary["total"])
+            shipping_fee = calc_shipping_fee(items_total)
+
+            pipe.hset(
+                key,
+                mapping={
+                    "lines": summary["lines"],
+                    "items_count": summary["items_count"],
+                    "shipping_fee": str(shipping_fee),
+                    "grand_total": str(items_total + shipping_fee),
+                },
+            )
+        pipe.execute()
+
+    return len(todo)
+
+
+def main():
+    print("開始補齊舊訂單的商品快照 ...")
+    done = 0
+    batch = []
+    for key in r.scan_iter(schema.order("*"), count=BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= BATCH_SIZE:
+            done += backfill_batch(batch)
+            batch = []
+    if batch:
+        done += backfill_batch(batch)
+
+    print(f"完成！共補齊 {done} 筆訂單。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+從既有的 order:* / seckill:order:* 重算銷售報表的彙總（sales:*）。
+
+用 SCAN 分批讀訂單（每批一個 pipeline），在記憶體裡只累加每天 / 分類 / 商品的數字，
+最後一個交易換掉舊的彙總。第一次上線或數字跑掉時執行一次即可；
+重算期間如果還有新訂單進來，可能有幾筆誤差，離峰時執行最準。
+"""
+from collections import Counter, defaultdict
+
+from config_redis import get_redis_client
+from key_schema import schema
+from order_records import order_lines, order_summary, unpack_order, unpack_seckill_order
+from sales_analytics import (
+    PRODUCT_REVENUE_KEY,
+    PRODUCT_UNITS_KEY,
+    SECKILL_CATEGORY,
+    day_category_key,
+    day_sales_key,
+)
+
+r = get_redis_client()
+
+SCAN_COUNT = 500
+
+per_day = defaultdict(Counter)  # day -> orders / revenue / ...
+per_category = defaultdict(Counter)  # day -> rev:{分類} / qty:{分類}
+product_units = Counter()
+product_revenue = Counter()
+categories = {}  # pid -> 分類（快取）
+
+
+def load_categories(pids):
+    missing = [pid for pid in set(pids) if pid not in categories]
+    if not missing:
+        return
+    with r.pipeline(transaction=False) as pipe:
+        for pid in missing:
+            pipe.hget(schema.product(pid), "category")
+        for pid, category in zip(missing, pipe.execute()):
+            categories[pid] = category or "未分類"
+
+
+def add_orders(orders):
+    batch_lines = [(od, order_lines(od, r)) for od in orders]
+    load_categories(line["id"] for _, lines in batch_lines for line in lines)
+
+    for od, lines in batch_lines:
+        day = (od.get("created_at") or "")[:10]
+        if not day:
+            continue
+        summary = order_summary(od)
+        d = per_day[day]
+        d["orders"] += 1
+        d["revenue"] += summary["grand_total"]
+        d["items_revenue"] += summary["items_total"]
+        d["shipping"] += summary["shipping_fee"]
+        for line in lines:
+            pid, qty, subtotal = line["id"], int(line["qty"]), int(line["subtotal"])
+            category = categories.get(pid, "未分類")
+            d["units"] += qty
+            per_category[day][f"rev:{category}"] += subtotal
+            per_category[day][f"qty:{category}"] += qty
+            product_units[pid] += qty
+            product_revenue[pid] += subtotal
+
+
+def add_seckill_orders(orders):
+    for od in orders:
+        day = (od.get("created_at") or "")[:10]
+        pid = od.get("product_id")
+        if not day or not pid:
+            continue
+        per_day[day]["seckill"] += 1
+        per_day[day]["units"] += 1
+        per_category[day][f"qty:{SECKILL_CATEGORY}"] += 1
+        product_units[pid] += 1
+
+
+def scan(pattern, unpack, handle, keep=None):
+    total = 0
+
+    def flush(keys):
+        nonlocal total
+        with r.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            rows = [unpack(h) for h in pipe.execute() if h]
+        handle(rows)
+        total += len(rows)
+
+    batch = []
+    for key in r.scan_iter(pattern, count=SCAN_COUNT):
+        if keep is not None and not keep(key):
+            continue
+        batch.append(key)
+        if len(batch) >= SCAN_COUNT:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return total
+
+
+def main():
+    print("重新計算銷售報表彙總 ...")
+
+    order_count = scan(schema.order("*"), unpack_order, add_orders)
+    # seckill:order:{id} 是訂單本身，seckill:orders 之類的清單不算
+    colons = schema.seckill_order("*").count(":")
+    seckill_count = scan(
+        schema.seckill_order("*"), unpack_seckill_order, add_seckill_orders, keep=lambda k: k.count(":") == colons
+    )
+
+    old_keys = list(r.scan_iter("sales:*", count=SCAN_COUNT))
+
+    with r.pipeline() as pipe:
+        if old_keys:
+            pipe.delete(*old_keys)
+        for day, counts in per_day.items():
+            pipe.hset(day_sales_key(day), mapping=dict(counts))
+        for day, counts in per_category.items():
+            pipe.hset(day_category_key(day), mapping=dict(counts))
+        if product_units:
+            pipe.zadd(PRODUCT_UNITS_KEY, dict(product_units))
+        if product_revenue:
+            pipe.zadd(PRODUCT_REVENUE_KEY, dict(product_revenue))
+        pipe.execute()
+
+    print(
+        f"訂單 {order_count} 筆、搶購 {seckill_count} 筆，"
+        f"共 {len(per_day)} 天、{len(product_units)} 項商品"
+    )
+
+
+if __name__ == "__main__":
+    main()
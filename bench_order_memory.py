@@ -0,0 +1,136 @@
+"""
+訂單記憶體用量報告：同一批模擬訂單分別用「一般 hash」和「精簡格式」寫入，
+比較每筆訂單佔用的 byte 數。
+
+    python bench_order_memory.py --count 1000000
+
+資料寫在 bench:* 底下，跑完會自動刪掉。
+"""
+import argparse
+import json
+import random
+import time
+
+from config_redis import get_redis_client
+from order_records import (
+    build_order_summary,
+    pack_order,
+    pack_seckill_order,
+)
+
+r = get_redis_client()
+
+PIPE_SIZE = 1000
+SAMPLE_SIZE = 1000
+
+
+def fake_products(n=40):
+    return {
+        str(2001 + i): {"name": f"測試零食 {i:02d}", "price": str(random.randint(15, 150))}
+        for i in range(n)
+    }
+
+
+def fake_order(i, products):
+    pids = random.sample(list(products.keys()), random.randint(1, 5))
+    cart = {pid: str(random.randint(1, 4)) for pid in pids}
+    return {
+        "user_id": f"u_{i % 50000:08x}",
+        **build_order_summary(cart, products),
+        "status": "已建立",
+        "created_at": "2025-12-09T21:30:00",
+    }
+
+
+def fake_seckill_order(i):
+    return {
+        "product_id": str(2991 + i % 2),
+        "user_id": f"u_{i:08x}",
+        "created_at": "2025-12-09T21:30:00",
+    }
+
+
+def used_memory():
+    return int(r.info("memory")["used_memory"])
+
+
+def write_dataset(prefix, count, make, encode):
+    before = used_memory()
+    start = time.perf_counter()
+    with r.pipeline(transaction=False) as pipe:
+        for i in range(count):
+            pipe.hset(f"{prefix}{i}", mapping=encode(make(i)))
+            if (i + 1) % PIPE_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+    elapsed = time.perf_counter() - start
+    after = used_memory()
+
+    # MEMORY USAGE 抽樣，跟 used_memory 差值互相對照
+    sample_ids = random.sample(range(count), min(SAMPLE_SIZE, count))
+    with r.pipeline(transaction=False) as pipe:
+        for i in sample_ids:
+            pipe.memory_usage(f"{prefix}{i}", samples=0)
+        sampled = [x or 0 for x in pipe.execute()]
+
+    return {
+        "bytes_per_record": (after - before) / count,
+        "memory_usage_avg": sum(sampled) / len(sampled),
+        "write_seconds": elapsed,
+    }
+
+
+def cleanup(prefix):
+    batch = []
+    for key in r.scan_iter(f"{prefix}*", count=PIPE_SIZE):
+        batch.append(key)
+        if len(batch) >= PIPE_SIZE:
+            r.unlink(*batch)
+            batch = []
+    if batch:
+        r.unlink(*batch)
+
+
+def run(label, prefix, count, make, encode):
+    try:
+        stats = write_dataset(prefix, count, make, encode)
+    finally:
+        cleanup(prefix)
+    print(
+        f"{label:<22} {stats['bytes_per_record']:>10.1f} B/筆 "
+        f"(MEMORY USAGE 抽樣 {stats['memory_usage_avg']:.1f} B) "
+        f"寫入 {stats['write_seconds']:.1f}s"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較訂單紀錄的記憶體用量")
+    parser.add_argument("--count", type=int, default=1_000_000, help="模擬訂單筆數")
+    args = parser.parse_args()
+
+    random.seed(42)
+    products = fake_products()
+    # 固定同一組訂單內容，兩種格式才有可比性
+    orders = [fake_order(i, products) for i in range(min(args.count, 10000))]
+
+    def make_order(i):
+        return orders[i % len(orders)]
+
+    print(f"=== 訂單記憶體報告（{args.count} 筆）===")
+    plain = run("order 一般 hash", "bench:plain:order:", args.count, make_order, dict)
+    packed = run("order 精簡格式", "bench:packed:order:", args.count, make_order, pack_order)
+    print(f"→ 每筆節省 {plain['bytes_per_record'] - packed['bytes_per_record']:.1f} B "
+          f"({1 - packed['bytes_per_record'] / plain['bytes_per_record']:.0%})")
+
+    print(f"\n=== 搶購訂單記憶體報告（{args.count} 筆）===")
+    plain = run("seckill 一般 hash", "bench:plain:sk:", args.count, fake_seckill_order, dict)
+    packed = run("seckill 精簡格式", "bench:packed:sk:", args.count, fake_seckill_order, pack_seckill_order)
+    print(f"→ 每筆節省 {plain['bytes_per_record'] - packed['bytes_per_record']:.1f} B "
+          f"({1 - packed['bytes_per_record'] / plain['bytes_per_record']:.0%})")
+
+    print("\n（範例訂單內容：", json.dumps(orders[0], ensure_ascii=False)[:120], "...）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+訂單 worker 吞吐量測試：先塞一批積壓的訂單，再比較
+  - 逐筆模式：LPOP + HGETALL + HSET（每筆 3 次往返）
+  - 批次模式：LMPOP + pipeline HGETALL + pipeline HSET（每批 3 次往返）
+
+    python bench_order_worker.py --count 20000 --batch-sizes 10 50 200 500
+
+副作用（寄信）在測試時關掉，只量 Redis 往返的成本。
+測試資料寫在 order:bench* 和 bench:queue:orders，跑完會刪掉。
+"""
+import argparse
+import time
+
+import worker_orders
+from key_schema import schema
+from order_records import build_order_summary, pack_order
+
+r = worker_orders.r
+
+BENCH_QUEUE = "bench:queue:orders"
+PIPE_SIZE = 1000
+
+
+def seed_backlog(count: int):
+    products = {"2001": {"name": "海苔洋芋片", "price": "20"}, "2101": {"name": "紫菜蘇打餅乾", "price": "49"}}
+    order_ids = [f"bench{i:08d}" for i in range(count)]
+    with r.pipeline(transaction=False) as pipe:
+        for i, order_id in enumerate(order_ids):
+            order = {
+                "user_id": "u_bench",
+                **build_order_summary({"2001": "2", "2101": "1"}, products),
+                "status": "已建立",
+                "created_at": "2025-12-09T21:30:00",
+            }
+            pipe.hset(schema.order(order_id), mapping=pack_order(order))
+            if (i + 1) % PIPE_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+
+    r.delete(BENCH_QUEUE)
+    for start in range(0, count, PIPE_SIZE):
+        r.rpush(BENCH_QUEUE, *order_ids[start:start + PIPE_SIZE])
+    return order_ids
+
+
+def cleanup(order_ids):
+    for start in range(0, len(order_ids), PIPE_SIZE):
+        r.unlink(*[schema.order(oid) for oid in order_ids[start:start + PIPE_SIZE]])
+    r.delete(BENCH_QUEUE)
+
+
+def run_single():
+    done = 0
+    while True:
+        order_id = r.lpop(BENCH_QUEUE)
+        if order_id is None:
+            return done
+        order = r.hgetall(schema.order(order_id))
+        if order:
+            r.hset(schema.order(order_id), mapping=worker_orders.processed_fields())
+        done += 1
+
+
+def run_batch(batch_size: int, adaptive: bool):
+    done = 0
+    while True:
+        size = batch_size
+        if adaptive:
+            size = worker_orders.adaptive_batch_size(int(r.llen(BENCH_QUEUE) or 0), batch_size)
+        item = r.lmpop(1, BENCH_QUEUE, direction="LEFT", count=size)
+        if not item:
+            return done
+        _, order_ids = item
+        ok, _ = worker_orders.process_order_batch(order_ids)
+        done += ok
+
+
+def measure(label, count, fn):
+    order_ids = seed_backlog(count)
+    try:
+        started = time.perf_counter()
+        done = fn()
+        elapsed = time.perf_counter() - started
+    finally:
+        cleanup(order_ids)
+    print(f"{label:<26} {done:>8} 筆  {elapsed:>7.2f}s  {done / elapsed:>9.0f} 筆/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訂單 worker 吞吐量測試")
+    parser.add_argument("--count", type=int, default=20000, help="積壓的訂單筆數")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    args = parser.parse_args()
+
+    worker_orders.SIDE_EFFECT_SECONDS = 0
+
+    print(f"=== 訂單 worker 吞吐量（積壓 {args.count} 筆，不含副作用）===")
+    measure("逐筆 LPOP", args.count, run_single)
+    for size in args.batch_sizes:
+        measure(f"批次 LMPOP x{size}", args.count, lambda: run_batch(size, adaptive=False))
+    max_size = max(args.batch_sizes)
+    measure(f"自動調整批次（上限 {max_size}）", args.count, lambda: run_batch(max_size, adaptive=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+前台同步版（app.py）和 asyncio 版（app_async.py）並排壓測：同樣的頁面、同樣的 worker 數，
+在不同並發數下比較每秒請求數與延遲。
+
+先把兩個版本用相同的 worker 數開起來（連同一台 Redis），例如：
+
+    gunicorn -w 4 -b 127.0.0.1:5000 app:app
+    hypercorn -w 4 -b 127.0.0.1:5002 app_async:app
+
+    python bench_storefront_async.py --concurrency 1 8 32 128 --duration 15
+
+每個目標會先註冊一個測試使用者、在購物車放幾樣商品，之後每個並發連線輪流 GET --paths 的頁面
+（keep-alive，只讀不寫）。測試使用者的資料留在 Redis 裡（u_ 開頭的一般使用者）。
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PATHS = ["/products", "/cart", "/seckill", "/profile"]
+CART_PRODUCTS = ["2001", "2101", "2201"]
+
+
+class Target:
+    def __init__(self, name: str, url: str):
+        parts = urlsplit(url)
+        self.name = name
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.cookie = ""
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def _request(self, conn, method, path, body=None):
+        headers = {"Cookie": self.cookie} if self.cookie else {}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            body = urlencode(body)
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        cookie = resp.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return resp.status
+
+    def login(self):
+        """註冊一個測試使用者並放幾樣商品進購物車，讓購物車頁有東西可以算。"""
+        conn = self.connect()
+        try:
+            self._request(conn, "POST", "/profile/setup", {"name": "bench", "phone": "0900000000", "address": "bench"})
+            if not self.cookie:
+                raise RuntimeError(f"{self.name}：註冊測試使用者失敗（沒有拿到 session cookie）")
+            for pid in CART_PRODUCTS:
+                self._request(conn, "POST", "/add_to_cart", {"product_id": pid, "qty": "1"})
+            # 看一次頁面把 flash 訊息清掉，之後每個 request 帶的 cookie 都一樣乾淨
+            self._request(conn, "GET", "/products")
+        finally:
+            conn.close()
+
+
+def run_level(target: Target, paths, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset: int):
+        conn = target.connect()
+        local, bad, i = [], 0, offset
+        headers = {"Cookie": target.cookie}
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    bad += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                bad += 1
+                conn.close()
+                conn = target.connect()
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += bad
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="前台 sync / async 並排壓測")
+    parser.add_argument("--sync-url", default="http://127.0.0.1:5000", help="app.py 的位址")
+    parser.add_argument("--async-url", default="http://127.0.0.1:5002", help="app_async.py 的位址")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128], help="要測的並發連線數")
+    parser.add_argument("--duration", type=float, default=10.0, help="每個並發數跑幾秒")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS, help="輪流 GET 的頁面")
+    args = parser.parse_args(argv)
+
+    targets = [Target("sync", args.sync_url), Target("async", args.async_url)]
+    for target in targets:
+        target.login()
+
+    print(f"頁面：{' '.join(args.paths)}，每個並發數 {args.duration:g} 秒\n")
+    print(f"{'並發':>6} {'版本':>6} {'req/s':>9} {'平均ms':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'錯誤':>6}")
+    for concurrency in args.concurrency:
+        results = {}
+        # 兩個版本輪流跑同一個並發數，避免一邊剛好碰到 Redis 比較忙的時段
+        for target in targets:
+            results[target.name] = res = run_level(target, args.paths, concurrency, args.duration)
+            print(
+                f"{concurrency:>6} {target.name:>6} {res['rps']:>9.1f} {res['mean_ms']:>8.1f} "
+                f"{res['p50_ms']:>8.1f} {res['p95_ms']:>8.1f} {res['p99_ms']:>8.1f} {res['errors']:>6}"
+            )
+        if results["sync"]["rps"]:
+            print(f"{'':>6} {'':>6} async / sync = {results['async']['rps'] / results['sync']['rps']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
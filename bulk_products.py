@@ -0,0 +1,83 @@
+"""
+商品大量匯入 / 匯出的命令列版本。
+
+    python bulk_products.py import catalog.csv
+    python bulk_products.py import catalog.jsonl --create-only --rejects rejects.csv
+    python bulk_products.py export products.csv
+"""
+import argparse
+import csv
+import sys
+
+from config_redis import get_redis_client
+from product_bulk import CHUNK_SIZE, MAX_REJECTS, check_utf8, detect_format, export_csv, export_jsonl, import_products
+
+r = get_redis_client()
+
+
+def run_import(args):
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, "rb") as f:
+        try:
+            check_utf8(f)
+        except UnicodeDecodeError as e:
+            raise SystemExit(f"檔案必須是 UTF-8 編碼（{e}），沒有匯入任何資料。")
+    with open(args.path, encoding="utf-8-sig", newline="") as f:
+        result = import_products(r, f, fmt=fmt, create_only=args.create_only, chunk_size=args.chunk)
+
+    print(f"新增 {result['created']} 筆、更新 {result['updated']} 筆、退回 {result['rejected']} 筆")
+
+    if args.rejects and result["rejects"]:
+        with open(args.rejects, "w", encoding="utf-8", newline="") as out:
+            writer = csv.DictWriter(out, fieldnames=["line", "id", "reason"])
+            writer.writeheader()
+            writer.writerows(result["rejects"])
+        print(f"退回明細已寫到 {args.rejects}")
+    else:
+        for rej in result["rejects"][:20]:
+            print(f"  第 {rej['line']} 列 {rej['id']}：{rej['reason']}")
+
+    if result["rejected"] > MAX_REJECTS:
+        print(f"（只保留前 {MAX_REJECTS} 筆退回明細）")
+
+
+def run_export(args):
+    fmt = args.format or detect_format(args.path)
+    chunks = export_jsonl(r) if fmt == "jsonl" else export_csv(r)
+    count = -1 if fmt == "csv" else 0  # CSV 第一段是欄位名稱
+
+    out = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8", newline="")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"已匯出 {count} 筆商品", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="商品大量匯入 / 匯出")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="從 CSV / JSONL 匯入商品")
+    p_import.add_argument("path")
+    p_import.add_argument("--format", choices=["csv", "jsonl"], help="預設看副檔名")
+    p_import.add_argument("--create-only", action="store_true", help="已存在的商品編號退回，不覆蓋")
+    p_import.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="每個 pipeline 寫幾筆")
+    p_import.add_argument("--rejects", help="把退回明細寫成 CSV")
+    p_import.set_defaults(func=run_import)
+
+    p_export = sub.add_parser("export", help="匯出所有商品（- 代表輸出到 stdout）")
+    p_export.add_argument("path")
+    p_export.add_argument("--format", choices=["csv", "jsonl"], help="預設看副檔名")
+    p_export.set_defaults(func=run_export)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
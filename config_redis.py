@@ -1,14 +1,347 @@
+"""
+共用的 Redis client 工廠：連線設定全部從環境變數讀，每個 process、每個角色共用一個連線池。
+
+    r = get_redis_client()            # 角色預設是 REDIS_ROLE（沒設就是 cli）
+    r = get_redis_client("web")       # Flask 前台 / 後台
+    r = get_redis_client("worker")    # worker_orders / projector / 訂閱通知
+    r = get_async_redis_client("web") # app_async.py（redis.asyncio，設定完全一樣）
+    rr = get_read_client("web")       # 唯讀頁面用：有設 REDIS_REPLICA_URLS 就讀 replica（見 read_routing.py）
+
+連線位置（二選一）：
+    REDIS_URL                   例如 rediss://default:密碼@host:port/0（rediss 就是 TLS）
+    REDIS_HOST / REDIS_PORT / REDIS_DB / REDIS_USERNAME / REDIS_PASSWORD
+                                預設 localhost:6379；Redis Cloud 的帳密放這裡，不要寫進程式
+    REDIS_TLS=1                 用 TLS 連線；REDIS_TLS_CA_CERTS 指定 CA 檔，
+                                REDIS_TLS_VERIFY=0 可以關掉憑證檢查（只在測試環境用）
+
+連線池與逾時（都可以用 REDIS_{角色}_xxx 只改某個角色，例如 REDIS_WEB_MAX_CONNECTIONS）：
+    REDIS_MAX_CONNECTIONS       連線池上限；用完時排隊等，不會一直開新連線
+    REDIS_POOL_TIMEOUT          排隊最多等幾秒，等不到就丟 ConnectionError
+    REDIS_CONNECT_TIMEOUT       建立連線的逾時（秒）
+    REDIS_SOCKET_TIMEOUT        等回應的逾時（秒），0 代表不限
+    REDIS_HEALTH_CHECK_INTERVAL 連線閒置超過幾秒，下次使用前先 PING 一下
+    REDIS_RETRIES               連線斷掉 / 連不上時重試幾次（指數退避加抖動）
+    REDIS_RETRY_BASE / REDIS_RETRY_CAP   退避的起始 / 最長秒數
+    REDIS_RETRY_ON_TIMEOUT=1    逾時也重試（寫入指令可能因此重送，預設關閉）
+    REDIS_REPLICA_CONNECT_TIMEOUT  replica 的連線逾時（秒，預設 0.5）；replica 一律不重試，
+                                連不上就直接改讀主節點
+
+本機開發 / 測試不想連雲端時，設 REDIS_BACKEND=local 或 memory（見 local_redis.py）。
+
+Redis Cluster：
+    REDIS_CLUSTER=1             改用 RedisCluster client（REDIS_URL / REDIS_HOST 填任一個節點即可），
+                                key 也換成加 hash tag 的排法（見 key_schema.py）；
+                                max_connections 變成「每個節點」的連線上限，replica 分流不適用；
+                                商品 / 庫存 / 訂單 / 佇列都在 {shop} 同一個 slot，結帳和 worker
+                                的流量還是集中在一個節點（見 key_schema.py 的「限制」）
+    本機後端（local / memory）沒有 cluster，REDIS_CLUSTER=1 時只換 key 排法，client 照舊，
+    方便在單機上先驗證新的 key 排法
+
+worker 角色的讀取會用 BLOCK / 訂閱長時間等待，所以它的 socket timeout 預設比 web 長很多；
+TCP keepalive 一律開著，NAT / 雲端負載平衡把閒置連線切掉時能早點發現。
+"""
+import os
+import socket
+import threading
+
 import redis
+import redis.asyncio
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.cluster import RedisCluster
+from redis.backoff import ExponentialWithJitterBackoff, NoBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+
+import local_redis
+from key_schema import CLUSTER
+from read_routing import ReadClient, ReplicaRouter, replica_urls
+
+DEFAULT_ROLE = "cli"
+
+# 各角色的預設值；環境變數優先
+ROLE_DEFAULTS = {
+    # gunicorn 每個 worker 一個池；回應慢就快點失敗，不要讓 request 一直堆
+    "web": {"max_connections": 50, "pool_timeout": 5, "socket_timeout": 5},
+    # 背景程式：XREADGROUP BLOCK、Pub/Sub 要能等比較久
+    "worker": {"max_connections": 16, "pool_timeout": 10, "socket_timeout": 60},
+    # 一次性的腳本 / 回填工具
+    "cli": {"max_connections": 8, "pool_timeout": 30, "socket_timeout": 30},
+}
+
+# replica 連不上時 ReadClient 會直接改讀主節點，所以不重試、連線逾時設短，不要讓 request 卡在 replica 上
+REPLICA_DEFAULTS = {
+    "connect_timeout": 0.5,
+}
+
+GLOBAL_DEFAULTS = {
+    "max_connections": 20,
+    "pool_timeout": 10,
+    "connect_timeout": 5,
+    "socket_timeout": 10,
+    "health_check_interval": 30,
+    "retries": 3,
+    "retry_base": 0.05,
+    "retry_cap": 2.0,
+}
+
+_pools = {}
+_async_pools = {}
+_read_clients = {}
+_cluster_clients = {}
+_async_cluster_clients = {}
+_pools_lock = threading.Lock()
+
 
-def get_redis_client():
+def _env(role: str, name: str, cast=str):
+    """REDIS_{ROLE}_{NAME} → REDIS_{NAME} → 角色預設 → 全域預設。"""
+    for var in (f"REDIS_{role.upper()}_{name.upper()}", f"REDIS_{name.upper()}"):
+        value = os.environ.get(var)
+        if value not in (None, ""):
+            return cast(value)
+    value = ROLE_DEFAULTS.get(role, {}).get(name, GLOBAL_DEFAULTS.get(name))
+    return cast(value) if value is not None else None
+
+
+def _flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _keepalive_options() -> dict:
+    """閒置 60 秒開始探測、每 10 秒一次、連續 3 次沒回應就斷線（平台沒有的選項就略過）。"""
+    options = {}
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options[getattr(socket, name)] = value
+    return options
+
+
+def _connection_kwargs(role: str, retry_class=Retry) -> dict:
+    socket_timeout = _env(role, "socket_timeout", float) or None  # 0 = 不限
+
+    retry_on = [ConnectionError]
+    if _flag("REDIS_RETRY_ON_TIMEOUT"):
+        retry_on.append(TimeoutError)
+
+    return {
+        "decode_responses": True,
+        # 精簡訂單格式是二進位內容，用 surrogateescape 才能原封不動讀回來
+        "encoding_errors": "surrogateescape",
+        "socket_connect_timeout": _env(role, "connect_timeout", float),
+        "socket_timeout": socket_timeout,
+        "socket_keepalive": True,
+        "socket_keepalive_options": _keepalive_options(),
+        "health_check_interval": _env(role, "health_check_interval", int),
+        "retry": retry_class(
+            ExponentialWithJitterBackoff(
+                base=_env(role, "retry_base", float),
+                cap=_env(role, "retry_cap", float),
+            ),
+            _env(role, "retries", int),
+        ),
+        "retry_on_error": retry_on,
+        "client_name": f"candyshop-{role}",
+    }
+
+
+def _replica_kwargs(retry_class=Retry) -> dict:
+    """replica 連線：不重試（錯誤交給 ReadClient 換主節點），連線逾時用 REDIS_REPLICA_CONNECT_TIMEOUT。"""
+    connect_timeout = os.environ.get("REDIS_REPLICA_CONNECT_TIMEOUT") or REPLICA_DEFAULTS["connect_timeout"]
+    return {
+        "socket_connect_timeout": float(connect_timeout),
+        "retry": retry_class(NoBackoff(), 0),
+        "retry_on_error": [],
+    }
+
+
+def _build_pool(role: str, lib=redis, url: str = None, replica: bool = False):
     """
-    回傳一個連到『雲端 Redis』的 client。
-    把下面的 host / port / username / password 換成你 Redis Cloud 顯示的那一組。
+    lib 是 redis 或 redis.asyncio，兩邊的連線池 / SSL 類別名稱一樣。
+    url 有給就直接連那裡（replica），不然照 REDIS_BACKEND / REDIS_URL / REDIS_HOST 決定。
+    replica=True 時改用 _replica_kwargs() 的重試 / 連線逾時。
     """
-    return redis.Redis(
-        host='redis-15228.c54.ap-northeast-1-2.ec2.cloud.redislabs.com',
-        port=15228,
-        username="default",
-        password="kqGTtGBgEUkfpuFqPZ8aSelntMNqZC2v",                                    
-        decode_responses=True,                                           
+    retry_class = AsyncRetry if lib is redis.asyncio else Retry
+    pool_kwargs = {
+        "max_connections": _env(role, "max_connections", int),
+        "timeout": _env(role, "pool_timeout", float),
+        **_connection_kwargs(role, retry_class),
+    }
+    if replica:
+        pool_kwargs.update(_replica_kwargs(retry_class))
+
+    if not url:
+        if local_redis.backend() == "local":
+            url = local_redis.local_url()
+        else:
+            url = os.environ.get("REDIS_URL")
+    if url:
+        # rediss:// 會自動用 SSLConnection
+        return lib.BlockingConnectionPool.from_url(url, **pool_kwargs)
+
+    pool_kwargs.update(
+        host=os.environ.get("REDIS_HOST", "localhost"),
+        port=int(os.environ.get("REDIS_PORT", "6379")),
+        db=int(os.environ.get("REDIS_DB", "0")),
+        username=os.environ.get("REDIS_USERNAME") or None,
+        password=os.environ.get("REDIS_PASSWORD") or None,
     )
+    if _flag("REDIS_TLS"):
+        verify = _flag("REDIS_TLS_VERIFY", default=True)
+        pool_kwargs.update(
+            connection_class=lib.SSLConnection,
+            ssl_cert_reqs="required" if verify else "none",
+            ssl_check_hostname=verify,
+            ssl_ca_certs=os.environ.get("REDIS_TLS_CA_CERTS") or None,
+        )
+    return lib.BlockingConnectionPool(**pool_kwargs)
+
+
+def _use_cluster() -> bool:
+    return CLUSTER and local_redis.backend() == "remote"
+
+
+def _build_cluster(role: str, cluster_class=RedisCluster):
+    """
+    cluster_class 是 redis.cluster.RedisCluster 或 redis.asyncio 的版本。
+    只要給一個節點，其他節點和 slot 分布由 client 自己用 CLUSTER SLOTS 查。
+    """
+    kwargs = {
+        "max_connections": _env(role, "max_connections", int),
+        **_connection_kwargs(role, AsyncRetry if cluster_class is AsyncRedisCluster else Retry),
+    }
+    url = os.environ.get("REDIS_URL")
+    if url:
+        return cluster_class.from_url(url, **kwargs)
+
+    kwargs.update(
+        host=os.environ.get("REDIS_HOST", "localhost"),
+        port=int(os.environ.get("REDIS_PORT", "6379")),
+        username=os.environ.get("REDIS_USERNAME") or None,
+        password=os.environ.get("REDIS_PASSWORD") or None,
+    )
+    if _flag("REDIS_TLS"):
+        verify = _flag("REDIS_TLS_VERIFY", default=True)
+        kwargs.update(
+            ssl=True,
+            ssl_cert_reqs="required" if verify else "none",
+            ssl_check_hostname=verify,
+            ssl_ca_certs=os.environ.get("REDIS_TLS_CA_CERTS") or None,
+        )
+    return cluster_class(**kwargs)
+
+
+def get_cluster_client(role: str = None) -> RedisCluster:
+    """REDIS_CLUSTER=1 時的共用 client；RedisCluster 自己管每個節點的連線池，一個角色建一個就好。"""
+    role = role or os.environ.get("REDIS_ROLE") or DEFAULT_ROLE
+    client = _cluster_clients.get(role)
+    if client is None:
+        with _pools_lock:
+            client = _cluster_clients.get(role)
+            if client is None:
+                client = _cluster_clients[role] = _build_cluster(role)
+    return client
+
+
+def get_connection_pool(role: str = None) -> redis.BlockingConnectionPool:
+    """這個 process 裡某個角色的共用連線池（fork 之後 redis-py 會自己換新連線）。"""
+    if _use_cluster():
+        raise RuntimeError("REDIS_CLUSTER=1 時每個節點各有連線池，請用 get_redis_client() / get_cluster_client()")
+    role = role or os.environ.get("REDIS_ROLE") or DEFAULT_ROLE
+    pool = _pools.get(role)
+    if pool is None and local_redis.backend() == "local":
+        # 先在鎖外把本機 server 起好（種資料時會回頭呼叫 get_redis_client）
+        local_redis.local_url()
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(role)
+            if pool is None:
+                pool = _pools[role] = _build_pool(role)
+    return pool
+
+
+def get_redis_client(role: str = None) -> redis.Redis:
+    """
+    回傳一個走共用連線池的 client。client 本身很輕，呼叫幾次都可以，
+    同一個角色的所有 client 共用同一批連線。REDIS_CLUSTER=1 時回傳 RedisCluster。
+    """
+    if _use_cluster():
+        return get_cluster_client(role)
+    if local_redis.backend() == "memory":
+        return local_redis.memory_client(
+            decode_responses=True,
+            encoding_errors="surrogateescape",
+        )
+    return redis.Redis(connection_pool=get_connection_pool(role))
+
+
+def get_read_client(role: str = None):
+    """
+    唯讀用的 client。有設 REDIS_REPLICA_URLS 時回傳 ReadClient（挑健康的 replica，不行就讀主節點），
+    沒設的話就是 get_redis_client(role) 本身，完全沒有額外成本。
+    cluster 模式下每個 slot 的主節點各不相同，不走 REDIS_REPLICA_URLS，一律讀主節點。
+    """
+    urls = replica_urls()
+    if not urls or local_redis.backend() != "remote" or _use_cluster():
+        return get_redis_client(role)
+
+    role = role or os.environ.get("REDIS_ROLE") or DEFAULT_ROLE
+    client = _read_clients.get(role)
+    if client is None:
+        primary = get_redis_client(role)
+        with _pools_lock:
+            client = _read_clients.get(role)
+            if client is None:
+                replicas = {
+                    url: redis.Redis(connection_pool=_build_pool(role, url=url, replica=True))
+                    for url in urls
+                }
+                router = ReplicaRouter(primary, replicas)
+                client = _read_clients[role] = ReadClient(router)
+    return client
+
+
+def get_async_redis_client(role: str = None) -> redis.asyncio.Redis:
+    """
+    redis.asyncio 版的 get_redis_client，環境變數與角色設定相同。
+    asyncio 的連線綁在 event loop 上：一個 process 只跑一個 loop（hypercorn / uvicorn worker）就沒問題。
+    """
+    if _use_cluster():
+        role = role or os.environ.get("REDIS_ROLE") or DEFAULT_ROLE
+        client = _async_cluster_clients.get(role)
+        if client is None:
+            with _pools_lock:
+                client = _async_cluster_clients.get(role)
+                if client is None:
+                    client = _async_cluster_clients[role] = _build_cluster(role, AsyncRedisCluster)
+        return client
+    if local_redis.backend() == "memory":
+        return local_redis.memory_async_client(
+            decode_responses=True,
+            encoding_errors="surrogateescape",
+        )
+    role = role or os.environ.get("REDIS_ROLE") or DEFAULT_ROLE
+    pool = _async_pools.get(role)
+    if pool is None:
+        if local_redis.backend() == "local":
+            local_redis.local_url()
+        with _pools_lock:
+            pool = _async_pools.get(role)
+            if pool is None:
+                pool = _async_pools[role] = _build_pool(role, redis.asyncio)
+    return redis.asyncio.Redis(connection_pool=pool)
+
+
+def close_pools():
+    """關掉所有連線池（process 結束前、或測試之間重設用）。"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        clusters = list(_cluster_clients.values())
+        _cluster_clients.clear()
+    for pool in pools:
+        pool.disconnect()
+    for client in clusters:
+        client.close()
@@ -0,0 +1,201 @@
+"""
+所有 Redis key 的命名集中在這裡，有兩種排法：
+
+    一般（classic）  原本的 key，例如 product:2001、seckill:stock:2001、user:u_ab12cd34:orders
+    cluster          REDIS_CLUSTER=1 時使用，在 key 裡加 hash tag（{...}），
+                     同一個交易 / Lua script 用到的 key 一定落在同一個 slot，不會 CROSSSLOT
+
+cluster 排法的分組：
+
+    {shop}     商品、庫存、訂單、訂單索引、統計、銷售彙總、訂單佇列、搶購訂單
+               product:{shop}:2001   stock:{shop}:2001   order:{shop}:<訂單編號>
+               orders:{shop}:by_time   stats:{shop}:orders   queue:{shop}:orders:stream ...
+    {<pid>}    某個搶購活動的名額 / 成功名單 / 設定，搶購的 WATCH / MULTI 只在這裡
+               seckill:{2001}:stock   seckill:{2001}:users   seckill:{2001}:event
+    {<uid>}    某個使用者的資料、購物車、訂單列表、摘要、防重複 token
+               user:{u_ab12cd34}   user:{u_ab12cd34}:orders   cart:{u_ab12cd34}   idem:{u_ab12cd34}:<token>
+    {events}   stream:{events}:orders / stream:{events}:seckill（看板和 projector 一次 XREAD 兩條）
+
+跨組的寫入（結帳要寫使用者的訂單列表、搶購成功要寫搶購訂單）在 cluster 模式下拆成
+「先做有 WATCH 的那個 slot 的交易，成功後再寫其他 slot」，見 app.py 的 checkout / seckill_attempt。
+
+限制：{shop} 整組只有一個 slot，也就是只落在一個節點上。結帳要同時 WATCH 多個商品的庫存，
+扣庫存、建訂單、索引、統計、銷售彙總、丟進訂單佇列都在同一個 MULTI 裡；worker 的狀態 / 重試
+script 也同時動訂單和索引 / 佇列，所以這組沒有拆開。cluster 模式分散出去的只有使用者（{<uid>}）、
+搶購活動（{<pid>}）和事件 stream（{events}），結帳和 worker 的流量仍然全部在 {shop} 那個節點，
+加節點不會讓它變快。那個節點滿了之後要再拆，得先把結帳 / worker 改成各 slot 各自的交易
+（例如每個商品各自扣庫存、訂單和索引改用事件更新），不是只改 key 的排法。
+
+前綴（第一段）兩種排法都一樣，所以 SCAN product:* 之類的 pattern 兩邊都能用；
+要精確比對時用這裡的方法產生 pattern，例如 schema.seckill_event("*")。
+
+    from key_schema import schema
+    r.hgetall(schema.product(pid))
+
+從一般排法搬到 cluster 用 migrate_cluster_keys.py。
+"""
+import os
+import re
+
+SHOP_TAG = "shop"
+EVENTS_TAG = "events"
+
+
+def cluster_enabled() -> bool:
+    return os.environ.get("REDIS_CLUSTER", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class KeySchema:
+    def __init__(self, cluster: bool):
+        self.cluster = cluster
+
+        # 單一的 key
+        self.orders_by_time = self.shop("orders:by_time")
+        self.seckill_orders = self.shop("seckill:orders")
+        self.stats_products = self.shop("stats:products")
+        self.stats_orders = self.shop("stats:orders")
+        self.stats_users = self.shop("stats:users")
+        self.sales_product_units = self.shop("sales:products:units")
+        self.sales_product_revenue = self.shop("sales:products:revenue")
+        self.legacy_order_queue = self.shop("queue:orders")
+        self.order_stream = self.shop("queue:orders:stream")
+        self.dead_letter_stream = self.shop("queue:orders:dead")
+        self.retry_zset = self.shop("queue:orders:delayed")
+        self.order_events_stream = self.events("stream:orders")
+        self.seckill_events_stream = self.events("stream:seckill")
+
+    def _grouped(self, name: str, tag: str) -> str:
+        """stats:orders -> stats:{shop}:orders（cluster 模式才插 tag）。"""
+        if not self.cluster:
+            return name
+        head, _, rest = name.partition(":")
+        return f"{head}:{{{tag}}}:{rest}" if rest else f"{head}:{{{tag}}}"
+
+    def _owned(self, head: str, owner: str, rest: str = "") -> str:
+        """user + u_xx + orders -> user:u_xx:orders / user:{u_xx}:orders。"""
+        owner = f"{{{owner}}}" if self.cluster else owner
+        return f"{head}:{owner}:{rest}" if rest else f"{head}:{owner}"
+
+    def shop(self, name: str) -> str:
+        return self._grouped(name, SHOP_TAG)
+
+    def events(self, name: str) -> str:
+        return self._grouped(name, EVENTS_TAG)
+
+    # ---------- {shop} ----------
+
+    def product(self, pid) -> str:
+        return self.shop(f"product:{pid}")
+
+    def stock(self, pid) -> str:
+        return self.shop(f"stock:{pid}")
+
+    def order(self, order_id) -> str:
+        return self.shop(f"order:{order_id}")
+
+    def seckill_order(self, order_id) -> str:
+        return self.shop(f"seckill:order:{order_id}")
+
+    def order_status(self, status) -> str:
+        return self.shop(f"orders:status:{status}")
+
+    def order_query(self, digest) -> str:
+        return self.shop(f"orders:query:{digest}")
+
+    def stats_day_orders(self, day) -> str:
+        return self.shop(f"stats:orders:{day}")
+
+    def stats_day_revenue(self, day) -> str:
+        return self.shop(f"stats:revenue:{day}")
+
+    def sales_day(self, day) -> str:
+        return self.shop(f"sales:day:{day}")
+
+    def sales_category(self, day) -> str:
+        return self.shop(f"sales:category:{day}")
+
+    # ---------- 搶購活動 {<pid>} ----------
+
+    def _seckill(self, kind: str, pid) -> str:
+        if self.cluster:
+            return f"seckill:{{{pid}}}:{kind}"
+        return f"seckill:{kind}:{pid}"
+
+    def seckill_stock(self, pid) -> str:
+        return self._seckill("stock", pid)
+
+    def seckill_users(self, pid) -> str:
+        return self._seckill("users", pid)
+
+    def seckill_event(self, pid) -> str:
+        return self._seckill("event", pid)
+
+    # ---------- 使用者 {<uid>} ----------
+
+    def user(self, user_id) -> str:
+        return self._owned("user", user_id)
+
+    def user_orders(self, user_id) -> str:
+        return self._owned("user", user_id, "orders")
+
+    def user_seckill_orders(self, user_id) -> str:
+        return self._owned("user", user_id, "seckill_orders")
+
+    def user_summary(self, user_id) -> str:
+        return self._owned("user", user_id, "summary")
+
+    def user_summary_applied(self, user_id) -> str:
+        return self._owned("user", user_id, "summary:applied")
+
+    def cart(self, user_id) -> str:
+        return self._owned("cart", user_id)
+
+    def idem(self, user_id, token) -> str:
+        return self._owned("idem", user_id, token)
+
+
+def key_id(key: str) -> str:
+    """product:2001 / product:{shop}:2001 -> 2001（最後一段）。"""
+    return key.rsplit(":", 1)[-1]
+
+
+# 一般排法的 key -> 產生它的方法；由上往下比對，第一個符合的為準
+_CLASSIC_PATTERNS = [
+    (re.compile(r"product:([^:]+)"), "product"),
+    (re.compile(r"stock:([^:]+)"), "stock"),
+    (re.compile(r"order:([^:]+)"), "order"),
+    (re.compile(r"seckill:order:([^:]+)"), "seckill_order"),
+    (re.compile(r"seckill:stock:([^:]+)"), "seckill_stock"),
+    (re.compile(r"seckill:users:([^:]+)"), "seckill_users"),
+    (re.compile(r"seckill:event:([^:]+)"), "seckill_event"),
+    (re.compile(r"user:([^:]+)"), "user"),
+    (re.compile(r"user:([^:]+):orders"), "user_orders"),
+    (re.compile(r"user:([^:]+):seckill_orders"), "user_seckill_orders"),
+    (re.compile(r"user:([^:]+):summary"), "user_summary"),
+    (re.compile(r"user:([^:]+):summary:applied"), "user_summary_applied"),
+    (re.compile(r"cart:([^:]+)"), "cart"),
+    (re.compile(r"idem:([^:]+):(.+)"), "idem"),
+    (re.compile(r"(?:seckill:orders|(?:orders|stats|sales|queue):.+)"), "shop"),
+]
+_CLASSIC_EVENT_STREAMS = ("stream:orders", "stream:seckill")
+
+
+def convert_classic_key(key: str, target: KeySchema):
+    """
+    一般排法的 key 換成 target 排法的名字。
+    orders:query:* 是暫存的篩選結果，orders:day:* / catalog:version 是舊版留下、已經沒人讀的 key，
+    回傳 None（不用搬）；認不得的 key 原名回傳。
+    """
+    if key.startswith(("orders:query:", "orders:day:")) or key == "catalog:version":
+        return None
+    if key in _CLASSIC_EVENT_STREAMS:
+        return target.events(key)
+    for pattern, method in _CLASSIC_PATTERNS:
+        m = pattern.fullmatch(key)
+        if m:
+            return getattr(target, method)(*(m.groups() or (key,)))
+    return key
+
+
+CLUSTER = cluster_enabled()
+schema = KeySchema(CLUSTER)
@@ -0,0 +1,157 @@
+"""
+後台即時看板：把 stream:orders / stream:seckill 的新事件用 Server-Sent Events 推給瀏覽器。
+
+每個 process 只有一個背景 thread 在 XREAD BLOCK 讀兩條 stream，
+讀到的事件轉成看板要的格式（含計數器的增量），再分送給所有開著的看板連線；
+開再多個後台頁面，Redis 那邊也只有一條 blocking 連線。
+
+    broadcaster = StreamBroadcaster(get_redis_client)
+    for chunk in broadcaster.sse(last_event_id): ...   # Flask 串流回應
+
+瀏覽器斷線重連時會帶 Last-Event-ID，最近 REPLAY_SIZE 筆事件會補送。
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from key_schema import schema
+
+# 兩條 stream 在同一組 key（cluster 模式是 {events}），一個 XREAD 才能同時讀
+ORDER_EVENTS_STREAM = schema.order_events_stream
+SECKILL_EVENTS_STREAM = schema.seckill_events_stream
+
+BLOCK_MS = 5000
+READ_COUNT = 100
+CLIENT_QUEUE_SIZE = 500  # 看板跟不上時，超過就丟掉那個連線
+KEEPALIVE_SECONDS = 15
+REPLAY_SIZE = 200
+RETRY_SECONDS = 3
+
+
+def format_order_event(entry_id: str, fields: dict) -> dict:
+    grand_total = int(fields.get("grand_total") or fields.get("total") or 0)
+    return {
+        "type": "order",
+        "id": f"orders|{entry_id}",
+        "order_id": fields.get("order_id", ""),
+        "user_id": fields.get("user_id", ""),
+        "grand_total": grand_total,
+        "items_count": int(fields.get("items_count") or 0),
+        "created_at": fields.get("created_at", ""),
+        # 看板上的計數器直接加這些數字，不用重新查
+        "deltas": {"order_count": 1, "today_order_count": 1, "today_revenue": grand_total},
+    }
+
+
+def format_seckill_event(entry_id: str, fields: dict, user_name: str = None) -> dict:
+    return {
+        "type": "seckill",
+        "id": f"seckill|{entry_id}",
+        "order_id": fields.get("order_id", ""),
+        "product_id": fields.get("product_id", ""),
+        "user_id": fields.get("user_id", ""),
+        "user_name": user_name or fields.get("user_id", ""),
+        "created_at": fields.get("created_at", ""),
+        "deltas": {"success_count": 1, "stock": -1},
+    }
+
+
+class StreamBroadcaster:
+    """一個 process 一個：背景讀 stream，分送給所有 SSE 連線。"""
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+        self.clients = set()
+        self.recent = deque(maxlen=REPLAY_SIZE)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="live-events", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        r = self.client_factory()
+        # 只推開看板之後的新事件
+        last_ids = {ORDER_EVENTS_STREAM: "$", SECKILL_EVENTS_STREAM: "$"}
+
+        while True:
+            try:
+                response = r.xread(last_ids, count=READ_COUNT, block=BLOCK_MS)
+            except Exception as e:
+                print(f"[{datetime.now()}] 即時看板讀取 stream 失敗，{RETRY_SECONDS} 秒後重試：{e!r}")
+                time.sleep(RETRY_SECONDS)
+                continue
+
+            for stream, entries in response or []:
+                last_ids[stream] = entries[-1][0]
+                for event in self._format(r, stream, entries):
+                    self._publish(event)
+
+    def _format(self, r, stream: str, entries):
+        if stream == ORDER_EVENTS_STREAM:
+            return [format_order_event(eid, fields) for eid, fields in entries]
+
+        # 搶購成功名單要顯示名稱：這一批的使用者名稱用一個 pipeline 查
+        with r.pipeline(transaction=False) as pipe:
+            for _, fields in entries:
+                pipe.hget(schema.user(fields.get("user_id", "")), "name")
+            names = pipe.execute()
+        return [
+            format_seckill_event(eid, fields, name)
+            for (eid, fields), name in zip(entries, names)
+        ]
+
+    def _publish(self, event: dict):
+        with self.lock:
+            self.recent.append(event)
+            clients = list(self.clients)
+        for q in clients:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # 太慢的連線直接斷掉，瀏覽器會自己重連並補送最近的事件
+                self.unsubscribe(q)
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    def subscribe(self, last_event_id: str = None):
+        """開一條連線；有 last_event_id 的話先塞進之後的事件。"""
+        self._ensure_started()
+        q = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self.lock:
+            if last_event_id:
+                ids = [e["id"] for e in self.recent]
+                if last_event_id in ids:
+                    for e in list(self.recent)[ids.index(last_event_id) + 1:]:
+                        q.put_nowait(e)
+            self.clients.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.clients.discard(q)
+
+    def sse(self, last_event_id: str = None):
+        """產生 SSE 文字；沒有事件時定時送註解行，避免 proxy 把連線關掉。"""
+        q = self.subscribe(last_event_id)
+        try:
+            yield f"retry: {RETRY_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,195 @@
+"""
+離線開發 / 測試 / 跑 benchmark 用的本機 Redis，不碰雲端的正式資料。
+
+用環境變數 REDIS_BACKEND 切換（config_redis.get_redis_client 會看這個）：
+
+    REDIS_BACKEND=remote   預設：照 REDIS_URL / REDIS_HOST ... 連線
+    REDIS_BACKEND=local    自動起一個暫時的 redis-server（127.0.0.1 隨機 port、暫存目錄、不寫磁碟），
+                           process 結束就關掉；REDIS_SERVER_BIN 可以指定 redis-server 路徑
+    REDIS_BACKEND=memory   用 fakeredis 在同一個 process 裡模擬，連 redis-server 都不用裝
+                           （pip install "fakeredis[lua]"；只適合單一 process，例如 Flask 開發伺服器、CLI）
+
+兩種本機後端第一次用到時都會先跑 seed_products 放好商品和庫存（REDIS_LOCAL_SEED=0 可以關掉）。
+
+好幾個 process 要共用同一台本機 Redis（前台 + 後台 + worker）時，先用這支程式起好：
+
+    python local_redis.py                                  # 起 server 並種資料，印出連線方式，Ctrl+C 結束
+    python local_redis.py -- python supervisor.py --orders 2   # 帶著連線設定跑指令，指令結束就關掉
+
+起好的 server 位址放在 REDIS_LOCAL_URL，子 process 會沿用，不會各自再起一台。
+"""
+import argparse
+import atexit
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+LOCAL_URL_ENV = "REDIS_LOCAL_URL"
+START_TIMEOUT = 10
+
+_lock = threading.RLock()
+_server_proc = None
+_fake_server = None
+
+
+def backend() -> str:
+    return (os.environ.get("REDIS_BACKEND") or "remote").strip().lower()
+
+
+def _seed_enabled() -> bool:
+    return os.environ.get("REDIS_LOCAL_SEED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _seed():
+    """用 seed_products 放商品和庫存；它在 import 時拿的 client 會指到剛起好的本機後端。"""
+    if not _seed_enabled():
+        return
+    import seed_products
+
+    seed_products.reset_data()
+    seed_products.seed_products(verbose=False)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_ready(port: int, proc):
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"redis-server 啟動失敗（exit code {proc.returncode}）")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5) as s:
+                s.sendall(b"PING\r\n")
+                if s.recv(16).startswith(b"+PONG"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"redis-server 在 {START_TIMEOUT} 秒內沒有回應")
+
+
+def _stop_server(proc, data_dir):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def start_local_server() -> str:
+    """起一台暫時的 redis-server，回傳 redis:// 位址；這個 process 結束時自動關掉。"""
+    global _server_proc
+    binary = os.environ.get("REDIS_SERVER_BIN") or shutil.which("redis-server")
+    if not binary:
+        raise RuntimeError("找不到 redis-server，請先安裝，或改用 REDIS_BACKEND=memory")
+
+    port = _free_port()
+    data_dir = tempfile.mkdtemp(prefix="candyshop-redis-")
+    proc = subprocess.Popen(
+        [
+            binary,
+            "--port", str(port),
+            "--bind", "127.0.0.1",
+            "--dir", data_dir,
+            "--save", "",
+            "--appendonly", "no",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+    _wait_until_ready(port, proc)
+    atexit.register(_stop_server, proc, data_dir)
+    _server_proc = proc
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def local_url() -> str:
+    """REDIS_BACKEND=local 用的位址：已經有人起好（REDIS_LOCAL_URL）就沿用，不然現在起一台並種資料。"""
+    with _lock:
+        url = os.environ.get(LOCAL_URL_ENV)
+        if url:
+            return url
+        url = start_local_server()
+        # 先記下來：種資料時 seed_products 會再呼叫 get_redis_client，要拿到同一台
+        os.environ[LOCAL_URL_ENV] = url
+        _seed()
+        return url
+
+
+def memory_client(**kwargs):
+    """REDIS_BACKEND=memory：同一個 process 裡所有 client 共用一個 fakeredis server。"""
+    global _fake_server
+    try:
+        import fakeredis
+    except ImportError:
+        raise RuntimeError('REDIS_BACKEND=memory 需要 fakeredis：pip install "fakeredis[lua]"') from None
+
+    with _lock:
+        first = _fake_server is None
+        if first:
+            _fake_server = fakeredis.FakeServer()
+        client = fakeredis.FakeRedis(server=_fake_server, **kwargs)
+        if first:
+            _seed()
+    return client
+
+
+def memory_async_client(**kwargs):
+    """memory 後端的 asyncio 版，跟同步 client 共用同一個 fakeredis server（資料互通）。"""
+    import fakeredis
+
+    memory_client()  # 確保 server 已建立並種好資料
+    return fakeredis.FakeAsyncRedis(server=_fake_server, **kwargs)
+
+
+def prepare_shared_backend():
+    """
+    要開子 process 之前呼叫（例如 supervisor）：local 的話先把 server 起好，
+    位址寫進環境變數讓子 process 沿用；memory 沒辦法跨 process 共用，直接報錯。
+    """
+    mode = backend()
+    if mode == "local":
+        return local_url()
+    if mode == "memory":
+        raise RuntimeError("REDIS_BACKEND=memory 只能在單一 process 裡用，多 process 請改用 REDIS_BACKEND=local")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起一台本機暫時用的 Redis（已種好商品資料）")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="要帶著連線設定執行的指令（放在 -- 後面）")
+    args = parser.parse_args(argv)
+
+    os.environ["REDIS_BACKEND"] = "local"
+    os.environ.pop(LOCAL_URL_ENV, None)
+    url = local_url()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if command:
+        env = dict(os.environ, REDIS_BACKEND="local", **{LOCAL_URL_ENV: url})
+        sys.exit(subprocess.call(command, env=env))
+
+    print(f"本機 Redis 已啟動：{url}")
+    print("其他終端機用下面的設定連過來：")
+    print(f"  export REDIS_BACKEND=local {LOCAL_URL_ENV}={url}")
+    print("按 Ctrl+C 結束（資料不會保留）。")
+    try:
+        _server_proc.wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
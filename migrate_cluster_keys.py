@@ -0,0 +1,195 @@
+"""
+把一般排法（單機 Redis）的資料搬到 cluster 排法（加 hash tag 的 key，見 key_schema.py）。
+
+每個 key 用 DUMP / RESTORE 原封不動複製（含 TTL；stream 連 consumer group 一起），
+只換名字，例如 stock:2001 -> stock:{shop}:2001、user:u_ab12cd34:orders -> user:{u_ab12cd34}:orders。
+來源資料不會被改動或刪除。
+
+    # 先看會怎麼改名（不寫入）
+    python migrate_cluster_keys.py --source redis://old-host:6379/0 --target redis://cluster-node:7000 --dry-run
+
+    # 正式搬（前台 / 後台 / worker 要先停，不然搬的過程中新寫入的資料會漏掉）
+    python migrate_cluster_keys.py --source redis://old-host:6379/0 --target redis://cluster-node:7000
+
+    # 先在單機上試新的排法（目標不是 cluster）
+    python migrate_cluster_keys.py --source redis://localhost:6379/0 --target redis://localhost:6379/1 --target-standalone
+
+搬完之後所有程式都設 REDIS_CLUSTER=1、REDIS_URL 指到 cluster 的任一個節點再啟動。
+目標已經有同名 key 時預設跳過並列出，加 --replace 才覆蓋。
+orders:query:* 是後台篩選的暫存結果、orders:day:* / catalog:version 是舊版已經沒人讀的 key，不搬；認不得的 key 用原名複製並列出來。
+"""
+import argparse
+from collections import Counter
+
+import redis
+from redis.cluster import RedisCluster
+
+from key_schema import KeySchema, convert_classic_key
+
+BATCH_SIZE = 200
+SAMPLE_SIZE = 10
+
+
+def _decode(key: bytes) -> str:
+    return key.decode("utf-8", "surrogateescape")
+
+
+def _encode(key: str) -> bytes:
+    return key.encode("utf-8", "surrogateescape")
+
+
+def _family(key: str) -> str:
+    """統計用：product:2001 -> product，seckill:stock:2001 -> seckill:stock。"""
+    parts = key.split(":")
+    return ":".join(parts[:2]) if parts[0] in ("seckill", "stats", "sales", "orders", "queue") else parts[0]
+
+
+def connect(source_url: str, target_url: str, target_cluster: bool):
+    # DUMP 出來是二進位，兩邊都不要 decode
+    source = redis.Redis.from_url(source_url, decode_responses=False)
+    if target_cluster:
+        target = RedisCluster.from_url(target_url, decode_responses=False)
+    else:
+        target = redis.Redis.from_url(target_url, decode_responses=False)
+    return source, target
+
+
+def plan_batch(keys, schema: KeySchema, stats: dict):
+    """[(舊 key bytes, 新 key bytes)]；順便記下略過 / 認不得的 key。"""
+    plan = []
+    for raw in keys:
+        old = _decode(raw)
+        new = convert_classic_key(old, schema)
+        if new is None:
+            stats["skipped"] += 1
+            continue
+        if new == old:
+            stats["unknown"].append(old)
+        stats["families"][_family(old)] += 1
+        if len(stats["samples"]) < SAMPLE_SIZE:
+            stats["samples"].append((old, new))
+        plan.append((raw, _encode(new)))
+    return plan
+
+
+def copy_batch(source, target, plan, replace: bool, stats: dict):
+    """一個 pipeline DUMP + PTTL，再一個 pipeline RESTORE（cluster 會依 slot 分送到各節點）。"""
+    with source.pipeline(transaction=False) as pipe:
+        for old, _ in plan:
+            pipe.dump(old)
+            pipe.pttl(old)
+        results = pipe.execute()
+
+    todo = []
+    for i, (old, new) in enumerate(plan):
+        payload, ttl = results[2 * i], results[2 * i + 1]
+        if payload is None or ttl == -2:
+            # SCAN 之後才被刪掉或過期
+            stats["vanished"] += 1
+            continue
+        todo.append((old, new, payload, max(ttl, 0)))
+    if not todo:
+        return
+
+    with target.pipeline(transaction=False) as pipe:
+        for _, new, payload, ttl in todo:
+            pipe.restore(new, ttl, payload, replace=replace)
+        replies = pipe.execute(raise_on_error=False)
+
+    for (old, new, _, _), reply in zip(todo, replies):
+        if not isinstance(reply, Exception):
+            stats["copied"] += 1
+        elif "BUSYKEY" in str(reply):
+            stats["exists"].append(_decode(new))
+        else:
+            stats["errors"].append(f"{_decode(old)} -> {_decode(new)}：{reply}")
+
+
+def migrate(source, target, match: str = "*", dry_run: bool = False, replace: bool = False,
+            batch_size: int = BATCH_SIZE) -> dict:
+    schema = KeySchema(cluster=True)
+    stats = {
+        "scanned": 0,
+        "copied": 0,
+        "skipped": 0,
+        "vanished": 0,
+        "families": Counter(),
+        "samples": [],
+        "unknown": [],
+        "exists": [],
+        "errors": [],
+    }
+
+    batch = []
+    for key in source.scan_iter(match=match, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            stats["scanned"] += len(batch)
+            plan = plan_batch(batch, schema, stats)
+            if not dry_run:
+                copy_batch(source, target, plan, replace, stats)
+            batch = []
+    if batch:
+        stats["scanned"] += len(batch)
+        plan = plan_batch(batch, schema, stats)
+        if not dry_run:
+            copy_batch(source, target, plan, replace, stats)
+    return stats
+
+
+def print_report(stats: dict, dry_run: bool):
+    print(f"掃描 {stats['scanned']} 個 key，略過暫存 / 舊索引 {stats['skipped']} 個")
+    for family, n in sorted(stats["families"].items()):
+        print(f"  {family:<24} {n}")
+
+    print("\n改名範例：")
+    for old, new in stats["samples"]:
+        print(f"  {old}  ->  {new}")
+
+    if stats["unknown"]:
+        print(f"\n⚠️ 認不得的 key {len(stats['unknown'])} 個（用原名複製），例如：")
+        for key in stats["unknown"][:SAMPLE_SIZE]:
+            print(f"  {key}")
+
+    if dry_run:
+        print("\n（--dry-run：沒有寫入任何資料）")
+        return
+
+    print(f"\n✅ 已複製 {stats['copied']} 個 key（搬的過程中消失 {stats['vanished']} 個）")
+    if stats["exists"]:
+        print(f"⚠️ 目標已經有同名 key，跳過 {len(stats['exists'])} 個（要覆蓋請加 --replace），例如：")
+        for key in stats["exists"][:SAMPLE_SIZE]:
+            print(f"  {key}")
+    if stats["errors"]:
+        print(f"❌ 失敗 {len(stats['errors'])} 個：")
+        for line in stats["errors"][:SAMPLE_SIZE]:
+            print(f"  {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把一般排法的 key 搬到 Redis Cluster 用的 hash tag 排法")
+    parser.add_argument("--source", required=True, help="舊的單機 Redis，例如 redis://host:6379/0")
+    parser.add_argument("--target", required=True, help="cluster 任一個節點，例如 redis://node:7000")
+    parser.add_argument("--target-standalone", action="store_true", help="目標是單機 Redis（在單機上試新的排法）")
+    parser.add_argument("--match", default="*", help="只搬符合這個 pattern 的 key（預設全部）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批幾個 key")
+    parser.add_argument("--replace", action="store_true", help="目標已經有同名 key 時覆蓋")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會怎麼改名，不寫入")
+    args = parser.parse_args(argv)
+
+    source, target = connect(args.source, args.target, not args.target_standalone)
+    stats = migrate(
+        source,
+        target,
+        match=args.match,
+        dry_run=args.dry_run,
+        replace=args.replace,
+        batch_size=args.batch_size,
+    )
+    print_report(stats, args.dry_run)
+    if stats["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+把既有的 order:* / seckill:order:* 轉成精簡格式（或用 --reverse 轉回一般 hash）。
+
+只動「建立後不會改」的欄位：打包時 HSET z + HDEL 原欄位，
+status 這類會被修改的欄位完全不碰，所以可以在服務運作中直接執行。
+"""
+import argparse
+
+from config_redis import get_redis_client
+from key_schema import schema
+from order_records import (
+    ORDER_SPEC,
+    SECKILL_ORDER_SPEC,
+    pack_order,
+    pack_seckill_order,
+    unpack_order,
+    unpack_seckill_order,
+)
+from record_codec import PACKED_FIELD, is_packed
+
+r = get_redis_client()
+
+BATCH_SIZE = 500
+
+TARGETS = [
+    # (key pattern, 打包用的欄位定義, pack, unpack)
+    (schema.order("*"), ORDER_SPEC, pack_order, unpack_order),
+    (schema.seckill_order("*"), SECKILL_ORDER_SPEC, pack_seckill_order, unpack_seckill_order),
+]
+
+
+def migrate_batch(keys, spec, pack, unpack, reverse=False):
+    with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        records = pipe.execute()
+
+    changed = 0
+    with r.pipeline(transaction=False) as pipe:
+        for key, h in zip(keys, records):
+            if not h:
+                continue
+
+            if reverse:
+                if not is_packed(h):
+                    continue
+                data = unpack(h)
+                fields = {k: v for k, v in data.items() if k in spec}
+                pipe.hset(key, mapping=fields)
+                pipe.hdel(key, PACKED_FIELD)
+            else:
+                if is_packed(h):
+                    continue
+                fields = {k: v for k, v in h.items() if k in spec}
+                if not fields:
+                    continue
+                packed = pack(fields)
+                pipe.hset(key, PACKED_FIELD, packed[PACKED_FIELD])
+                pipe.hdel(key, *fields.keys())
+            changed += 1
+        pipe.execute()
+
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訂單紀錄精簡格式轉換")
+    parser.add_argument("--reverse", action="store_true", help="轉回一般 hash 欄位")
+    args = parser.parse_args()
+
+    for pattern, spec, pack, unpack in TARGETS:
+        total = 0
+        batch = []
+        for key in r.scan_iter(pattern, count=BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= BATCH_SIZE:
+                total += migrate_batch(batch, spec, pack, unpack, args.reverse)
+                batch = []
+        if batch:
+            total += migrate_batch(batch, spec, pack, unpack, args.reverse)
+
+        action = "還原" if args.reverse else "打包"
+        print(f"{pattern}：{action} {total} 筆")
+
+
+if __name__ == "__main__":
+    main()
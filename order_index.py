@@ -0,0 +1,250 @@
+"""
+訂單的索引，讓後台不用 KEYS order:* 掃全部。
+
+    orders:by_time             sorted set，member = 訂單編號，score = 建立時間（epoch 微秒）
+    orders:status:{status}     sorted set，同上，只放目前是這個狀態的訂單
+    user:{uid}:orders          list，原本就有的每個使用者訂單列表
+（REDIS_CLUSTER=1 時 key 名稱會加上 hash tag，見 key_schema.py）
+
+訂單編號本身就是台灣時間 %Y%m%d%H%M%S%f，所以 score 直接從編號算出來，
+backfill 時連訂單內容都不用讀。
+
+後台篩選（狀態 / 使用者 / 日期區間）用 ZINTERSTORE 把條件交集成一個暫存的
+sorted set（score 仍是建立時間），再用同一套 cursor 分頁。日期區間直接換成
+orders:by_time 的 score 範圍，只給起日或只給迄日就是往後 / 往前不設限。
+第一頁每次都重新計算，翻頁時才重用暫存結果（保留一小段時間）。
+"""
+import hashlib
+from datetime import datetime, time, timedelta, timezone
+
+from key_schema import schema
+from order_records import unpack_order
+
+ORDERS_BY_TIME = schema.orders_by_time
+
+TW = timezone(timedelta(hours=8))
+DEFAULT_PAGE_SIZE = 20
+
+# 後台篩選選單用（前台新訂單是「已建立」，worker 處理完是 processed，shop_cli 是 created）
+ORDER_STATUSES = ["已建立", "processed", "已撿貨", "已出貨", "created"]
+
+QUERY_TTL = 60  # 篩選結果暫存秒數（給翻頁用）
+STATUS_RETRIES = 3  # 改狀態時舊狀態剛好被別人改掉，最多重讀幾次
+
+# 改訂單狀態並同步狀態索引（原子操作）：
+#   KEYS = [order hash, 舊狀態的索引, 新狀態的索引]
+#   ARGV = [order_id, 預期的舊狀態（沒有就是空字串）, 新狀態, score, 其他欄位 k1, v1, k2, v2 ...]
+# 用到的 key 都從 KEYS 傳進來（cluster 模式都在 {shop}），所以呼叫端要先讀出舊狀態；
+# 執行時狀態已經不是預期的舊狀態回傳 -1（呼叫端重讀再試），訂單不存在回傳 0
+_SET_STATUS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+local old = redis.call('HGET', KEYS[1], 'status') or ''
+if old ~= ARGV[2] then
+  return -1
+end
+if old ~= '' and old ~= ARGV[3] then
+  redis.call('ZREM', KEYS[2], ARGV[1])
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[3])
+for i = 5, #ARGV, 2 do
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+return 1
+"""
+
+
+def status_key(status: str) -> str:
+    return schema.order_status(status)
+
+
+def order_score(order_id: str) -> int:
+    """訂單編號（台灣時間字串）-> epoch 微秒；格式不對就回傳 0。"""
+    try:
+        dt = datetime.strptime(order_id[:20], "%Y%m%d%H%M%S%f").replace(tzinfo=TW)
+    except ValueError:
+        return 0
+    return int(dt.timestamp()) * 1_000_000 + dt.microsecond
+
+
+def index_new_order(pipe, order_id: str, status: str):
+    """建立訂單時呼叫（放在建訂單的同一個 MULTI 裡）。"""
+    score = order_score(order_id)
+    pipe.zadd(ORDERS_BY_TIME, {order_id: score})
+    pipe.zadd(status_key(status), {order_id: score})
+
+
+def set_order_status(r, order_id: str, status: str, extra_fields=None, pipe=None, old_status=None):
+    """
+    改訂單狀態（順便寫 extra_fields），狀態索引在同一個 Lua script 裡同步更新。
+    舊狀態的索引 key 要放進 KEYS，所以先讀目前的狀態（呼叫端已經讀過就傳 old_status）；
+    沒給 pipe 時，狀態剛好被別人改掉會重讀再試。
+    有給 pipe 就只排指令，回傳值從 pipe.execute() 拿，-1 表示舊狀態不符，呼叫端要重做；
+    cluster 的 pipeline 不會先載入 script，REDIS_CLUSTER=1 時不要給 pipe。
+    訂單不存在回傳 0。
+    """
+    order_key = schema.order(order_id)
+    fields = []
+    for k, v in (extra_fields or {}).items():
+        fields.extend([k, v])
+    script = r.register_script(_SET_STATUS_SCRIPT)
+
+    def run(old, client):
+        old = old or ""
+        return script(
+            keys=[order_key, status_key(old), status_key(status)],
+            args=[order_id, old, status, order_score(order_id), *fields],
+            client=client,
+        )
+
+    if pipe is not None:
+        if old_status is None:
+            old_status = r.hget(order_key, "status")
+        return run(old_status, pipe)
+
+    result = -1
+    for _ in range(STATUS_RETRIES):
+        if old_status is None:
+            old_status = r.hget(order_key, "status")
+        result = run(old_status, r)
+        if result != -1:
+            return result
+        old_status = None
+    return result
+
+
+def load_orders(r, order_ids):
+    """一個 pipeline 撈回多筆訂單，回傳 [(order_id, dict)]，已刪除的略過。"""
+    if not order_ids:
+        return []
+    with r.pipeline(transaction=False) as pipe:
+        for oid in order_ids:
+            pipe.hgetall(schema.order(oid))
+        results = pipe.execute()
+    return [(oid, unpack_order(h)) for oid, h in zip(order_ids, results) if h]
+
+
+def _parse_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _day_score(day) -> int:
+    """台灣日期 00:00 -> epoch 微秒（跟 order_score 同一套單位）。"""
+    return int(datetime.combine(day, time.min, tzinfo=TW).timestamp()) * 1_000_000
+
+
+def query_order_index(r, status=None, user=None, date_from=None, date_to=None, reuse=False) -> str:
+    """
+    依條件回傳一個「可以直接分頁」的 sorted set key（score = 建立時間）。
+    沒有任何條件就是 orders:by_time 本身。
+      - status：orders:status:{status}
+      - date_from / date_to（YYYY-MM-DD，含頭尾）：orders:by_time 的 score 範圍，
+        只給一邊就是另一邊不設限
+      - user：user:{uid}:orders（list，先轉成暫存 set）
+    reuse=True（翻頁）時，暫存結果還在就直接用；第一頁要傳 False，每次重算才不會看到舊資料。
+    """
+    status = (status or "").strip()
+    user = (user or "").strip()
+    start = _parse_day(date_from)
+    end = _parse_day(date_to)
+    if start and end and start > end:
+        start, end = end, start
+
+    if not (status or user or start or end):
+        return ORDERS_BY_TIME
+
+    signature = f"{status}|{user}|{start}|{end}"
+    dest = schema.order_query(hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16])
+    if reuse and r.exists(dest):
+        return dest
+
+    # orders:by_time 提供 score（建立時間），其他條件權重 0，只負責篩選
+    min_score = _day_score(start) if start else "-inf"
+    max_score = f"({_day_score(end + timedelta(days=1))}" if end else "+inf"
+    user_ids = r.lrange(schema.user_orders(user), 0, -1) if user else []
+
+    with r.pipeline() as pipe:
+        if not (status or user):
+            # 只有日期：直接把那一段 score 複製出來
+            pipe.zrangestore(dest, ORDERS_BY_TIME, min_score, max_score, byscore=True)
+            pipe.expire(dest, QUERY_TTL)
+            pipe.execute()
+            return dest
+
+        sources = {ORDERS_BY_TIME: 1}
+        temp_keys = []
+
+        if start or end:
+            range_key = dest + ":range"
+            pipe.zrangestore(range_key, ORDERS_BY_TIME, min_score, max_score, byscore=True)
+            sources = {range_key: 1}
+            temp_keys.append(range_key)
+
+        if status:
+            sources[status_key(status)] = 0
+
+        if user:
+            user_key = dest + ":user"
+            pipe.delete(user_key)
+            if user_ids:
+                pipe.sadd(user_key, *user_ids)
+            sources[user_key] = 0
+            temp_keys.append(user_key)
+
+        pipe.zinterstore(dest, sources, aggregate="SUM")
+        pipe.expire(dest, QUERY_TTL)
+        if temp_keys:
+            pipe.delete(*temp_keys)
+        pipe.execute()
+
+    return dest
+
+
+def page_order_ids(r, before=None, after=None, limit=DEFAULT_PAGE_SIZE, key=ORDERS_BY_TIME):
+    """
+    新到舊分頁。before / after 是上一頁給的 cursor（score）：
+      - before：往更舊的方向翻（下一頁）
+      - after：往更新的方向翻（上一頁）
+    回傳 (訂單編號清單, 上一頁 cursor 或 None, 下一頁 cursor 或 None)。
+    """
+    before = _parse_cursor(before)
+    after = _parse_cursor(after)
+
+    if after is not None:
+        # 往新的方向：從 after 往上拿 limit+1 筆，再翻成新到舊
+        rows = r.zrangebyscore(
+            key, f"({after}", "+inf", start=0, num=limit + 1, withscores=True
+        )
+        has_newer = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        has_older = True
+    else:
+        max_score = f"({before}" if before is not None else "+inf"
+        rows = r.zrevrangebyscore(
+            key, max_score, "-inf", start=0, num=limit + 1, withscores=True
+        )
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = before is not None
+
+    if not rows:
+        return [], None, None
+
+    order_ids = [oid for oid, _ in rows]
+    newest_score = int(rows[0][1])
+    oldest_score = int(rows[-1][1])
+    prev_cursor = newest_score if has_newer else None
+    next_cursor = oldest_score if has_older else None
+    return order_ids, prev_cursor, next_cursor
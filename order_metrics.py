@@ -0,0 +1,192 @@
+"""
+訂單處理流程的監控指標。
+
+- checkout 在訂單上記 enqueued_at（毫秒），重試 / 重新排隊時另記 requeued_at
+- worker 拿到訂單時記 picked_at，處理完記 processed_at
+- 本模組把「排隊等待」「處理時間」「端到端」做成 histogram，
+  佇列長度 / 最舊一筆的等待時間在每次被抓取時即時向 Redis 查
+
+用 serve_metrics(r, port) 開一個小 HTTP server，GET /metrics 回傳 Prometheus 文字格式；
+rolling_summary() 給 worker 的 log 用（最近 60 秒的筆數與 p50 / p95）。
+"""
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from order_queue import (
+    DEAD_LETTER_STREAM,
+    LEGACY_QUEUE_KEY,
+    ORDER_STREAM,
+    RETRY_ZSET,
+    pending_count,
+)
+
+# 秒；搶購時排隊可能到好幾分鐘，所以上限拉長
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+ROLLING_WINDOW_SECONDS = 60
+
+
+class Histogram:
+    """簡單的 Prometheus histogram（累積 bucket + sum + count），thread-safe。"""
+
+    def __init__(self, name: str, help_text: str, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後一格是 +Inf
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        seconds = max(seconds, 0.0)
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+            self.count += 1
+
+    def render(self) -> list:
+        with self.lock:
+            lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+            running = 0
+            for bound, n in zip(self.buckets, self.counts):
+                running += n
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.total:.6f}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+queue_wait = Histogram("order_queue_wait_seconds", "從結帳進佇列到 worker 拿到的時間")
+processing = Histogram("order_processing_seconds", "worker 拿到訂單到處理完成的時間")
+end_to_end = Histogram("order_end_to_end_seconds", "從結帳進佇列到處理完成的時間")
+
+_recent = deque()  # (完成時間, 排隊秒數, 端到端秒數)
+_recent_lock = threading.Lock()
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def observe_order(enqueued_at_ms, picked_at: float, done_at: float, requeued_at_ms=None):
+    """
+    記錄一筆訂單；enqueued_at_ms 是訂單上的欄位（舊訂單可能沒有）。
+    重試過的訂單有 requeued_at_ms：排隊等待從最後一次排隊算，端到端仍從下單算。
+    """
+    processing.observe(done_at - picked_at)
+
+    try:
+        enqueued = int(enqueued_at_ms) / 1000
+    except (TypeError, ValueError):
+        return
+    try:
+        queued = int(requeued_at_ms) / 1000
+    except (TypeError, ValueError):
+        queued = enqueued
+
+    wait = picked_at - queued
+    total = done_at - enqueued
+    queue_wait.observe(wait)
+    end_to_end.observe(total)
+
+    with _recent_lock:
+        _recent.append((done_at, wait, total))
+        _trim_recent(done_at)
+
+
+def _trim_recent(now: float):
+    while _recent and _recent[0][0] < now - ROLLING_WINDOW_SECONDS:
+        _recent.popleft()
+
+
+def _percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(int(len(sorted_values) * p), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+def rolling_summary() -> str:
+    """最近 ROLLING_WINDOW_SECONDS 秒的摘要，給 worker log 用。"""
+    with _recent_lock:
+        _trim_recent(time.time())
+        waits = sorted(x[1] for x in _recent)
+        totals = sorted(x[2] for x in _recent)
+    if not totals:
+        return f"近 {ROLLING_WINDOW_SECONDS} 秒沒有處理訂單"
+    return (
+        f"近 {ROLLING_WINDOW_SECONDS} 秒：{len(totals)} 筆，"
+        f"排隊 p50 {_percentile(waits, 0.5):.2f}s / p95 {_percentile(waits, 0.95):.2f}s，"
+        f"端到端 p50 {_percentile(totals, 0.5):.2f}s / p95 {_percentile(totals, 0.95):.2f}s"
+    )
+
+
+def _oldest_stream_age(r, stream: str) -> float:
+    """stream 第一筆的 id 前半段就是寫入時間（毫秒）。"""
+    first = r.xrange(stream, count=1)
+    if not first:
+        return 0.0
+    entry_id = first[0][0]
+    return max(now_ms() - int(entry_id.split("-")[0]), 0) / 1000
+
+
+def queue_gauges(r) -> dict:
+    """即時查佇列狀態（一次 pipeline）。"""
+    with r.pipeline(transaction=False) as pipe:
+        pipe.xlen(ORDER_STREAM)
+        pipe.llen(LEGACY_QUEUE_KEY)
+        pipe.zcard(RETRY_ZSET)
+        pipe.xlen(DEAD_LETTER_STREAM)
+        stream_len, legacy_len, delayed, dead = pipe.execute()
+
+    try:
+        pending = pending_count(r)
+    except Exception:
+        pending = 0  # consumer group 還沒建立
+
+    return {
+        "order_queue_stream_length": stream_len,
+        "order_queue_pending": pending,
+        "order_queue_legacy_length": legacy_len,
+        "order_queue_delayed": delayed,
+        "order_queue_dead_letter": dead,
+        "order_queue_oldest_age_seconds": _oldest_stream_age(r, ORDER_STREAM),
+    }
+
+
+def render_metrics(r) -> str:
+    lines = []
+    for name, value in queue_gauges(r).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    for hist in (queue_wait, processing, end_to_end):
+        lines.extend(hist.render())
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(r, port: int, host: str = "0.0.0.0"):
+    """背景 thread 開 HTTP server，GET /metrics 回傳 Prometheus 文字格式。"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render_metrics(r).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
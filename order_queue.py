@@ -0,0 +1,288 @@
+"""
+訂單處理佇列（Redis Streams + consumer group）。
+
+checkout 把訂單編號 XADD 到 ORDER_STREAM，worker 用 XREADGROUP 批次讀取，
+處理完才 XACK。worker 當掉的話，訊息會留在 pending list，
+其他 worker 用 XAUTOCLAIM 撿回來重做；一直失敗的訂單搬到 DEAD_LETTER_STREAM。
+supervisor 的 reaper 則是把卡住的訊息重新排回 stream 尾端（requeue_stuck()），
+重新排隊的次數記在訂單 hash 的 deliveries，超過 MAX_DELIVERIES 一樣送進 dead-letter。
+
+舊版的 list 佇列 queue:orders 仍然可能有人寫（舊版程式、shop_cli），
+drain_legacy_queue() 會把它原子地搬到 stream，可以不停機切換。
+
+副作用失敗（寄信、金流 callback）時用 schedule_retry() 排進延遲佇列
+RETRY_ZSET（score = 到期時間），指數退避；move_due_retries() 把到期的
+訂單批次搬回工作佇列，重試不會卡住主佇列，也不用 busy loop。
+"""
+import os
+import socket
+import time
+
+from redis.exceptions import ResponseError
+
+from key_schema import schema
+
+# 佇列的 key 跟訂單放在同一組（cluster 模式是 {shop}），Lua 裡同時動訂單和佇列才不會 CROSSSLOT
+LEGACY_QUEUE_KEY = schema.legacy_order_queue
+ORDER_STREAM = schema.order_stream
+ORDER_GROUP = "order-workers"
+DEAD_LETTER_STREAM = schema.dead_letter_stream
+RETRY_ZSET = schema.retry_zset
+
+MAX_DELIVERIES = 5  # 同一筆訂單被領取超過幾次就進 dead-letter
+CLAIM_MIN_IDLE_MS = 60_000  # pending 超過這麼久沒 ack，視為原本的 worker 掛了
+CONSUMER_MAX_IDLE_MS = 3_600_000  # consumer 超過這麼久沒讀、手上也沒 pending，視為已經不在了
+
+MAX_ATTEMPTS = 6  # 副作用最多試幾次，超過就進 dead-letter
+RETRY_BASE_SECONDS = 5  # 第一次重試等 5 秒，之後每次加倍
+RETRY_MAX_SECONDS = 600
+
+# 從 list 左邊一次拿最多 ARGV[1] 筆，逐筆 XADD 到 stream（同一個 script 內，不會掉單）
+_DRAIN_SCRIPT = """
+local ids = redis.call('LPOP', KEYS[1], ARGV[1])
+if not ids then
+  return 0
+end
+for _, id in ipairs(ids) do
+  redis.call('XADD', KEYS[2], '*', 'order_id', id)
+end
+return #ids
+"""
+
+
+# 記一次失敗並排下一次重試：
+#   KEYS = [order hash, 延遲佇列, dead-letter stream]
+#   ARGV = [order_id, 現在時間, base, max delay, max attempts, 錯誤訊息]
+# 回傳：延遲秒數；-1 = 已送進 dead-letter；-2 = 訂單不存在
+_RETRY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -2
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+redis.call('HSET', KEYS[1], 'last_error', ARGV[6])
+if attempts >= tonumber(ARGV[5]) then
+  redis.call('HDEL', KEYS[1], 'next_retry_at')
+  redis.call('XADD', KEYS[3], '*', 'order_id', ARGV[1], 'attempts', attempts,
+             'reason', ARGV[6])
+  return -1
+end
+local delay = math.min(tonumber(ARGV[3]) * 2 ^ (attempts - 1), tonumber(ARGV[4]))
+local due = tonumber(ARGV[2]) + delay
+redis.call('ZADD', KEYS[2], due, ARGV[1])
+-- requeued_at（毫秒）：監控的排隊等待從這次重新排隊算，不是從第一次下單算
+redis.call('HSET', KEYS[1], 'next_retry_at', math.floor(due), 'requeued_at', math.floor(due * 1000))
+return math.floor(delay)
+"""
+
+# reaper 把卡住的訊息重新排回 stream 尾端（新的 entry 被領取次數會從頭算，
+# 所以累計次數記在訂單 hash 的 deliveries，超過上限就進 dead-letter）：
+#   KEYS = [order hash, 工作 stream, dead-letter stream]
+#   ARGV = [order_id, 卡住的 entry id, group, 上限, consumer, 現在毫秒]
+# 原本的 entry 一律 XACK + XDEL。回傳：1 = 重新排隊；-1 = 已送進 dead-letter；0 = 訂單不存在
+_REQUEUE_SCRIPT = """
+redis.call('XACK', KEYS[2], ARGV[3], ARGV[2])
+redis.call('XDEL', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+local deliveries = redis.call('HINCRBY', KEYS[1], 'deliveries', 1)
+if deliveries > tonumber(ARGV[4]) then
+  redis.call('XADD', KEYS[3], '*', 'order_id', ARGV[1], 'source_id', ARGV[2],
+             'deliveries', deliveries, 'consumer', ARGV[5])
+  return -1
+end
+-- requeued_at（毫秒）：監控的排隊等待從這次重新排隊算
+redis.call('HSET', KEYS[1], 'requeued_at', ARGV[6])
+redis.call('XADD', KEYS[2], '*', 'order_id', ARGV[1])
+return 1
+"""
+
+# 把延遲佇列裡已到期的（最多 ARGV[2] 筆）搬到工作佇列
+#   KEYS = [延遲佇列, 工作佇列]；ARGV = [現在時間, 筆數, "stream" 或 "list"]
+_MOVE_DUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+  redis.call('ZREM', KEYS[1], id)
+  if ARGV[3] == 'list' then
+    redis.call('RPUSH', KEYS[2], id)
+  else
+    redis.call('XADD', KEYS[2], '*', 'order_id', id)
+  end
+end
+return #ids
+"""
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def enqueue_order(r, order_id: str):
+    """checkout 成功後呼叫，把訂單交給 worker。r 也可以是 pipeline。"""
+    return r.xadd(ORDER_STREAM, {"order_id": order_id})
+
+
+def ensure_group(r):
+    """建立 consumer group（stream 不存在就一起建立），已存在就略過。"""
+    try:
+        r.xgroup_create(ORDER_STREAM, ORDER_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def drain_legacy_queue(r, batch_size: int = 500) -> int:
+    """把 list 佇列裡的訂單搬到 stream，回傳搬了幾筆。"""
+    moved = 0
+    script = r.register_script(_DRAIN_SCRIPT)
+    while True:
+        n = int(script(keys=[LEGACY_QUEUE_KEY, ORDER_STREAM], args=[batch_size]) or 0)
+        moved += n
+        if n < batch_size:
+            return moved
+
+
+def read_batch(r, consumer: str, count: int, block_ms: int):
+    """讀取新訊息，回傳 [(entry_id, order_id), ...]。"""
+    resp = r.xreadgroup(
+        ORDER_GROUP, consumer, {ORDER_STREAM: ">"}, count=count, block=block_ms
+    )
+    entries = []
+    for _, messages in resp or []:
+        for entry_id, fields in messages:
+            entries.append((entry_id, fields.get("order_id")))
+    return entries
+
+
+def reclaim_stuck(r, consumer: str, count: int, min_idle_ms: int = CLAIM_MIN_IDLE_MS):
+    """
+    用 XAUTOCLAIM 撿回其他（或自己之前）沒 ack 的訊息。
+    回傳 (可以重做的 [(entry_id, order_id)], 已送進 dead-letter 的筆數)。
+    """
+    resp = r.xautoclaim(
+        ORDER_STREAM, ORDER_GROUP, consumer, min_idle_time=min_idle_ms, count=count
+    )
+    # redis-py 回傳 [next_start_id, [(id, fields), ...], deleted_ids]
+    messages = resp[1] if resp else []
+    messages = [(entry_id, fields) for entry_id, fields in messages if fields]
+    if not messages:
+        return [], 0
+
+    # 查每筆被領取過幾次（XAUTOCLAIM 本身會 +1）
+    with r.pipeline(transaction=False) as pipe:
+        for entry_id, _ in messages:
+            pipe.xpending_range(ORDER_STREAM, ORDER_GROUP, min=entry_id, max=entry_id, count=1)
+        pending_info = pipe.execute()
+
+    retry = []
+    dead = []
+    for (entry_id, fields), info in zip(messages, pending_info):
+        deliveries = info[0]["times_delivered"] if info else 0
+        if deliveries > MAX_DELIVERIES:
+            dead.append((entry_id, fields, deliveries))
+        else:
+            retry.append((entry_id, fields.get("order_id")))
+
+    if dead:
+        with r.pipeline(transaction=True) as pipe:
+            for entry_id, fields, deliveries in dead:
+                pipe.xadd(
+                    DEAD_LETTER_STREAM,
+                    {
+                        "order_id": fields.get("order_id", ""),
+                        "source_id": entry_id,
+                        "deliveries": deliveries,
+                        "consumer": consumer,
+                    },
+                )
+            ack_entries(pipe, [entry_id for entry_id, _, _ in dead])
+            pipe.execute()
+
+    return retry, len(dead)
+
+
+def requeue_stuck(r, consumer: str, count: int, min_idle_ms: int = CLAIM_MIN_IDLE_MS):
+    """
+    reaper 用：撿回卡住的訊息，重新排回 stream 尾端讓活著的 worker 去拿（原本的 entry 刪掉）。
+    同一筆訂單被重新排隊超過 MAX_DELIVERIES 次（例如每次都讓 worker 當掉）就送進 dead-letter。
+    script 直接對 r 執行（cluster 的 pipeline 不會先載入 script）。
+    回傳 (重新排隊的筆數, 已送進 dead-letter 的筆數)。
+    """
+    retry, dead = reclaim_stuck(r, consumer, count, min_idle_ms)
+    script = r.register_script(_REQUEUE_SCRIPT)
+    requeued = 0
+    for entry_id, order_id in retry:
+        result = script(
+            keys=[schema.order(order_id), ORDER_STREAM, DEAD_LETTER_STREAM],
+            args=[order_id, entry_id, ORDER_GROUP, MAX_DELIVERIES, consumer, int(time.time() * 1000)],
+        )
+        if result == 1:
+            requeued += 1
+        elif result == -1:
+            dead += 1
+    return requeued, dead
+
+
+def ack_entries(pipe, entry_ids):
+    """
+    在 pipeline 裡排入批次確認：XACK 之後順便 XDEL，讓 stream 不會一直長大。
+    呼叫端自己 execute，這樣可以跟其他寫入合併成一次往返。
+    """
+    if not entry_ids:
+        return
+    pipe.xack(ORDER_STREAM, ORDER_GROUP, *entry_ids)
+    pipe.xdel(ORDER_STREAM, *entry_ids)
+
+
+def pending_count(r) -> int:
+    """目前已被領取但還沒 ack 的訊息數。"""
+    info = r.xpending(ORDER_STREAM, ORDER_GROUP)
+    return int(info.get("pending", 0)) if info else 0
+
+
+def remove_idle_consumers(r, min_idle_ms: int = CONSUMER_MAX_IDLE_MS) -> int:
+    """
+    XGROUP DELCONSUMER 掉已經不在的 consumer（名字是 主機名-pid，worker 每重開一次就多一個）。
+    只刪手上沒有 pending 的，還有 pending 的要等 reclaim_stuck() 撿完下一輪再刪。
+    回傳刪了幾個。
+    """
+    removed = 0
+    for c in r.xinfo_consumers(ORDER_STREAM, ORDER_GROUP):
+        if int(c.get("pending", 0)) == 0 and int(c.get("idle", 0)) >= min_idle_ms:
+            r.xgroup_delconsumer(ORDER_STREAM, ORDER_GROUP, c["name"])
+            removed += 1
+    return removed
+
+
+def schedule_retry(r, order_id: str, error: str, pipe=None):
+    """
+    記錄一次失敗（order hash 的 attempts / last_error），排進延遲佇列。
+    有給 pipe 就只排指令（回傳值要從 pipe.execute() 拿）；cluster 的 pipeline 不會先載入 script，
+    REDIS_CLUSTER=1 時不要給 pipe。
+    回傳：下次重試要等幾秒；-1 = 已送進 dead-letter；-2 = 訂單不存在。
+    """
+    script = r.register_script(_RETRY_SCRIPT)
+    return script(
+        keys=[schema.order(order_id), RETRY_ZSET, DEAD_LETTER_STREAM],
+        args=[
+            order_id,
+            time.time(),
+            RETRY_BASE_SECONDS,
+            RETRY_MAX_SECONDS,
+            MAX_ATTEMPTS,
+            str(error)[:200],
+        ],
+        client=pipe or r,
+    )
+
+
+def move_due_retries(r, target: str = "stream", batch_size: int = 500) -> int:
+    """把到期的重試搬回工作佇列（target = "stream" 或 "list"），回傳搬了幾筆。"""
+    script = r.register_script(_MOVE_DUE_SCRIPT)
+    dest = ORDER_STREAM if target == "stream" else LEGACY_QUEUE_KEY
+    moved = 0
+    while True:
+        n = int(script(keys=[RETRY_ZSET, dest], args=[time.time(), batch_size, target]) or 0)
+        moved += n
+        if n < batch_size:
+            return moved
@@ -0,0 +1,204 @@
+"""
+訂單資料的共用工具（前台、後台、CLI、worker 都用同一份）。
+
+order:{id} 在結帳時就把「當下」的商品名稱 / 單價存成快照（lines），
+並預先算好 items_count / shipping_fee / grand_total，
+讀取訂單的地方直接用這些欄位，不用再回頭查 product:{pid}。
+"""
+import json
+
+from key_schema import schema
+from record_codec import pack_record, unpack_record
+
+SHIPPING_THRESHOLD = 150  # 滿多少免運
+SHIPPING_FEE = 60  # 未滿門檻的運費
+
+
+# 訂單 / 搶購訂單建立後不會再變動的欄位，打包成精簡格式（見 record_codec.py）
+ORDER_SPEC = {
+    "user_id": ("u", "str"),
+    "items": ("i", "json"),
+    "lines": ("l", "lines"),
+    "total": ("t", "int"),
+    "items_count": ("n", "int"),
+    "shipping_fee": ("f", "int"),
+    "grand_total": ("g", "int"),
+    "created_at": ("c", "str"),
+    "enqueued_at": ("q", "int"),
+}
+
+SECKILL_ORDER_SPEC = {
+    "product_id": ("p", "str"),
+    "user_id": ("u", "str"),
+    "created_at": ("c", "str"),
+}
+
+COMPACT_RECORDS = True  # False：新訂單照舊寫成一般 hash 欄位
+
+
+def pack_order(order_data: dict) -> dict:
+    """結帳寫入 order:{id} 前呼叫，回傳 HSET 用的 mapping。"""
+    if not COMPACT_RECORDS:
+        return order_data
+    return pack_record(order_data, ORDER_SPEC)
+
+
+def unpack_order(h: dict) -> dict:
+    """HGETALL order:{id} 之後呼叫，新舊格式都會回傳一般欄位的 dict。"""
+    return unpack_record(h, ORDER_SPEC)
+
+
+def pack_seckill_order(order_data: dict) -> dict:
+    if not COMPACT_RECORDS:
+        return order_data
+    return pack_record(order_data, SECKILL_ORDER_SPEC)
+
+
+def unpack_seckill_order(h: dict) -> dict:
+    return unpack_record(h, SECKILL_ORDER_SPEC)
+
+
+def calc_shipping_fee(items_total: int) -> int:
+    """運費規則：空的不收、滿門檻免運、未滿收固定運費。"""
+    if items_total == 0:
+        return 0
+    if items_total >= SHIPPING_THRESHOLD:
+        return 0
+    return SHIPPING_FEE
+
+
+def _to_int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_order_summary(cart_items: dict, products: dict) -> dict:
+    """
+    用購物車內容 {pid: qty} 和商品資料 {pid: product hash} 算出訂單快照。
+    回傳可以直接 HSET 進 order:{id} 的欄位（全部轉成字串）。
+    找不到商品資料的品項不列入（跟原本結帳計算總金額的規則一樣）。
+    """
+    lines = []
+    items_total = 0
+    items_count = 0
+
+    for pid, qty_str in cart_items.items():
+        info = products.get(pid)
+        if not info:
+            continue
+        price = _to_int(info.get("price", 0))
+        qty = _to_int(qty_str)
+        subtotal = price * qty
+
+        items_total += subtotal
+        items_count += qty
+        lines.append(
+            {
+                "id": pid,
+                "name": info.get("name", f"商品 {pid}"),
+                "price": price,
+                "qty": qty,
+                "subtotal": subtotal,
+            }
+        )
+
+    shipping_fee = calc_shipping_fee(items_total)
+
+    return {
+        "items": json.dumps(cart_items),
+        "lines": json.dumps(lines, ensure_ascii=False),
+        "total": str(items_total),
+        "items_count": str(items_count),
+        "shipping_fee": str(shipping_fee),
+        "grand_total": str(items_total + shipping_fee),
+    }
+
+
+def has_summary(od: dict) -> bool:
+    """這筆訂單是不是已經有快照欄位（新格式或已 backfill 過）。"""
+    return "lines" in od and "grand_total" in od
+
+
+def order_summary(od: dict) -> dict:
+    """
+    從訂單 hash 取出列表頁需要的數字（小計 / 運費 / 應付 / 件數）。
+    舊訂單沒有快照欄位時，用 total 和 items 現算（不查商品）。
+    """
+    items_total = _to_int(od.get("total", 0))
+
+    if has_summary(od):
+        return {
+            "items_total": items_total,
+            "shipping_fee": _to_int(od.get("shipping_fee", 0)),
+            "grand_total": _to_int(od.get("grand_total", items_total)),
+            "items_count": _to_int(od.get("items_count", 0)),
+        }
+
+    try:
+        items_dict = json.loads(od.get("items", "{}") or "{}")
+    except json.JSONDecodeError:
+        items_dict = {}
+    items_count = sum(int(q) for q in items_dict.values() if str(q).isdigit())
+    shipping_fee = calc_shipping_fee(items_total)
+
+    return {
+        "items_total": items_total,
+        "shipping_fee": shipping_fee,
+        "grand_total": items_total + shipping_fee,
+        "items_count": items_count,
+    }
+
+
+def order_line_pids(od: dict) -> list:
+    """沒有明細快照的舊訂單，要補查哪些商品；有快照的回傳空 list。"""
+    if "lines" in od:
+        return []
+    try:
+        return list(json.loads(od.get("items", "{}") or "{}").keys())
+    except json.JSONDecodeError:
+        return []
+
+
+def order_lines(od: dict, r=None, products=None) -> list:
+    """
+    取出訂單明細（每一行：id / name / price / qty / subtotal）。
+    有快照就直接用；舊訂單如果有給 r，就用一次 pipeline 把商品資料補齊
+    （async 版自己讀好商品，用 products={pid: hash} 傳進來）。
+    """
+    if "lines" in od:
+        try:
+            return json.loads(od.get("lines") or "[]")
+        except json.JSONDecodeError:
+            return []
+
+    try:
+        items_dict = json.loads(od.get("items", "{}") or "{}")
+    except json.JSONDecodeError:
+        items_dict = {}
+
+    pids = list(items_dict.keys())
+    if products is None:
+        products = {}
+        if r is not None and pids:
+            with r.pipeline(transaction=False) as pipe:
+                for pid in pids:
+                    pipe.hgetall(schema.product(pid))
+                products = dict(zip(pids, pipe.execute()))
+
+    lines = []
+    for pid, qty_str in items_dict.items():
+        info = products.get(pid) or {}
+        price = _to_int(info.get("price", 0))
+        qty = _to_int(qty_str)
+        lines.append(
+            {
+                "id": pid,
+                "name": info.get("name", f"商品 {pid}"),
+                "price": price,
+                "qty": qty,
+                "subtotal": price * qty,
+            }
+        )
+    return lines
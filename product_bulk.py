@@ -0,0 +1,415 @@
+"""
+商品的大量匯入 / 匯出（廠商型錄一次幾千個 SKU）。
+
+匯入：CSV（第一列是欄位名稱）或 JSONL（一行一個 JSON 物件），
+一邊讀一邊驗證，每 CHUNK_SIZE 筆用一個 Lua script 寫入 product:{pid} / stock:{pid}
+並更新 stats:products（查存在與否和寫入在同一個 script 裡，同時匯入也不會重複計數），
+不會把整個檔案讀進記憶體。驗證失敗的列收進 rejects 回報。
+上傳的檔案先用 check_utf8() 整個掃過一次，編碼不對就一筆都不寫。
+
+匯出：用 SCAN 分批讀商品（每批一個 pipeline），一筆一筆 yield 出去，
+給 Flask 的串流回應或 CLI 寫檔用。
+
+批次調整：一次改很多商品的價格 / 庫存（直接設定或增減），每一批用一個 Lua script
+原子套用，回傳每一列的結果。
+"""
+import codecs
+import csv
+import io
+import json
+
+from key_schema import key_id, schema
+from stats_counters import PRODUCTS_KEY
+
+CHUNK_SIZE = 300
+SCAN_COUNT = 500
+MAX_REJECTS = 200  # 最多保留幾筆錯誤明細（再多只算數量）
+CHECK_BLOCK_SIZE = 64 * 1024
+
+# 匯出 / CSV 範本的欄位順序
+PRODUCT_COLUMNS = ["id", "name", "price", "category", "stock", "net_weight", "origin", "mfg", "exp"]
+OPTIONAL_FIELDS = ["net_weight", "origin", "mfg", "exp"]
+
+
+def detect_format(filename: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".jsonl") or name.endswith(".ndjson"):
+        return "jsonl"
+    return "csv"
+
+
+def check_utf8(binary_stream):
+    """
+    整個檔案用 UTF-8 解碼一次（分塊讀，不放進記憶體），不是 UTF-8 就丟 UnicodeDecodeError。
+    檢查完把讀取位置移回開頭，接著就可以正式匯入。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        block = binary_stream.read(CHECK_BLOCK_SIZE)
+        if not block:
+            break
+        decoder.decode(block)
+    decoder.decode(b"", final=True)
+    binary_stream.seek(0)
+
+
+def iter_rows(text_stream, fmt: str = "csv"):
+    """
+    逐列讀取，yield (列號, dict 或 None, 錯誤訊息)。
+    CSV 的列號從 2 開始（第 1 列是欄位名稱）；JSONL 空行略過。
+    """
+    if fmt == "jsonl":
+        for line_no, line in enumerate(text_stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"JSON 格式錯誤：{e.msg}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "每一行必須是 JSON 物件"
+                continue
+            yield line_no, row, None
+        return
+
+    reader = csv.DictReader(text_stream)
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def _non_negative_int(value, label: str) -> int:
+    try:
+        n = int(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"{label}必須是整數")
+    if n < 0:
+        raise ValueError(f"{label}不可為負數")
+    return n
+
+
+def validate_row(row: dict):
+    """
+    驗證一列商品資料，回傳 (pid, product hash, stock)；不合格時丟 ValueError。
+    stock 沒填回傳 None（更新既有商品時不動庫存）。
+    """
+    pid = str(row.get("id") or "").strip()
+    name = str(row.get("name") or "").strip()
+    if not pid or not name:
+        raise ValueError("商品編號與名稱必填")
+    if ":" in pid:
+        raise ValueError("商品編號不可包含冒號")
+
+    data = {
+        "name": name,
+        "price": _non_negative_int(row.get("price", 0), "價格"),
+        "category": str(row.get("category") or "").strip() or "未分類",
+    }
+    for field in OPTIONAL_FIELDS:
+        val = str(row.get(field) or "").strip()
+        if val:
+            data[field] = val
+
+    stock_raw = row.get("stock")
+    stock = None
+    if stock_raw is not None and str(stock_raw).strip() != "":
+        stock = _non_negative_int(stock_raw, "庫存")
+
+    return pid, data, stock
+
+
+# 一批商品在一個 script 裡寫入（查存在與否、寫入、stats:products 計數是原子的）：
+#   KEYS = [stats:products, product:{pid1}, stock:{pid1}, product:{pid2}, stock:{pid2}, ...]
+#   ARGV = [create_only（1 / 0），之後每列兩個：庫存（空字串 = 不改）、商品欄位 JSON]
+# 回傳每列的結果：created / updated / exists（create_only 時已存在，沒寫入）
+_UPSERT_SCRIPT = """
+local create_only = ARGV[1] == '1'
+local n = #KEYS / 2
+local out = {}
+local created = 0
+for i = 1, n do
+  local pkey, skey = KEYS[2 * i], KEYS[2 * i + 1]
+  local stock, fields = ARGV[2 * i], cjson.decode(ARGV[2 * i + 1])
+  local existed = redis.call('EXISTS', pkey) == 1
+  if existed and create_only then
+    out[i] = 'exists'
+  else
+    for field, value in pairs(fields) do
+      redis.call('HSET', pkey, field, value)
+    end
+    if stock ~= '' then
+      redis.call('SET', skey, stock)
+    elseif not existed then
+      redis.call('SET', skey, 0)
+    end
+    if existed then
+      out[i] = 'updated'
+    else
+      out[i] = 'created'
+      created = created + 1
+    end
+  end
+end
+if created > 0 then
+  redis.call('INCRBY', KEYS[1], created)
+end
+return out
+"""
+
+
+def upsert_products(r, rows, create_only: bool = False):
+    """
+    rows = [(pid, product hash, stock 或 None)]，一個 script 寫完。
+    回傳每列的結果（created / updated / exists），順序跟 rows 一樣。
+    """
+    keys = [PRODUCTS_KEY]
+    args = ["1" if create_only else "0"]
+    for pid, data, stock in rows:
+        keys += [schema.product(pid), schema.stock(pid)]
+        args += [
+            "" if stock is None else str(stock),
+            json.dumps({k: str(v) for k, v in data.items()}, ensure_ascii=False),
+        ]
+    return r.register_script(_UPSERT_SCRIPT)(keys=keys, args=args)
+
+
+def _write_chunk(r, chunk, create_only: bool, result: dict):
+    """chunk = [(列號, pid, data, stock)]；整批一次 script 寫入。"""
+    statuses = upsert_products(r, [(pid, data, stock) for _, pid, data, stock in chunk], create_only)
+    for (line_no, pid, _, _), status in zip(chunk, statuses):
+        if status == "exists":
+            _reject(result, line_no, f"商品編號 {pid} 已存在", pid)
+        else:
+            result[status] += 1
+
+
+def _reject(result: dict, line_no: int, reason: str, pid: str = ""):
+    result["rejected"] += 1
+    if len(result["rejects"]) < MAX_REJECTS:
+        result["rejects"].append({"line": line_no, "id": pid, "reason": reason})
+
+
+def import_products(r, text_stream, fmt: str = "csv", create_only: bool = False, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    串流匯入商品。create_only=True 時已存在的商品編號會被退回，否則覆蓋更新。
+    回傳 {"created", "updated", "rejected", "rejects": [{"line", "id", "reason"}]}。
+    """
+    result = {"created": 0, "updated": 0, "rejected": 0, "rejects": []}
+    seen = set()
+    chunk = []
+
+    for line_no, row, error in iter_rows(text_stream, fmt):
+        if error:
+            _reject(result, line_no, error)
+            continue
+        try:
+            pid, data, stock = validate_row(row)
+        except ValueError as e:
+            _reject(result, line_no, str(e), str(row.get("id") or ""))
+            continue
+        if pid in seen:
+            _reject(result, line_no, f"商品編號 {pid} 在檔案中重複", pid)
+            continue
+        seen.add(pid)
+
+        chunk.append((line_no, pid, data, stock))
+        if len(chunk) >= chunk_size:
+            _write_chunk(r, chunk, create_only, result)
+            chunk = []
+
+    if chunk:
+        _write_chunk(r, chunk, create_only, result)
+
+    result["rejects"].sort(key=lambda rej: rej["line"])
+    return result
+
+
+def iter_products(r, scan_count: int = SCAN_COUNT):
+    """SCAN 分批讀出所有商品（含庫存），一筆一筆 yield dict。"""
+    batch = []
+    for key in r.scan_iter(schema.product("*"), count=scan_count):
+        batch.append(key_id(key))
+        if len(batch) >= scan_count:
+            yield from _load_products(r, batch)
+            batch = []
+    if batch:
+        yield from _load_products(r, batch)
+
+
+def _load_products(r, pids):
+    with r.pipeline(transaction=False) as pipe:
+        for pid in pids:
+            pipe.hgetall(schema.product(pid))
+            pipe.get(schema.stock(pid))
+        results = pipe.execute()
+
+    for i, pid in enumerate(pids):
+        info, stock = results[2 * i], results[2 * i + 1]
+        if not info:
+            continue
+        yield {
+            "id": pid,
+            **{col: info.get(col, "") for col in PRODUCT_COLUMNS if col not in ("id", "stock")},
+            "stock": int(stock or 0),
+        }
+
+
+def export_csv(r):
+    """產生 CSV 文字（一次一列），第一列是欄位名稱。"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=PRODUCT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    yield buf.getvalue()
+    for product in iter_products(r):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerow(product)
+        yield buf.getvalue()
+
+
+def export_jsonl(r):
+    """產生 JSONL 文字（一行一個商品）。"""
+    for product in iter_products(r):
+        yield json.dumps(product, ensure_ascii=False) + "\n"
+
+
+# ================== 批次調整價格 / 庫存 ==================
+
+ADJUST_BATCH_SIZE = 200
+
+# 一批調整在一個 script 裡完成（對其他 client 來說是原子的）：
+#   KEYS = [product:{pid1}, stock:{pid1}, product:{pid2}, stock:{pid2}, ...]
+#   ARGV = 每列三個：price（空字串 = 不改）、stock 模式（set / delta / 空字串）、stock 值
+# 先檢查每一列（商品存在、調整後庫存不為負），再寫入通過的列；
+# 回傳每列 [結果, 價格, 庫存]
+_ADJUST_SCRIPT = """
+local n = #KEYS / 2
+local plan = {}
+for i = 1, n do
+  local pkey, skey = KEYS[2 * i - 1], KEYS[2 * i]
+  local price, mode, value = ARGV[3 * i - 2], ARGV[3 * i - 1], ARGV[3 * i]
+  if redis.call('EXISTS', pkey) == 0 then
+    plan[i] = {'not_found'}
+  else
+    local stock = tonumber(redis.call('GET', skey) or '0')
+    if mode == 'set' then
+      stock = tonumber(value)
+    elseif mode == 'delta' then
+      stock = stock + tonumber(value)
+    end
+    if stock < 0 then
+      plan[i] = {'negative_stock'}
+    else
+      plan[i] = {'ok', price, mode, stock}
+    end
+  end
+end
+
+local out = {}
+for i = 1, n do
+  local p = plan[i]
+  local pkey, skey = KEYS[2 * i - 1], KEYS[2 * i]
+  if p[1] == 'ok' then
+    if p[2] ~= '' then
+      redis.call('HSET', pkey, 'price', p[2])
+    end
+    if p[3] ~= '' then
+      redis.call('SET', skey, p[4])
+    end
+    table.insert(out, {'ok', redis.call('HGET', pkey, 'price') or '0', tostring(p[4])})
+  else
+    table.insert(out, {p[1], '', ''})
+  end
+end
+return out
+"""
+
+ADJUST_ERRORS = {
+    "not_found": "找不到商品",
+    "negative_stock": "調整後庫存會小於 0",
+}
+
+
+def parse_adjustment(change: dict):
+    """
+    把一列調整 {pid, price, stock 或 stock_delta} 轉成 script 參數 (pid, price, mode, value)。
+    price / stock 空白代表不改；不合格時丟 ValueError。
+    """
+    pid = str(change.get("pid") or change.get("id") or "").strip()
+    if not pid:
+        raise ValueError("缺少商品編號")
+
+    price = str(change.get("price") if change.get("price") is not None else "").strip()
+    if price:
+        price = str(_non_negative_int(price, "價格"))
+
+    stock = str(change.get("stock") if change.get("stock") is not None else "").strip()
+    delta = str(change.get("stock_delta") if change.get("stock_delta") is not None else "").strip()
+    if stock and delta:
+        raise ValueError("庫存請擇一：直接設定或增減")
+    if stock:
+        mode, value = "set", str(_non_negative_int(stock, "庫存"))
+    elif delta:
+        try:
+            mode, value = "delta", str(int(delta))
+        except ValueError:
+            raise ValueError("庫存增減必須是整數")
+    else:
+        mode, value = "", ""
+
+    if not price and not mode:
+        raise ValueError("沒有要調整的欄位")
+    return pid, price, mode, value
+
+
+def apply_adjustments(r, changes, batch_size: int = ADJUST_BATCH_SIZE) -> dict:
+    """
+    批次調整價格 / 庫存：每 batch_size 列一次 script 呼叫。
+    回傳 {"results": [{"pid", "ok", "error", "price", "stock"}], "applied", "failed"}，
+    results 順序跟 changes 一樣。
+    """
+    script = r.register_script(_ADJUST_SCRIPT)
+    results = []
+    pending = []  # (results 裡的位置, pid, price, mode, value)
+    seen = set()
+
+    def flush():
+        keys = []
+        args = []
+        for _, pid, price, mode, value in pending:
+            keys += [schema.product(pid), schema.stock(pid)]
+            args += [price, mode, value]
+        out = script(keys=keys, args=args)
+        for (idx, pid, _, _, _), (status, price, stock) in zip(pending, out):
+            if status == "ok":
+                results[idx].update(ok=True, price=int(price), stock=int(stock))
+            else:
+                results[idx]["error"] = ADJUST_ERRORS.get(status, status)
+        pending.clear()
+
+    for change in changes:
+        row = {"pid": str(change.get("pid") or change.get("id") or ""), "ok": False, "error": None}
+        results.append(row)
+        try:
+            pid, price, mode, value = parse_adjustment(change)
+        except ValueError as e:
+            row["error"] = str(e)
+            continue
+        if pid in seen:
+            # 同一批裡重複的話，檢查時看到的庫存會是舊的，直接退回
+            row["error"] = "商品編號重複"
+            continue
+        seen.add(pid)
+        pending.append((len(results) - 1, pid, price, mode, value))
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+
+    applied = sum(1 for row in results if row["ok"])
+    return {
+        "results": results,
+        "applied": applied,
+        "failed": len(results) - applied,
+    }
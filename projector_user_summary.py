@@ -0,0 +1,120 @@
+"""
+使用者訂單摘要的 projector：讀 stream:orders / stream:seckill，維護 user:{uid}:summary。
+
+    python projector_user_summary.py              # 一般執行（可以開好幾個，同一個 consumer group 分工）
+    python projector_user_summary.py --rebuild    # 全部重算（先停掉其他 projector）
+
+每個事件的套用和 XACK 在同一個 Lua script 裡（見 user_summary.py），
+重開、撿回別人沒 ack 的事件都不會重複計算。
+"""
+import argparse
+import signal
+import threading
+import time
+from datetime import datetime
+
+from config_redis import get_redis_client
+from order_queue import CLAIM_MIN_IDLE_MS, default_consumer_name
+from user_summary import (
+    SUMMARY_GROUP,
+    SUMMARY_STREAMS,
+    apply_events,
+    ensure_summary_group,
+    rebuild,
+)
+
+r = get_redis_client("worker")
+
+BATCH_SIZE = 200
+BLOCK_MS = 2000
+RECLAIM_INTERVAL = 30
+
+# 由 supervisor.py 設成共享計數器，用來彙總處理量
+processed_counter = None
+
+shutdown_event = threading.Event()
+
+
+def _count_processed(n: int):
+    if processed_counter is not None and n:
+        with processed_counter.get_lock():
+            processed_counter.value += n
+
+
+def reclaim(consumer: str) -> int:
+    """把閒置太久（原本的 projector 掛了）的 pending 事件撿回來套用。"""
+    applied = 0
+    for stream in SUMMARY_STREAMS:
+        start = "0-0"
+        while True:
+            resp = r.xautoclaim(
+                stream, SUMMARY_GROUP, consumer,
+                min_idle_time=CLAIM_MIN_IDLE_MS, start_id=start, count=BATCH_SIZE,
+            )
+            start, messages = resp[0], resp[1]
+            applied += apply_events(r, stream, messages)
+            if not messages or start == "0-0":
+                break
+    return applied
+
+
+def run(consumer: str, batch_size: int):
+    ensure_summary_group(r)
+    print(f"[{datetime.now()}] projector {consumer} 啟動，讀取 {', '.join(SUMMARY_STREAMS)}")
+
+    # 先把自己上次沒 ack 完的事件做完（重開的情況），再開始讀新的
+    streams = {stream: "0" for stream in SUMMARY_STREAMS}
+    while True:
+        resp = r.xreadgroup(SUMMARY_GROUP, consumer, streams, count=batch_size)
+        leftovers = [(stream, entries) for stream, entries in resp or [] if entries]
+        if not leftovers:
+            break
+        for stream, entries in leftovers:
+            _count_processed(apply_events(r, stream, entries))
+
+    last_reclaim = 0.0
+    streams = {stream: ">" for stream in SUMMARY_STREAMS}
+    while not shutdown_event.is_set():
+        if time.monotonic() - last_reclaim >= RECLAIM_INTERVAL:
+            _count_processed(reclaim(consumer))
+            last_reclaim = time.monotonic()
+
+        try:
+            resp = r.xreadgroup(SUMMARY_GROUP, consumer, streams, count=batch_size, block=BLOCK_MS)
+        except Exception as e:
+            print(f"[{datetime.now()}] 讀取事件失敗，稍後重試：{e!r}")
+            shutdown_event.wait(1)
+            continue
+
+        for stream, entries in resp or []:
+            applied = apply_events(r, stream, entries)
+            _count_processed(applied)
+            if applied:
+                print(f"[{datetime.now()}] {stream}：套用 {applied} 筆")
+
+    print(f"[{datetime.now()}] projector {consumer} 已停止。")
+
+
+def _request_shutdown(signum, frame):
+    print(f"\n[{datetime.now()}] 收到結束訊號，處理完這一批就停止 ...")
+    shutdown_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用者訂單摘要 projector")
+    parser.add_argument("--consumer", default=default_consumer_name(), help="consumer 名稱（預設 主機名-pid）")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="一次讀幾筆事件")
+    parser.add_argument("--rebuild", action="store_true", help="刪掉所有摘要並從頭重算")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        removed = rebuild(r)
+        print(f"已清除 {removed} 筆摘要，consumer group 已重設，接著從頭重算 ...")
+
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    signal.signal(signal.SIGINT, _request_shutdown)
+    run(args.consumer, args.batch)
+
+
+if __name__ == "__main__":
+    main()
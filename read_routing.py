@@ -0,0 +1,229 @@
+"""
+讀寫分流：唯讀的頁面（商品列表、個人頁、訂單明細、後台列表 / 報表）讀 replica，
+寫入和交易（結帳、搶購、WATCH / MULTI、Lua）一律走主節點。
+
+    REDIS_REPLICA_URLS              replica 位址，逗號分隔；沒設就完全不分流（讀寫都走主節點）
+    REDIS_REPLICA_MAX_LAG_BYTES     replica 落後主節點超過多少 byte 就先不讀它（預設 1 MB）
+    REDIS_REPLICA_CHECK_INTERVAL    每隔幾秒檢查一次 replica 狀態（預設 5 秒）
+    REDIS_READ_YOUR_WRITES_SECONDS  使用者送出寫入後，幾秒內他的讀取固定走主節點（預設 5 秒）
+
+replica 的狀態由背景 thread 定期用 INFO replication 檢查（不佔用 request 的時間）：
+連線斷了、主從同步斷了、落後太多都會暫時排除，下次檢查正常再放回來。
+全部 replica 都不能用時自動改讀主節點。
+讀的當下 replica 連不上 / 逾時，同一個指令（或整個 pipeline）會在主節點上重跑一次；
+replica 的連線不重試、連線逾時很短（見 config_redis.py），所以換主節點前不會卡很久。
+
+config_redis.get_read_client() 回傳 ReadClient；用法跟一般 client 一樣，
+只是 pipeline 只能放讀取指令（不能 WATCH），scan_iter 中途斷線不會換節點。
+"""
+import itertools
+import os
+import threading
+import time
+
+from redis.exceptions import ConnectionError, ReadOnlyError, TimeoutError
+
+DEFAULT_MAX_LAG_BYTES = 1024 * 1024
+DEFAULT_CHECK_INTERVAL = 5.0
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5.0
+
+PIN_SESSION_KEY = "_read_primary_until"
+
+# 這些錯誤代表「這台 replica 現在不能用」，改去主節點重跑
+_FALLBACK_ERRORS = (ConnectionError, TimeoutError, ReadOnlyError)
+
+
+def replica_urls() -> list:
+    return [u.strip() for u in os.environ.get("REDIS_REPLICA_URLS", "").split(",") if u.strip()]
+
+
+class ReplicaRouter:
+    """挑一台健康的 replica 來讀；狀態定期檢查，出錯就先排除。"""
+
+    def __init__(self, primary, replicas: dict, max_lag_bytes: int = None, check_interval: float = None):
+        self.primary = primary
+        self.replicas = replicas  # {名稱（url）: client}
+        self.max_lag_bytes = int(
+            max_lag_bytes if max_lag_bytes is not None
+            else os.environ.get("REDIS_REPLICA_MAX_LAG_BYTES", DEFAULT_MAX_LAG_BYTES)
+        )
+        self.check_interval = float(
+            check_interval if check_interval is not None
+            else os.environ.get("REDIS_REPLICA_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL)
+        )
+        self.healthy = list(replicas)
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        self._rr = itertools.count()
+        self._checker = None
+        self._checker_pid = None
+        self._stopped = threading.Event()
+
+    def _replica_ok(self, client, primary_offset) -> bool:
+        info = client.info("replication")
+        if info.get("role") != "slave" or info.get("master_link_status") != "up":
+            return False
+        if primary_offset is None:
+            return True
+        return primary_offset - int(info.get("slave_repl_offset", 0)) <= self.max_lag_bytes
+
+    def check(self):
+        """檢查所有 replica（主節點的 offset 讀不到就只看同步連線是不是 up）。"""
+        try:
+            primary_offset = int(self.primary.info("replication").get("master_repl_offset", 0))
+        except Exception:
+            primary_offset = None
+
+        healthy = []
+        for name, client in self.replicas.items():
+            try:
+                if self._replica_ok(client, primary_offset):
+                    healthy.append(name)
+            except Exception:
+                continue
+        self.healthy = healthy
+        self.last_check = time.monotonic()
+
+    def _check_loop(self):
+        while not self._stopped.is_set():
+            try:
+                self.check()
+            except Exception:
+                pass
+            self._stopped.wait(self.check_interval)
+
+    def _ensure_checker(self):
+        """
+        第一次挑節點時才啟動背景檢查 thread；gunicorn --preload 之類 fork 出來的 process
+        不會帶著 thread，所以用 pid 判斷要不要在這個 process 重開一個。
+        """
+        pid = os.getpid()
+        if self._checker_pid == pid:
+            return
+        with self.lock:
+            if self._checker_pid == pid:
+                return
+            self._checker = threading.Thread(target=self._check_loop, name="replica-check", daemon=True)
+            self._checker.start()
+            self._checker_pid = pid
+
+    def stop(self):
+        self._stopped.set()
+
+    def mark_down(self, name: str):
+        self.healthy = [n for n in self.healthy if n != name]
+
+    def pick(self):
+        """回傳 (名稱, client)；沒有健康的 replica 時回傳 (None, 主節點)。"""
+        self._ensure_checker()
+        healthy = self.healthy
+        if not healthy:
+            return None, self.primary
+        name = healthy[next(self._rr) % len(healthy)]
+        return name, self.replicas[name]
+
+    def run(self, fn):
+        """fn(client) 先在 replica 上跑，replica 不能用就換主節點重跑。"""
+        name, client = self.pick()
+        if name is None:
+            return fn(client)
+        try:
+            return fn(client)
+        except _FALLBACK_ERRORS:
+            self.mark_down(name)
+            return fn(self.primary)
+
+
+class _ReadPipeline:
+    """先把指令記下來，execute 時才挑節點重放，這樣整批都能換到主節點重跑。"""
+
+    def __init__(self, router: ReplicaRouter, transaction: bool):
+        self.router = router
+        self.transaction = transaction
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def __len__(self):
+        return len(self.calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.calls = []
+
+    def _replay(self, client):
+        with client.pipeline(transaction=self.transaction) as pipe:
+            for name, args, kwargs in self.calls:
+                getattr(pipe, name)(*args, **kwargs)
+            return pipe.execute()
+
+    def execute(self):
+        calls = self.calls
+        try:
+            return self.router.run(self._replay) if calls else []
+        finally:
+            self.calls = []
+
+
+class ReadClient:
+    """看起來像 redis.Redis 的讀取用 client，每個指令交給 ReplicaRouter 挑節點。"""
+
+    def __init__(self, router: ReplicaRouter):
+        self.router = router
+        self.primary = router.primary
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return _ReadPipeline(self.router, transaction)
+
+    def scan_iter(self, *args, **kwargs):
+        return self.router.pick()[1].scan_iter(*args, **kwargs)
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            return self.router.run(lambda client: getattr(client, name)(*args, **kwargs))
+
+        return call
+
+
+# ================== Flask：read-your-writes ==================
+
+def _pin_seconds() -> float:
+    return float(os.environ.get("REDIS_READ_YOUR_WRITES_SECONDS", DEFAULT_READ_YOUR_WRITES_SECONDS))
+
+
+def install_read_your_writes(app):
+    """
+    這個使用者送出任何寫入（POST）之後，接下來幾秒他自己的讀取都走主節點，
+    例如結帳完跳回購物車 / 個人頁時，一定看得到剛建立的訂單。記在 session 裡，不多一次 Redis 往返。
+    """
+    from flask import request, session
+
+    @app.after_request
+    def _pin_after_write(response):
+        if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 500:
+            session[PIN_SESSION_KEY] = time.time() + _pin_seconds()
+        return response
+
+
+def reader_for_request(primary, reader):
+    """
+    這個 request 該用哪個 client 讀：
+    寫入的 request 本身（不是 GET / HEAD）和剛寫過的使用者回傳 primary，其他人回傳 reader。
+    """
+    from flask import request, session
+
+    if reader is primary:
+        return primary
+    # pin 要等 response 回去才記進 session，同一個 request 裡寫完馬上讀的要直接走主節點
+    if request.method not in ("GET", "HEAD"):
+        return primary
+    if session.get(PIN_SESSION_KEY, 0) > time.time():
+        return primary
+    return reader
@@ -0,0 +1,137 @@
+"""
+精簡的紀錄編碼：把一筆 hash 裡「建立後就不會再改」的欄位，
+用短欄位代號打包成一個二進位欄位 z（有 msgpack 就用 msgpack，沒有就用精簡 JSON），
+超過一定大小再 zlib 壓縮。
+
+會被修改的欄位（例如 status / processed_at）照舊用一般 hash 欄位存，
+這樣 HSET 改狀態的地方完全不用動。
+
+讀取時 unpack_record() 同時支援舊格式（沒有 z 欄位）和新格式。
+
+注意：Redis client 使用 decode_responses=True，二進位內容靠
+encoding_errors="surrogateescape"（見 config_redis.py）才能原封不動地讀回來。
+"""
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # 沒裝 msgpack 也能用，只是改用 JSON
+    msgpack = None
+
+PACKED_FIELD = "z"
+COMPRESS_THRESHOLD = 256  # 超過這個 byte 數才壓縮
+
+# 打包後第一個 byte 代表格式
+_FMT_MSGPACK = b"M"
+_FMT_JSON = b"J"
+_FMT_ZLIB = b"Z"
+
+
+def _dumps(obj) -> bytes:
+    if msgpack is not None:
+        return _FMT_MSGPACK + msgpack.packb(obj, use_bin_type=True)
+    return _FMT_JSON + json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _loads(raw: bytes):
+    fmt, body = raw[:1], raw[1:]
+    if fmt == _FMT_ZLIB:
+        return _loads(zlib.decompress(body))
+    if fmt == _FMT_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("這筆資料用 msgpack 打包，請先 pip install msgpack")
+        return msgpack.unpackb(body, raw=False)
+    if fmt == _FMT_JSON:
+        return json.loads(body.decode("utf-8"))
+    raise ValueError(f"不認得的紀錄格式：{fmt!r}")
+
+
+def _to_bytes(value) -> bytes:
+    """decode_responses=True 讀回來的是 str，轉回原本的 bytes。"""
+    if isinstance(value, bytes):
+        return value
+    return value.encode("utf-8", "surrogateescape")
+
+
+def _pack_value(kind: str, value):
+    if kind == "int":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+    if kind == "json":
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return value
+    if kind == "lines":
+        # [{"id","name","price","qty","subtotal"}] -> [[id, name, price, qty]]
+        try:
+            rows = json.loads(value)
+            return [[x["id"], x["name"], x["price"], x["qty"]] for x in rows]
+        except (TypeError, ValueError, KeyError):
+            return value
+    return value
+
+
+def _unpack_value(kind: str, value) -> str:
+    if kind == "json" and not isinstance(value, str):
+        return json.dumps(value)
+    if kind == "lines" and not isinstance(value, str):
+        rows = [
+            {"id": pid, "name": name, "price": price, "qty": qty, "subtotal": price * qty}
+            for pid, name, price, qty in value
+        ]
+        return json.dumps(rows, ensure_ascii=False)
+    return str(value)
+
+
+def pack_record(fields: dict, spec: dict) -> dict:
+    """
+    spec: {欄位名稱: (短代號, 型別)}，型別是 "str" / "int" / "json" / "lines"。
+    spec 裡的欄位打包進 z，其餘欄位原樣保留，回傳可以直接 HSET 的 mapping。
+    """
+    packed = {}
+    plain = {}
+    for name, value in fields.items():
+        if name in spec:
+            tag, kind = spec[name]
+            packed[tag] = _pack_value(kind, value)
+        else:
+            plain[name] = value
+
+    raw = _dumps(packed)
+    if len(raw) > COMPRESS_THRESHOLD:
+        compressed = _FMT_ZLIB + zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            raw = compressed
+
+    plain[PACKED_FIELD] = raw
+    return plain
+
+
+def unpack_record(h: dict, spec: dict) -> dict:
+    """把 HGETALL 的結果還原成一般欄位；舊格式（沒有 z）原樣回傳。"""
+    if not h or PACKED_FIELD not in h:
+        return h
+
+    by_tag = {tag: (name, kind) for name, (tag, kind) in spec.items()}
+    data = _loads(_to_bytes(h[PACKED_FIELD]))
+
+    out = {}
+    for tag, value in data.items():
+        name, kind = by_tag.get(tag, (tag, "str"))
+        out[name] = _unpack_value(kind, value)
+
+    # 一般欄位（狀態等）以 hash 上的值為準
+    for name, value in h.items():
+        if name != PACKED_FIELD:
+            out[name] = value
+    return out
+
+
+def is_packed(h: dict) -> bool:
+    return bool(h) and PACKED_FIELD in h
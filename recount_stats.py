@@ -0,0 +1,94 @@
+"""
+重算後台首頁的統計計數器（stats:*）。
+
+用 SCAN 分批掃描，不會像 KEYS 一樣卡住 Redis；計數器跑掉或第一次上線時執行一次即可。
+（重算期間如果還有新訂單進來，可能有幾筆誤差，離峰時執行最準。）
+"""
+from config_redis import get_redis_client
+from key_schema import schema
+from order_records import order_summary, unpack_order
+from stats_counters import (
+    ORDERS_KEY,
+    PRODUCTS_KEY,
+    USERS_KEY,
+    day_orders_key,
+    day_revenue_key,
+)
+
+r = get_redis_client()
+
+SCAN_COUNT = 500
+
+
+def count_keys(pattern, keep=None):
+    total = 0
+    for key in r.scan_iter(pattern, count=SCAN_COUNT):
+        if keep is None or keep(key):
+            total += 1
+    return total
+
+
+def scan_orders_by_day():
+    """掃過所有訂單，依建立日期統計筆數與營收。"""
+    per_day = {}
+    order_count = 0
+
+    def flush(keys):
+        nonlocal order_count
+        with r.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            for h in pipe.execute():
+                od = unpack_order(h)
+                if not od:
+                    continue
+                order_count += 1
+                day = (od.get("created_at") or "")[:10]
+                if not day:
+                    continue
+                count, revenue = per_day.get(day, (0, 0))
+                per_day[day] = (count + 1, revenue + order_summary(od)["grand_total"])
+
+    batch = []
+    for key in r.scan_iter(schema.order("*"), count=SCAN_COUNT):
+        batch.append(key)
+        if len(batch) >= SCAN_COUNT:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return order_count, per_day
+
+
+def main():
+    print("重新計算後台統計 ...")
+
+    product_count = count_keys(schema.product("*"))
+    # user:u_xxx 是帳號本身；user:u_xxx:orders 之類的是清單，不算
+    user_count = count_keys(schema.user("u_*"), keep=lambda k: k.count(":") == 1)
+    order_count, per_day = scan_orders_by_day()
+
+    old_day_keys = list(r.scan_iter(day_orders_key("*"), count=SCAN_COUNT))
+    old_day_keys += list(r.scan_iter(day_revenue_key("*"), count=SCAN_COUNT))
+
+    with r.pipeline() as pipe:
+        if old_day_keys:
+            pipe.delete(*old_day_keys)
+        pipe.mset(
+            {
+                PRODUCTS_KEY: product_count,
+                ORDERS_KEY: order_count,
+                USERS_KEY: user_count,
+            }
+        )
+        for day, (count, revenue) in per_day.items():
+            pipe.set(day_orders_key(day), count)
+            pipe.set(day_revenue_key(day), revenue)
+        pipe.execute()
+
+    print(f"商品 {product_count}、訂單 {order_count}、用戶 {user_count}，共 {len(per_day)} 天的每日統計")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+一個 request 內的 Redis 讀取快取（掛在 Flask 的 g 上，request 結束就丟掉）。
+
+同一個 request 裡常常重複讀同一把 key（結帳先讀商品算金額、庫存不足時又讀一次；
+購物車頁讀過的商品 / 庫存，下一個動作又讀一次），這裡只快取三種資料：
+
+    product:{pid}   hash
+    stock:{pid}     字串（整數）
+    user:{uid}      hash
+
+寫入的地方要自己呼叫 invalidate_*()（write-through 失效），之後同一個 request 再讀就會回 Redis。
+WATCH / MULTI 裡要讀「最新值」的地方（例如結帳檢查庫存）不要用這裡，直接讀 Redis。
+
+讀的時候用呼叫端給的 client（主節點或 replica 的 ReadClient 都可以），快取本身不綁 client。
+
+install(app) 之後，每個 request 結束會在 debug log 印出命中 / 未命中次數。
+"""
+from flask import g, has_request_context
+
+from key_schema import schema
+
+_MISSING = object()
+
+
+class RequestCache:
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        return _MISSING
+
+    def hgetall(self, r, key: str) -> dict:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            value = self.values[key] = r.hgetall(key) or {}
+        return dict(value)  # 回傳副本，呼叫端改了也不會污染快取
+
+    def get(self, r, key: str):
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            value = self.values[key] = r.get(key)
+        return value
+
+    def prefetch(self, r, hash_keys=(), string_keys=()):
+        """沒在快取裡的 key 用一個 pipeline 一次讀進來。"""
+        hash_keys = [k for k in dict.fromkeys(hash_keys) if k not in self.values]
+        string_keys = [k for k in dict.fromkeys(string_keys) if k not in self.values]
+        if not hash_keys and not string_keys:
+            return
+        with r.pipeline(transaction=False) as pipe:
+            for key in hash_keys:
+                pipe.hgetall(key)
+            for key in string_keys:
+                pipe.get(key)
+            results = pipe.execute()
+        for key, value in zip(hash_keys, results):
+            self.values[key] = value or {}
+        for key, value in zip(string_keys, results[len(hash_keys):]):
+            self.values[key] = value
+        self.misses += len(hash_keys) + len(string_keys)
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+def request_cache() -> RequestCache:
+    """目前 request 的快取；不在 request 裡（CLI、背景 thread）就給一個用完即丟的。"""
+    if not has_request_context():
+        return RequestCache()
+    cache = g.get("_redis_cache")
+    if cache is None:
+        cache = g._redis_cache = RequestCache()
+    return cache
+
+
+def get_product(r, pid: str) -> dict:
+    return request_cache().hgetall(r, schema.product(pid))
+
+
+def get_stock(r, pid: str) -> int:
+    return int(request_cache().get(r, schema.stock(pid)) or 0)
+
+
+def get_user(r, user_id: str) -> dict:
+    return request_cache().hgetall(r, schema.user(user_id))
+
+
+def prefetch_products(r, pids, with_stock: bool = True):
+    """列表頁用：一次 pipeline 把這些商品（和庫存）讀進快取。"""
+    pids = list(pids)
+    request_cache().prefetch(
+        r,
+        hash_keys=[schema.product(pid) for pid in pids],
+        string_keys=[schema.stock(pid) for pid in pids] if with_stock else (),
+    )
+
+
+def invalidate_product(r, *pids):
+    request_cache().invalidate(*[schema.product(pid) for pid in pids])
+
+
+def invalidate_stock(r, *pids):
+    request_cache().invalidate(*[schema.stock(pid) for pid in pids])
+
+
+def invalidate_user(r, user_id: str):
+    request_cache().invalidate(schema.user(user_id))
+
+
+def install(app):
+    """每個 request 結束時把命中次數寫到 debug log。"""
+
+    @app.teardown_request
+    def _log_request_cache(exc=None):
+        cache = g.pop("_redis_cache", None)
+        if cache is not None and (cache.hits or cache.misses):
+            app.logger.debug(
+                "request cache: %d hits / %d misses (%d keys)",
+                cache.hits,
+                cache.misses,
+                len(cache.values),
+            )
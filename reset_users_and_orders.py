@@ -1,4 +1,6 @@
 from config_redis import get_redis_client
+from key_schema import schema
+from stats_counters import ORDERS_KEY, USERS_KEY
 
 r = get_redis_client()
 
@@ -17,13 +19,22 @@ if __name__ == "__main__":
 
     # 訂單相關
     delete_by_pattern("order:*")
-    delete_by_pattern("user:*:orders")
-    delete_by_pattern("queue:orders")
+    delete_by_pattern("orders:*")
+    delete_by_pattern(schema.user_orders("*"))
+    delete_by_pattern(schema.legacy_order_queue)
+    delete_by_pattern(schema.legacy_order_queue + ":*")
 
     # 搶購紀錄（如果也想清）
-    delete_by_pattern("seckill:order:*")
-    delete_by_pattern("user:*:seckill_orders")
-    delete_by_pattern("seckill:users:*")
-    delete_by_pattern("seckill:stock:*")
+    delete_by_pattern(schema.seckill_order("*"))
+    delete_by_pattern(schema.user_seckill_orders("*"))
+    delete_by_pattern(schema.seckill_users("*"))
+    delete_by_pattern(schema.seckill_stock("*"))
+
+    # 後台統計：用戶 / 訂單都清空了
+    r.delete(USERS_KEY, ORDERS_KEY)
+    delete_by_pattern(schema.stats_day_orders("*"))
+    delete_by_pattern(schema.stats_day_revenue("*"))
+    # 銷售報表彙總
+    delete_by_pattern("sales:*")
 
     print("清除完成！")
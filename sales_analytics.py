@@ -0,0 +1,145 @@
+"""
+銷售報表用的彙總資料，在結帳 / 搶購成功的同一個交易裡順便累加，
+報表頁直接讀這些彙總，不用再掃 order:*。
+
+    sales:day:{YYYY-MM-DD}           hash：orders / revenue / items_revenue / shipping / units / seckill
+    sales:category:{YYYY-MM-DD}      hash：rev:{分類} = 商品金額，qty:{分類} = 件數
+    sales:products:units             sorted set：商品累計賣出件數（member = 商品編號）
+    sales:products:revenue           sorted set：商品累計商品金額
+
+搶購訂單本身沒有金額，只算件數（units / seckill）。
+第一次上線或數字跑掉時執行 backfill_sales.py 重算。
+"""
+import json
+from datetime import datetime, timedelta
+
+from key_schema import schema
+from stats_counters import today_tw
+
+PRODUCT_UNITS_KEY = schema.sales_product_units
+PRODUCT_REVENUE_KEY = schema.sales_product_revenue
+
+DEFAULT_REPORT_DAYS = 14
+MAX_REPORT_DAYS = 366
+TOP_PRODUCTS = 10
+SECKILL_CATEGORY = "限量商品"
+
+
+def day_sales_key(day: str) -> str:
+    return schema.sales_day(day)
+
+
+def day_category_key(day: str) -> str:
+    return schema.sales_category(day)
+
+
+def record_checkout(pipe, summary: dict, products: dict, created_at: str):
+    """
+    一般結帳成功時呼叫（放在建訂單的同一個 MULTI 裡）。
+    summary 是 build_order_summary() 的結果，products 是 {pid: product hash}（拿分類用）。
+    """
+    day = created_at[:10]
+    lines = json.loads(summary.get("lines") or "[]")
+    units = sum(int(line["qty"]) for line in lines)
+
+    day_key = day_sales_key(day)
+    pipe.hincrby(day_key, "orders", 1)
+    pipe.hincrby(day_key, "revenue", int(summary["grand_total"]))
+    pipe.hincrby(day_key, "items_revenue", int(summary["total"]))
+    pipe.hincrby(day_key, "shipping", int(summary["shipping_fee"]))
+    pipe.hincrby(day_key, "units", units)
+
+    cat_key = day_category_key(day)
+    for line in lines:
+        pid = line["id"]
+        category = (products.get(pid) or {}).get("category") or "未分類"
+        pipe.hincrby(cat_key, f"rev:{category}", int(line["subtotal"]))
+        pipe.hincrby(cat_key, f"qty:{category}", int(line["qty"]))
+        pipe.zincrby(PRODUCT_UNITS_KEY, int(line["qty"]), pid)
+        pipe.zincrby(PRODUCT_REVENUE_KEY, int(line["subtotal"]), pid)
+
+
+def record_seckill(pipe, product_id: str, created_at: str):
+    """搶購成功時呼叫（放在搶購的同一個 MULTI 裡）；一次搶購算一件。"""
+    day = created_at[:10]
+    day_key = day_sales_key(day)
+    pipe.hincrby(day_key, "seckill", 1)
+    pipe.hincrby(day_key, "units", 1)
+    pipe.hincrby(day_category_key(day), f"qty:{SECKILL_CATEGORY}", 1)
+    pipe.zincrby(PRODUCT_UNITS_KEY, 1, product_id)
+
+
+def report_days(days: int = DEFAULT_REPORT_DAYS, end: str = None) -> list:
+    """從 end（預設今天，台灣時間）往回 days 天，舊到新。"""
+    days = max(1, min(int(days), MAX_REPORT_DAYS))
+    end_date = datetime.strptime(end or today_tw(), "%Y-%m-%d").date()
+    return [(end_date - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+
+
+def sales_report(r, days: int = DEFAULT_REPORT_DAYS, top: int = TOP_PRODUCTS) -> dict:
+    """
+    報表頁用：每天的營收 / 件數、期間內的分類統計、累計熱銷商品。
+    全部用兩個 pipeline 讀完（彙總 + 商品名稱）。
+    """
+    day_list = report_days(days)
+
+    with r.pipeline(transaction=False) as pipe:
+        for day in day_list:
+            pipe.hgetall(day_sales_key(day))
+        for day in day_list:
+            pipe.hgetall(day_category_key(day))
+        pipe.zrevrange(PRODUCT_UNITS_KEY, 0, top - 1, withscores=True)
+        results = pipe.execute()
+
+    day_rows = results[: len(day_list)]
+    cat_rows = results[len(day_list): 2 * len(day_list)]
+    top_units = results[-1]
+
+    by_day = []
+    totals = {"orders": 0, "revenue": 0, "units": 0, "seckill": 0}
+    for day, h in zip(day_list, day_rows):
+        row = {
+            "day": day,
+            "orders": int(h.get("orders", 0)),
+            "revenue": int(h.get("revenue", 0)),
+            "units": int(h.get("units", 0)),
+            "seckill": int(h.get("seckill", 0)),
+        }
+        for k in totals:
+            totals[k] += row[k]
+        by_day.append(row)
+
+    categories = {}
+    for h in cat_rows:
+        for field, value in h.items():
+            kind, _, category = field.partition(":")
+            c = categories.setdefault(category, {"category": category, "revenue": 0, "units": 0})
+            c["revenue" if kind == "rev" else "units"] += int(value)
+    category_rows = sorted(categories.values(), key=lambda c: (c["revenue"], c["units"]), reverse=True)
+
+    pids = [pid for pid, _ in top_units]
+    with r.pipeline(transaction=False) as pipe:
+        for pid in pids:
+            pipe.hget(schema.product(pid), "name")
+        for pid in pids:
+            pipe.zscore(PRODUCT_REVENUE_KEY, pid)
+        extra = pipe.execute() if pids else []
+    names = extra[: len(pids)]
+    revenues = extra[len(pids):]
+
+    top_products = [
+        {
+            "id": pid,
+            "name": name or f"商品 {pid}",
+            "units": int(units),
+            "revenue": int(revenue or 0),
+        }
+        for (pid, units), name, revenue in zip(top_units, names, revenues)
+    ]
+
+    return {
+        "days": by_day,
+        "totals": totals,
+        "categories": category_rows,
+        "top_products": top_products,
+    }
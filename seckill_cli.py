@@ -4,16 +4,19 @@ from datetime import datetime
 from redis.exceptions import WatchError
 
 from config_redis import get_redis_client
+from key_schema import CLUSTER, schema
+from order_records import pack_seckill_order, unpack_seckill_order
+from sales_analytics import record_seckill
 
 r = get_redis_client()
 
 SECKILL_PRODUCT_ID = "2991"
-SECKILL_STOCK_KEY = f"seckill:stock:{SECKILL_PRODUCT_ID}"
-SECKILL_USERS_KEY = f"seckill:users:{SECKILL_PRODUCT_ID}"
+SECKILL_STOCK_KEY = schema.seckill_stock(SECKILL_PRODUCT_ID)
+SECKILL_USERS_KEY = schema.seckill_users(SECKILL_PRODUCT_ID)
 
 
 def show_seckill_status():
-    info = r.hgetall(f"product:{SECKILL_PRODUCT_ID}")
+    info = r.hgetall(schema.product(SECKILL_PRODUCT_ID))
     stock = int(r.get(SECKILL_STOCK_KEY) or 0)
     success_count = r.scard(SECKILL_USERS_KEY)
 
@@ -32,7 +35,7 @@ def seckill_attempt(user_id: str):
 
     while True:
         try:
-            with r.pipeline() as pipe:
+            with r.pipeline(transaction=True) as pipe:
                 # 1) 監看庫存與成功名單
                 pipe.watch(SECKILL_STOCK_KEY, SECKILL_USERS_KEY)
 
@@ -57,16 +60,21 @@ def seckill_attempt(user_id: str):
 
                 # （選擇性）建立一筆搶購訂單紀錄
                 order_id = datetime.now().strftime("SK%Y%m%d%H%M%S%f")
-                order_key = f"seckill:order:{order_id}"
+                order_key = schema.seckill_order(order_id)
                 order_data = {
                     "user_id": user_id,
                     "product_id": SECKILL_PRODUCT_ID,
                     "created_at": datetime.now().isoformat(timespec="seconds"),
                 }
-                pipe.hset(order_key, mapping=order_data)
-                pipe.rpush("seckill:orders", order_id)
+                # cluster 模式下訂單 / 報表不在活動的 slot，扣名額成功後再寫
+                follow = r.pipeline(transaction=False) if CLUSTER else pipe
+                follow.hset(order_key, mapping=pack_seckill_order(order_data))
+                follow.rpush(schema.seckill_orders, order_id)
+                record_seckill(follow, SECKILL_PRODUCT_ID, order_data["created_at"])
 
                 pipe.execute()
+                if follow is not pipe:
+                    follow.execute()
 
                 # 搶購成功後發一則 Pub/Sub 通知
                 notice = {
@@ -79,10 +87,12 @@ def seckill_attempt(user_id: str):
 
                 # 也寫一筆事件到 Stream
                 r.xadd(
-                    "stream:seckill",
+                    schema.seckill_events_stream,
                     {
                         "user_id": user_id,
                         "product_id": SECKILL_PRODUCT_ID,
+                        "order_id": order_id,
+                        "created_at": order_data["created_at"],
                         "result": "success",
                     }
                 )
@@ -109,14 +119,14 @@ def show_success_users():
 
 def show_seckill_orders():
     print("\n=== 搶購訂單列表 ===")
-    order_ids = r.lrange("seckill:orders", 0, -1)
+    order_ids = r.lrange(schema.seckill_orders, 0, -1)
     if not order_ids:
         print("目前沒有搶購訂單。")
         return
 
     for oid in order_ids:
-        key = f"seckill:order:{oid}"
-        data = r.hgetall(key)
+        key = schema.seckill_order(oid)
+        data = unpack_seckill_order(r.hgetall(key))
         user_id = data.get("user_id", "")
         pid = data.get("product_id", "")
         created_at = data.get("created_at", "")
@@ -1,16 +1,18 @@
 from config_redis import get_redis_client
+from key_schema import schema
+from stats_counters import PRODUCTS_KEY
 
 r = get_redis_client()
 
 
 # 我們先清掉舊資料，避免之前測試的 key 造成干擾
 def reset_data():
-    keys = r.keys("product:*") + r.keys("stock:*")
+    keys = r.keys(schema.product("*")) + r.keys(schema.stock("*"))
     if keys:
         r.delete(*keys)
     print("已清除舊的商品 / 庫存資料。")
 
-def seed_products():
+def seed_products(verbose=True):
     # 設計零食商品＋分類
     products = {
         # 類別：洋芋片
@@ -365,16 +367,23 @@ def seed_products():
         data.update(extra)
 
         # 寫進 Redis 的 hash：product:{pid}
-        r.hset(f"product:{pid}", mapping=data)
+        r.hset(schema.product(pid), mapping=data)
 
     for pid, qty in stocks.items():
         # stock:{id} 用 string 存庫存數量
-        r.set(f"stock:{pid}", qty)
+        r.set(schema.stock(pid), qty)
+
+    # 舊商品都被清掉了，後台的商品總數直接設成這次建立的數量
+    r.set(PRODUCTS_KEY, len(products))
+
+    if not verbose:
+        print(f"已建立 {len(products)} 項測試商品與庫存。")
+        return
 
     print("已建立測試商品與庫存：")
     for pid in products:
         name = products[pid]["name"]
-        stock = r.get(f"stock:{pid}")
+        stock = r.get(schema.stock(pid))
         print(f"- {pid} {name}，庫存：{stock}")
 
 if __name__ == "__main__":
@@ -1,30 +1,37 @@
 import json
-from datetime import datetime
 
 from redis.exceptions import WatchError
 
 from config_redis import get_redis_client
+from key_schema import CLUSTER, key_id, schema
+from order_metrics import now_ms
+from order_index import index_new_order
+from order_queue import enqueue_order
+from sales_analytics import record_checkout
+from stats_counters import record_order
+from order_records import build_order_summary, order_summary, pack_order, unpack_order
+from tw_time import now_tw_iso, now_tw_order_id
 
 r = get_redis_client()
 
 
 # 先假設只有一個使用者
 CURRENT_USER_ID = "user1"
-CART_KEY = f"cart:{CURRENT_USER_ID}"
+CART_KEY = schema.cart(CURRENT_USER_ID)
 
 
 def list_products():
     print("\n=== 商品列表 ===")
-    product_keys = r.keys("product:*")
+    product_keys = r.keys(schema.product("*"))
     if not product_keys:
         print("目前沒有商品，請先執行 seed_products.py")
         return
 
-    product_ids = sorted(k.split(":")[1] for k in product_keys)
+    product_ids = sorted(key_id(k) for k in product_keys)
 
     for pid in product_ids:
-        info = r.hgetall(f"product:{pid}")
-        stock = r.get(f"stock:{pid}") or "0"
+        info = r.hgetall(schema.product(pid))
+        stock = r.get(schema.stock(pid)) or "0"
         print(f"{pid}. {info.get('name')} - ${info.get('price')} (庫存：{stock})")
 
 
@@ -33,11 +40,11 @@ def buy_one():
     list_products()
     pid = input("\n請輸入要購買的商品編號（例如 1001）：").strip()
 
-    if not r.exists(f"product:{pid}"):
+    if not r.exists(schema.product(pid)):
         print("❌ 找不到這個商品編號")
         return
 
-    stock_key = f"stock:{pid}"
+    stock_key = schema.stock(pid)
     stock = r.get(stock_key)
 
     if stock is None:
@@ -50,7 +57,7 @@ def buy_one():
         return
 
     new_stock = r.decr(stock_key)
-    info = r.hgetall(f"product:{pid}")
+    info = r.hgetall(schema.product(pid))
     print(f"✅ 購買成功！已購買：{info.get('name')}")
     print(f"剩餘庫存：{new_stock}")
 
@@ -59,7 +66,7 @@ def add_to_cart():
     list_products()
     pid = input("\n請輸入要加入購物車的商品編號：").strip()
 
-    if not r.exists(f"product:{pid}"):
+    if not r.exists(schema.product(pid)):
         print("❌ 找不到這個商品編號")
         return
 
@@ -73,7 +80,7 @@ def add_to_cart():
     # 先不扣真正庫存，只是放到購物車
     r.hincrby(CART_KEY, pid, qty)
 
-    info = r.hgetall(f"product:{pid}")
+    info = r.hgetall(schema.product(pid))
     print(f"✅ 已將 {info.get('name')} x {qty} 加入購物車！")
 
 
@@ -87,7 +94,7 @@ def view_cart():
 
     total = 0
     for pid, qty_str in cart_items.items():
-        info = r.hgetall(f"product:{pid}")
+        info = r.hgetall(schema.product(pid))
         if not info:
             continue  # 商品可能被刪掉了
 
@@ -119,15 +126,23 @@ def checkout():
         print("已取消結帳。")
         return
 
-    stock_keys = [f"stock:{pid}" for pid in cart_items.keys()]
+    # 訂單快照：結帳當下的商品名稱 / 單價
+    products = {}
+    for pid in cart_items.keys():
+        info = r.hgetall(schema.product(pid))
+        if info:
+            products[pid] = info
+    summary = build_order_summary(cart_items, products)
+
+    stock_keys = [schema.stock(pid) for pid in cart_items.keys()]
 
     try:
-        with r.pipeline() as pipe:
+        with r.pipeline(transaction=True) as pipe:
             pipe.watch(*stock_keys)
 
             current_stocks = {}
             for pid in cart_items.keys():
-                val = r.get(f"stock:{pid}")
+                val = r.get(schema.stock(pid))
                 current_stocks[pid] = int(val or 0)
 
             shortage = []
@@ -140,7 +155,7 @@ def checkout():
                 pipe.unwatch()
                 print("❌ 庫存不足，無法結帳：")
                 for pid, have, need in shortage:
-                    info = r.hgetall(f"product:{pid}")
+                    info = r.hgetall(schema.product(pid))
                     name = info.get("name", pid)
                     print(f"- {name}（需要 {need}，目前只有 {have}）")
                 return
@@ -150,32 +165,36 @@ def checkout():
             # 扣庫存
             for pid, qty_str in cart_items.items():
                 qty = int(qty_str)
-                pipe.decrby(f"stock:{pid}", qty)
+                pipe.decrby(schema.stock(pid), qty)
 
             # 建訂單
-            order_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
-            order_key = f"order:{order_id}"
+            order_id = now_tw_order_id()
+            order_key = schema.order(order_id)
 
             order_data = {
                 "user_id": CURRENT_USER_ID,
-                "items": json.dumps(cart_items),
-                "total": str(total),
+                **summary,
                 "status": "created",
-                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "created_at": now_tw_iso(),
+                "enqueued_at": str(now_ms()),
             }
 
-            pipe.hset(order_key, mapping=order_data)
-            pipe.rpush(f"user:{CURRENT_USER_ID}:orders", order_id)
+            pipe.hset(order_key, mapping=pack_order(order_data))
+            record_order(pipe, summary["grand_total"], order_data["created_at"])
+            record_checkout(pipe, summary, products, order_data["created_at"])
+            index_new_order(pipe, order_id, order_data["status"])
 
-            # 清空購物車
-            pipe.delete(CART_KEY)
+            # 🔹 把訂單丟進「處理佇列」（跟建訂單同一個交易）
+            enqueue_order(pipe, order_id)
 
-            pipe.execute()
+            # 使用者的訂單列表 + 清空購物車（cluster 模式在使用者的 slot，交易成功後另外寫）
+            user_pipe = r.pipeline(transaction=True) if CLUSTER else pipe
+            user_pipe.rpush(schema.user_orders(CURRENT_USER_ID), order_id)
+            user_pipe.delete(CART_KEY)
 
-            r.rpush("queue:orders", order_id)
-
-        # 🔹 Transaction 成功之後：把訂單丟進「處理佇列」
-        r.rpush("queue:orders", order_id)
+            pipe.execute()
+            if user_pipe is not pipe:
+                user_pipe.execute()
 
         # 🔹 同時用 Pub/Sub 發布一則訂單建立通知
         notice = {
@@ -188,11 +207,14 @@ def checkout():
 
         # 🔹 將訂單建立事件寫入 Stream（事件紀錄）
         r.xadd(
-            "stream:orders",
+            schema.order_events_stream,
             {
                 "order_id": order_id,
                 "user_id": CURRENT_USER_ID,
                 "total": str(total),
+                "grand_total": summary["grand_total"],
+                "items_count": summary["items_count"],
+                "created_at": order_data["created_at"],
                 "status": "created",
             }
         )
@@ -204,7 +226,7 @@ def checkout():
 
 def view_orders():
     print("\n=== 歷史訂單 ===")
-    orders_key = f"user:{CURRENT_USER_ID}:orders"
+    orders_key = schema.user_orders(CURRENT_USER_ID)
     order_ids = r.lrange(orders_key, 0, -1)
 
     if not order_ids:
@@ -212,18 +234,19 @@ def view_orders():
         return
 
     for order_id in order_ids:
-        order_key = f"order:{order_id}"
-        data = r.hgetall(order_key)
+        order_key = schema.order(order_id)
+        data = unpack_order(r.hgetall(order_key))
         if not data:
             continue
 
         created_at = data.get("created_at", "")
-        total = data.get("total", "0")
+        summary = order_summary(data)
         status = data.get("status", "unknown")
 
         print(f"- 訂單 {order_id}")
         print(f"  建立時間：{created_at}")
-        print(f"  總金額：${total}")
+        print(f"  商品數量：{summary['items_count']} 件")
+        print(f"  總金額：${summary['grand_total']}（含運費 ${summary['shipping_fee']}）")
         print(f"  狀態：{status}")
         print("")
 
@@ -0,0 +1,66 @@
+"""
+後台首頁用的統計計數器，在寫入的地方同步更新，首頁只要一次 MGET。
+
+    stats:products              商品數
+    stats:orders                訂單數
+    stats:users                 註冊用戶數
+    stats:orders:{YYYY-MM-DD}   當天訂單數（台灣時間）
+    stats:revenue:{YYYY-MM-DD}  當天營收（含運費的應付金額）
+
+計數器跑掉的話執行 recount_stats.py 用 SCAN 重算。
+"""
+from datetime import datetime, timedelta
+
+from key_schema import schema
+
+PRODUCTS_KEY = schema.stats_products
+ORDERS_KEY = schema.stats_orders
+USERS_KEY = schema.stats_users
+
+
+def today_tw() -> str:
+    """台灣今天的日期字串（Render 用 UTC，所以手動 +8 小時）。"""
+    return (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%d")
+
+
+def day_orders_key(day: str) -> str:
+    return schema.stats_day_orders(day)
+
+
+def day_revenue_key(day: str) -> str:
+    return schema.stats_day_revenue(day)
+
+
+def record_order(pipe, grand_total: int, created_at: str):
+    """建立訂單時呼叫（放在建訂單的同一個 MULTI 裡）。created_at 是 ISO 字串。"""
+    day = created_at[:10]
+    pipe.incr(ORDERS_KEY)
+    pipe.incr(day_orders_key(day))
+    pipe.incrby(day_revenue_key(day), int(grand_total))
+
+
+def record_product_created(r):
+    r.incr(PRODUCTS_KEY)
+
+
+def record_user_created(r):
+    r.incr(USERS_KEY)
+
+
+def dashboard_stats(r) -> dict:
+    """首頁用：一次 MGET 拿到所有數字。"""
+    day = today_tw()
+    products, orders, users, today_orders, today_revenue = r.mget(
+        PRODUCTS_KEY,
+        ORDERS_KEY,
+        USERS_KEY,
+        day_orders_key(day),
+        day_revenue_key(day),
+    )
+    return {
+        "product_count": int(products or 0),
+        "order_count": int(orders or 0),
+        "user_count": int(users or 0),
+        "today_order_count": int(today_orders or 0),
+        "today_revenue": int(today_revenue or 0),
+    }
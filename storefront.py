@@ -0,0 +1,281 @@
+"""
+前台的共用步驟：app.py（Flask + redis）和 app_async.py（Quart + redis.asyncio）都用這一份。
+
+這裡只放不碰 I/O 的部分（解析設定、組顯示資料、檢查庫存、產生訂單資料、
+把寫入排進 pipeline、通知 / 事件的內容），讀寫 Redis 由兩個前台各自用同步或 async 的 client 做，
+跟 user_history.py 的 load_profile / load_profile_async 同一個分法。
+
+排進 pipeline 的函式不會 execute，MULTI（pipe.multi() 之後）或一般 pipeline 都可以用，
+同步和 async 的 pipeline 排指令的方式一樣。
+"""
+import json
+import uuid
+from datetime import time
+
+from key_schema import schema
+from order_index import index_new_order
+from order_metrics import now_ms
+from order_queue import enqueue_order
+from order_records import pack_order, pack_seckill_order
+from sales_analytics import record_checkout, record_seckill
+from stats_counters import record_order
+from tw_time import now_tw, now_tw_iso, now_tw_order_id
+
+SECRET_KEY = "dev-secret-key-please-change"  # 隨便一串字就好，用來支援 flash 訊息；兩個前台共用 session cookie
+IDEMPOTENCY_TTL = 600  # 防重複送出的 token 保留秒數
+
+ORDERS_CHANNEL = "channel:orders"
+SECKILL_CHANNEL = "channel:seckill"
+
+LIMITED_CATEGORY = "限量商品"  # 只給搶購用，不出現在一般商品列表
+
+SECKILL_MESSAGES = {
+    "ok": ("恭喜搶購成功！", "success"),
+    "no_quota": ("名額已被搶光或同時競爭失敗，請再試試其他活動。", "error"),
+    "already_success": ("你已經在本活動中搶購成功過一次囉。", "error"),
+}
+
+
+# ================== 防重複送出 ==================
+
+def new_idempotency_token():
+    """產生一次性的表單 token，放在結帳 / 搶購表單的 hidden 欄位。"""
+    return uuid.uuid4().hex
+
+
+def seckill_token(token: str, product_id: str) -> str:
+    """同一頁有多個活動表單，token 要跟商品綁在一起。"""
+    return f"{token}:{product_id}" if token else token
+
+
+def parse_idempotency_record(saved) -> dict:
+    """第一次的請求還沒做完（或紀錄壞掉）回傳 {"pending": True}，否則回傳存下的結果。"""
+    if not saved or saved == "pending":
+        return {"pending": True}
+    try:
+        return json.loads(saved)
+    except json.JSONDecodeError:
+        return {"pending": True}
+
+
+def idempotency_result(result: dict) -> str:
+    return json.dumps(result, ensure_ascii=False)
+
+
+# ================== 搶購活動 ==================
+
+def parse_seckill_configs(cfgs) -> dict:
+    """seckill:event:* 的 hash 們 -> {pid: {'start': time, 'end': time}}，格式不對的略過。"""
+    events = {}
+    for cfg in cfgs:
+        pid = cfg.get("product_id")
+        start = cfg.get("start")
+        end = cfg.get("end")
+        if not pid or not start or not end:
+            continue
+        try:
+            sh, sm = [int(x) for x in start.split(":")]
+            eh, em = [int(x) for x in end.split(":")]
+            events[pid] = {"start": time(sh, sm), "end": time(eh, em)}
+        except Exception:
+            continue
+    return events
+
+
+def seckill_is_open(cfg) -> bool:
+    """用台灣時間判斷活動是否開放。"""
+    now = now_tw().time()
+    return cfg["start"] <= now <= cfg["end"]
+
+
+def seckill_status(pid: str, cfg: dict, info: dict, stock, users) -> dict:
+    """搶購頁一個活動的顯示資料。"""
+    info = info or {}
+    stock = int(stock or 0)
+    success_count = len(users)
+    return {
+        "product_id": pid,
+        "product_name": info.get("name", f"商品 {pid}"),
+        "price": info.get("price", "?"),
+        "stock": stock,
+        "success_count": success_count,
+        "total_quota": success_count + stock,
+        "start_time": cfg["start"].strftime("%H:%M"),
+        "end_time": cfg["end"].strftime("%H:%M"),
+        "open_now": seckill_is_open(cfg),
+    }
+
+
+def seckill_message(result: str):
+    """搶購結果 -> (flash 訊息, 類別)。"""
+    return SECKILL_MESSAGES.get(result, ("搶購時發生未知錯誤。", "error"))
+
+
+def new_seckill_order(product_id: str, user_id: str):
+    """回傳 (訂單編號, 搶購訂單資料)。"""
+    order_id = now_tw_order_id()
+    order_data = {
+        "product_id": product_id,
+        "user_id": user_id,
+        "created_at": now_tw_iso(),
+    }
+    return order_id, order_data
+
+
+def queue_seckill_order(pipe, order_id: str, order_data: dict):
+    """搶購訂單 + 全部 / 使用者的搶購訂單列表 + 銷售報表。"""
+    user_id = order_data["user_id"]
+    pipe.hset(schema.seckill_order(order_id), mapping=pack_seckill_order(order_data))
+    pipe.rpush(schema.seckill_orders, order_id)
+    pipe.rpush(schema.user_seckill_orders(user_id), order_id)
+    record_seckill(pipe, order_data["product_id"], order_data["created_at"])
+
+
+def seckill_notice(order_data: dict) -> str:
+    """Pub/Sub 的搶購成功通知（subscriber 即時顯示用）。"""
+    notice = {
+        "type": "seckill_success",
+        "user_id": order_data["user_id"],
+        "product_id": order_data["product_id"],
+        "time": now_tw_iso(),
+    }
+    return json.dumps(notice, ensure_ascii=False)
+
+
+def seckill_event(order_id: str, order_data: dict) -> dict:
+    """stream:seckill 的事件欄位（看板、projector 用）。"""
+    return {
+        "user_id": order_data["user_id"],
+        "product_id": order_data["product_id"],
+        "order_id": order_id,
+        "created_at": order_data["created_at"],
+        "result": "success",
+    }
+
+
+# ================== 商品 / 購物車 ==================
+
+def product_entry(pid: str, info: dict, stock):
+    """商品列表的一格；限量商品回傳 None（不出現在一般列表）。"""
+    category = info.get("category", "未分類")
+    if category == LIMITED_CATEGORY:
+        return None
+    return {
+        "id": pid,
+        "name": info.get("name"),
+        "price": int(info.get("price", 0)),
+        "stock": stock,
+        "category": category,
+        "image_url": f"images/products/{pid}.jpg",
+        "net_weight": info.get("net_weight"),
+        "mfg": info.get("mfg"),
+        "exp": info.get("exp"),
+        "origin": info.get("origin"),
+    }
+
+
+def cart_lines(cart_data: dict, infos: dict, stocks: dict):
+    """購物車 {pid: qty} + 商品 / 庫存 -> (每一行, 小計)；找不到的商品略過。"""
+    items = []
+    total = 0
+    for pid, qty_str in cart_data.items():
+        info = infos.get(pid)
+        if not info:
+            continue
+
+        price = int(info.get("price", 0))
+        qty = int(qty_str or 0)
+        subtotal = price * qty
+        total += subtotal
+
+        items.append(
+            {
+                "id": pid,
+                "name": info.get("name", ""),
+                "price": price,
+                "qty": qty,
+                "subtotal": subtotal,
+                "image": info.get("image", ""),
+                "stock": stocks.get(pid, 0),
+            }
+        )
+    return items, total
+
+
+# ================== 結帳 ==================
+
+def find_shortage(cart_items: dict, current_stocks: dict) -> list:
+    """[(pid, 目前庫存, 需要數量)]，空的代表庫存都夠。"""
+    shortage = []
+    for pid, qty_str in cart_items.items():
+        qty = int(qty_str)
+        if current_stocks[pid] < qty:
+            shortage.append((pid, current_stocks[pid], qty))
+    return shortage
+
+
+def shortage_message(shortage, products: dict) -> str:
+    msg_lines = ["庫存不足，無法結帳："]
+    for pid, have, need in shortage:
+        name = (products.get(pid) or {}).get("name", pid)
+        msg_lines.append(f"{name} 需要 {need}，目前只有 {have}")
+    return "；".join(msg_lines)
+
+
+def new_order(user_id: str, summary: dict):
+    """回傳 (訂單編號, 訂單資料)；summary 是 build_order_summary() 的結果。"""
+    order_id = now_tw_order_id()
+    order_data = {
+        "user_id": user_id,
+        **summary,  # items / lines / total / items_count / shipping_fee / grand_total
+        "status": "已建立",
+        "created_at": now_tw_iso(),
+        "enqueued_at": str(now_ms()),  # 給監控算排隊延遲用
+    }
+    return order_id, order_data
+
+
+def queue_checkout(pipe, cart_items: dict, order_id: str, order_data: dict, products: dict):
+    """結帳交易裡 {shop} 那一組的寫入：扣庫存、建訂單、統計、報表、索引、處理佇列。"""
+    for pid, qty_str in cart_items.items():
+        pipe.decrby(schema.stock(pid), int(qty_str))
+
+    pipe.hset(schema.order(order_id), mapping=pack_order(order_data))
+    # 後台首頁的訂單數 / 今日營收
+    record_order(pipe, order_data["grand_total"], order_data["created_at"])
+    # 銷售報表：每日 / 分類 / 商品排行的彙總
+    record_checkout(pipe, order_data, products, order_data["created_at"])
+    # 後台用的時間索引
+    index_new_order(pipe, order_id, order_data["status"])
+    # 丟進處理佇列給 worker_orders.py，跟建訂單在同一個交易裡，不會漏單
+    enqueue_order(pipe, order_id)
+
+
+def queue_user_checkout(pipe, user_id: str, order_id: str):
+    """使用者那一組的寫入：訂單列表 + 清空購物車。"""
+    pipe.rpush(schema.user_orders(user_id), order_id)
+    pipe.delete(schema.cart(user_id))
+
+
+def checkout_notice(order_id: str, order_data: dict) -> str:
+    """Pub/Sub 的訂單通知。"""
+    notice = {
+        "type": "order_created",
+        "order_id": order_id,
+        "user_id": order_data["user_id"],
+        "total": int(order_data["total"]),
+    }
+    return json.dumps(notice, ensure_ascii=False)
+
+
+def checkout_event(order_id: str, order_data: dict) -> dict:
+    """stream:orders 的事件欄位。"""
+    return {
+        "order_id": order_id,
+        "user_id": order_data["user_id"],
+        "total": str(order_data["total"]),
+        "grand_total": order_data["grand_total"],
+        "items_count": order_data["items_count"],
+        "created_at": order_data["created_at"],
+        "status": "created",
+    }
@@ -2,11 +2,14 @@ import json
 
 from config_redis import get_redis_client
 
-r = get_redis_client()
+r = get_redis_client("worker")
 
 
 CHANNELS = ["channel:orders", "channel:seckill"]
 
+# 由 supervisor.py 設成共享計數器，用來彙總收到的通知數
+processed_counter = None
+
 
 def main():
     pubsub = r.pubsub()
@@ -15,8 +18,11 @@ def main():
     print("訂閱通知頻道中：", CHANNELS)
     print("有新事件會即時顯示在這裡。\n")
 
-    for message in pubsub.listen():
-        if message["type"] != "message":
+    while True:
+        # 用 get_message 輪詢而不是 listen()：頻道安靜很久也不會撞到 socket timeout，
+        # 閒置時連線池的 health check 也會定期 PING
+        message = pubsub.get_message(ignore_subscribe_messages=True, timeout=5.0)
+        if message is None or message["type"] != "message":
             continue
 
         channel = message["channel"]
@@ -29,6 +35,10 @@ def main():
 
         print(f"[{channel}] 收到通知：{payload}")
 
+        if processed_counter is not None:
+            with processed_counter.get_lock():
+                processed_counter.value += 1
+
 
 if __name__ == "__main__":
     main()
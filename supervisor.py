@@ -0,0 +1,290 @@
+"""
+多 process 的 worker 管理程式：一次開好幾個 worker，把一台機器的 CPU 都用上。
+
+    python supervisor.py --orders 4 --notifications 1 --reapers 1 --projectors 1 \
+        --worker-args "--batch --concurrency 16"
+
+- 每種角色（orders / notifications / reapers / projectors）可以各自設定 process 數
+- 子 process 掛掉會自動重開，連續掛掉時重開間隔指數加長
+- 收到 SIGTERM / Ctrl+C 時把訊號轉給所有子 process，等它們把手上的工作做完
+- 定時印出一行彙總的吞吐量；加 --status-port 可以用 HTTP 拿 JSON 狀態
+"""
+import argparse
+import json
+import multiprocessing as mp
+import shlex
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from local_redis import prepare_shared_backend
+
+RESTART_BASE_SECONDS = 1
+RESTART_MAX_SECONDS = 60
+HEALTHY_AFTER_SECONDS = 60  # 活超過這麼久才算穩定，重開的退避時間歸零
+STATUS_INTERVAL = 10
+STOP_TIMEOUT = 30  # 送 SIGTERM 後最多等幾秒，超過就強制結束
+
+
+def _orders_main(counter, argv):
+    import worker_orders
+
+    worker_orders.processed_counter = counter
+    worker_orders.main(argv)
+
+
+def _reaper_main(counter, argv):
+    import worker_orders
+
+    worker_orders.processed_counter = counter
+    worker_orders.main(["--reaper", *argv])
+
+
+def _notifications_main(counter, argv):
+    import subscriber_notifications
+
+    subscriber_notifications.processed_counter = counter
+    subscriber_notifications.main()
+
+
+def _projector_main(counter, argv):
+    import projector_user_summary
+
+    projector_user_summary.processed_counter = counter
+    projector_user_summary.main([])
+
+
+def _child_argv(argv, index: int):
+    """
+    每個子 process 的參數：--metrics-port 依子 process 編號往後加，
+    不然大家搶同一個 port，只有第一個開得起來。
+    """
+    argv = list(argv)
+    for i, arg in enumerate(argv):
+        if arg == "--metrics-port" and i + 1 < len(argv):
+            argv[i + 1] = str(int(argv[i + 1]) + index)
+        elif arg.startswith("--metrics-port="):
+            port = int(arg.split("=", 1)[1])
+            argv[i] = f"--metrics-port={port + index}"
+    return argv
+
+
+ROLES = {
+    "orders": _orders_main,
+    "notifications": _notifications_main,
+    "reapers": _reaper_main,
+    "projectors": _projector_main,
+}
+
+
+class Child:
+    """一個被管理的子 process（掛掉時用同一個 slot 重開）。"""
+
+    def __init__(self, ctx, role: str, index: int, argv):
+        self.ctx = ctx
+        self.role = role
+        self.index = index
+        self.argv = argv
+        self.counter = ctx.Value("q", 0)
+        self.process = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+        self.restarts = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.role}-{self.index}"
+
+    def start(self):
+        self.process = self.ctx.Process(
+            target=ROLES[self.role],
+            args=(self.counter, self.argv),
+            name=self.name,
+            daemon=False,
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        print(f"[{datetime.now()}] 啟動 {self.name}（pid {self.process.pid}）")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def schedule_restart(self):
+        """子 process 結束了：決定多久後重開。"""
+        lived = time.monotonic() - self.started_at
+        if lived >= HEALTHY_AFTER_SECONDS:
+            self.failures = 0
+        delay = min(RESTART_BASE_SECONDS * 2 ** self.failures, RESTART_MAX_SECONDS)
+        self.failures += 1
+        self.restart_at = time.monotonic() + delay
+        print(
+            f"[{datetime.now()}] {self.name} 結束（exit code {self.process.exitcode}），"
+            f"{delay} 秒後重開"
+        )
+        self.process = None
+
+    def processed(self) -> int:
+        return self.counter.value
+
+
+class Supervisor:
+    def __init__(self, counts: dict, worker_argv):
+        # spawn：子 process 重新 import，各自建立自己的 Redis 連線
+        self.ctx = mp.get_context("spawn")
+        self.children = []
+        for role, n in counts.items():
+            argv = worker_argv if role == "orders" else []
+            for i in range(n):
+                self.children.append(Child(self.ctx, role, i, _child_argv(argv, i)))
+
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.last_totals = {}
+        self.last_status_time = time.monotonic()
+        self.rates = {}
+
+    def request_stop(self, signum=None, frame=None):
+        if not self.stopping.is_set():
+            print(f"\n[{datetime.now()}] 收到結束訊號，通知所有子 process 結束 ...")
+        self.stopping.set()
+
+    def status(self) -> dict:
+        """依角色彙總：process 數、存活數、累計處理量、每秒處理量。"""
+        with self.lock:
+            summary = {}
+            for c in self.children:
+                s = summary.setdefault(
+                    c.role, {"processes": 0, "alive": 0, "processed": 0, "restarts": 0, "per_second": 0.0}
+                )
+                s["processes"] += 1
+                s["alive"] += 1 if c.alive() else 0
+                s["processed"] += c.processed()
+                s["restarts"] += c.restarts
+            for role, s in summary.items():
+                s["per_second"] = round(self.rates.get(role, 0.0), 1)
+            return {"time": datetime.now().isoformat(timespec="seconds"), "roles": summary}
+
+    def _update_rates(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_status_time, 1e-6)
+        totals = {}
+        for c in self.children:
+            totals[c.role] = totals.get(c.role, 0) + c.processed()
+        with self.lock:
+            self.rates = {
+                role: (total - self.last_totals.get(role, 0)) / elapsed
+                for role, total in totals.items()
+            }
+        self.last_totals = totals
+        self.last_status_time = now
+
+    def _print_status(self):
+        st = self.status()["roles"]
+        parts = [
+            f"{role} {s['alive']}/{s['processes']}：{s['processed']} 筆（{s['per_second']}/s）"
+            for role, s in st.items()
+        ]
+        print(f"[{datetime.now()}] " + " | ".join(parts))
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        for c in self.children:
+            c.start()
+
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            with self.lock:
+                for c in self.children:
+                    if c.process is not None and not c.alive():
+                        c.schedule_restart()
+                    elif c.process is None and now >= c.restart_at:
+                        c.restarts += 1
+                        c.start()
+
+            if now - self.last_status_time >= STATUS_INTERVAL:
+                self._update_rates()
+                self._print_status()
+
+            self.stopping.wait(1)
+
+        self.stop_children()
+
+    def stop_children(self):
+        # 子 process 各自有處理 SIGTERM：做完手上的工作再離開
+        for c in self.children:
+            if c.alive():
+                c.process.terminate()
+
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for c in self.children:
+            if c.process is None:
+                continue
+            c.process.join(max(deadline - time.monotonic(), 0))
+            if c.process.is_alive():
+                print(f"[{datetime.now()}] {c.name} 沒有在時間內結束，強制停止")
+                c.process.kill()
+                c.process.join()
+
+        self._update_rates()
+        self._print_status()
+        print(f"[{datetime.now()}] supervisor 已停止。")
+
+
+def serve_status(supervisor: Supervisor, port: int):
+    """在背景開一個小 HTTP server：GET / 回傳 JSON 狀態。"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(supervisor.status(), ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"狀態頁：http://127.0.0.1:{port}/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="worker 管理程式")
+    parser.add_argument("--orders", type=int, default=mp.cpu_count(), help="訂單 worker 數（預設 = CPU 核心數）")
+    parser.add_argument("--notifications", type=int, default=0, help="通知 subscriber 數")
+    parser.add_argument("--reapers", type=int, default=1, help="維護用 reaper 數")
+    parser.add_argument("--projectors", type=int, default=1, help="使用者訂單摘要 projector 數")
+    parser.add_argument(
+        "--worker-args",
+        default="",
+        help='傳給每個 worker_orders.py 的參數，例如 "--batch --concurrency 16"；'
+        "--metrics-port N 會依序分給各 worker（N、N+1、...）",
+    )
+    parser.add_argument("--status-port", type=int, default=0, help="開一個 HTTP 狀態頁（JSON）")
+    args = parser.parse_args()
+
+    counts = {
+        "orders": max(args.orders, 0),
+        "notifications": max(args.notifications, 0),
+        "reapers": max(args.reapers, 0),
+        "projectors": max(args.projectors, 0),
+    }
+    # REDIS_BACKEND=local 的話先把本機 server 起好，子 process 才會連到同一台
+    prepare_shared_backend()
+    supervisor = Supervisor(counts, shlex.split(args.worker_args))
+
+    if args.status_port:
+        serve_status(supervisor, args.status_port)
+
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from key_schema import KeySchema, convert_classic_key  # noqa: E402
+from migrate_cluster_keys import migrate  # noqa: E402
+
+CLUSTER = KeySchema(cluster=True)
+
+
+@pytest.mark.parametrize(
+    "classic, expected",
+    [
+        ("product:2001", "product:{shop}:2001"),
+        ("seckill:stock:2001", "seckill:{2001}:stock"),
+        ("user:u_ab12cd34", "user:{u_ab12cd34}"),
+        ("user:u_ab12cd34:orders", "user:{u_ab12cd34}:orders"),
+        ("user:u_ab12cd34:summary", "user:{u_ab12cd34}:summary"),
+        ("user:u_ab12cd34:summary:applied", "user:{u_ab12cd34}:summary:applied"),
+        ("idem:u_ab12cd34:tok", "idem:{u_ab12cd34}:tok"),
+        ("stream:orders", "stream:{events}:orders"),
+        ("orders:query:abc", None),
+        ("orders:day:2026-01-01", None),
+        ("catalog:version", None),
+    ],
+)
+def test_convert_classic_key(classic, expected):
+    assert convert_classic_key(classic, CLUSTER) == expected
+
+
+def test_every_user_key_gets_the_user_tag():
+    classic = KeySchema(cluster=False)
+    for method in ("user", "user_orders", "user_seckill_orders", "user_summary", "user_summary_applied", "cart"):
+        key = getattr(classic, method)("u_ab12cd34")
+        assert convert_classic_key(key, CLUSTER) == getattr(CLUSTER, method)("u_ab12cd34")
+
+
+def test_migrate_copies_summary_dedupe_set():
+    source = fakeredis.FakeRedis()
+    target = fakeredis.FakeRedis()
+    source.hset("user:u_1:summary", mapping={"orders": 1})
+    source.zadd("user:u_1:summary:applied", {"stream:orders|1-0": 1})
+
+    stats = migrate(source, target)
+
+    assert stats["unknown"] == []
+    assert stats["copied"] == 2
+    assert target.zscore("user:{u_1}:summary:applied", "stream:orders|1-0") == 1
+    assert target.hget("user:{u_1}:summary", "orders") == b"1"
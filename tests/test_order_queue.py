@@ -0,0 +1,75 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from key_schema import schema  # noqa: E402
+from order_queue import (  # noqa: E402
+    DEAD_LETTER_STREAM,
+    MAX_DELIVERIES,
+    ORDER_GROUP,
+    ORDER_STREAM,
+    enqueue_order,
+    ensure_group,
+    pending_count,
+    read_batch,
+    requeue_stuck,
+)
+
+ORDER_ID = "20260101120000000001"
+
+
+@pytest.fixture
+def r():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    ensure_group(client)
+    return client
+
+
+def crash_worker(r):
+    """worker 拿到訊息就當掉（不 ack）。"""
+    return read_batch(r, "crashing-worker", count=10, block_ms=None)
+
+
+def test_requeue_stuck_moves_entry_to_stream_tail(r):
+    r.hset(schema.order(ORDER_ID), mapping={"status": "已建立"})
+    enqueue_order(r, ORDER_ID)
+    [(entry_id, _)] = crash_worker(r)
+
+    assert requeue_stuck(r, "reaper", count=10, min_idle_ms=0) == (1, 0)
+
+    [(new_entry_id, order_id)] = crash_worker(r)
+    assert order_id == ORDER_ID
+    assert new_entry_id != entry_id
+    assert r.hget(schema.order(ORDER_ID), "deliveries") == "1"
+    assert r.hget(schema.order(ORDER_ID), "requeued_at")
+
+
+def test_poison_order_ends_up_dead_lettered(r):
+    r.hset(schema.order(ORDER_ID), mapping={"status": "已建立"})
+    enqueue_order(r, ORDER_ID)
+
+    results = []
+    for _ in range(MAX_DELIVERIES + 3):
+        crash_worker(r)
+        results.append(requeue_stuck(r, "reaper", count=10, min_idle_ms=0))
+
+    assert results[:MAX_DELIVERIES] == [(1, 0)] * MAX_DELIVERIES
+    assert results[MAX_DELIVERIES] == (0, 1)
+    assert all(result == (0, 0) for result in results[MAX_DELIVERIES + 1:])
+
+    dead = r.xrange(DEAD_LETTER_STREAM)
+    assert len(dead) == 1
+    assert dead[0][1]["order_id"] == ORDER_ID
+    assert int(dead[0][1]["deliveries"]) == MAX_DELIVERIES + 1
+    assert r.xlen(ORDER_STREAM) == 0
+    assert pending_count(r) == 0
+
+
+def test_requeue_stuck_drops_entries_for_deleted_orders(r):
+    enqueue_order(r, ORDER_ID)
+    crash_worker(r)
+
+    assert requeue_stuck(r, "reaper", count=10, min_idle_ms=0) == (0, 0)
+    assert r.xlen(ORDER_STREAM) == 0
+    assert r.xpending(ORDER_STREAM, ORDER_GROUP)["pending"] == 0
+    assert not r.exists(schema.order(ORDER_ID))
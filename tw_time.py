@@ -0,0 +1,19 @@
+"""
+台灣時間的小工具（前台、非同步前台、CLI 共用，訂單編號和 created_at 才會一致）。
+"""
+from datetime import datetime, timedelta
+
+
+def now_tw():
+    """取得台灣現在時間（Render 用 UTC，所以手動 +8 小時）。"""
+    return datetime.utcnow() + timedelta(hours=8)
+
+
+def now_tw_iso():
+    """台灣時間的 ISO 字串，例如 2025-12-09T21:30:00。"""
+    return now_tw().isoformat(timespec="seconds")
+
+
+def now_tw_order_id():
+    """用台灣時間做出訂單編號用的時間字串。"""
+    return now_tw().strftime("%Y%m%d%H%M%S%f")
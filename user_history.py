@@ -0,0 +1,206 @@
+"""
+個人頁的歷史訂單 / 搶購紀錄：新到舊分頁，一頁三次往返就讀完。
+
+    user:{uid}:orders / user:{uid}:seckill_orders   list，結帳時 RPUSH（尾巴最新）
+
+第一頁用負數 LRANGE（-limit ~ -1）拿最後幾筆，同時 LLEN 算出這一頁在 list 裡的絕對位置；
+cursor 就是「這一頁最舊那筆的位置」，下一頁拿它前面的 limit 筆。
+list 只會從尾巴長，所以前面的位置不會變，翻頁期間有新訂單也不會重複或漏掉。
+
+    1. 一個 MULTI：使用者資料 + 訂單摘要 + 兩條 list 的長度與這一頁的編號
+    2. 一個 pipeline：這一頁所有訂單 / 搶購訂單的 hash
+    3. 一個 pipeline：搶購紀錄用到的商品名稱
+
+load_profile_async 是同樣流程的 redis.asyncio 版。
+"""
+import asyncio
+
+from key_schema import schema
+from order_records import order_summary, unpack_order, unpack_seckill_order
+from user_summary import parse_summary, summary_key
+
+PROFILE_PAGE_SIZE = 20
+
+
+def _parse_cursor(value):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(n, 0)
+
+
+def _queue_window(pipe, key: str, before, limit: int):
+    """排入 LLEN + 這一頁的 LRANGE；before 是 None 代表最新一頁。"""
+    pipe.llen(key)
+    if before is None:
+        pipe.lrange(key, -limit, -1)
+    elif before > 0:
+        pipe.lrange(key, max(before - limit, 0), before - 1)
+    else:
+        pipe.lrange(key, 1, 0)  # 已經到最舊：start > end 回傳空的
+
+
+def _window_result(length: int, ids, before, limit: int):
+    """回傳 (新到舊的編號, 下一頁 cursor 或 None)。"""
+    end = length if before is None else min(before, length)
+    start = max(end - limit, 0)
+    return list(reversed(ids)), (start if start > 0 else None)
+
+
+def _profile_keys(user_id: str):
+    return schema.user_orders(user_id), schema.user_seckill_orders(user_id)
+
+
+def _queue_first_round(pipe, user_id: str, orders_before, seckill_before, limit: int):
+    orders_key, seckill_key = _profile_keys(user_id)
+    pipe.hgetall(schema.user(user_id))
+    pipe.hgetall(summary_key(user_id))
+    _queue_window(pipe, orders_key, orders_before, limit)
+    _queue_window(pipe, seckill_key, seckill_before, limit)
+
+
+def _build_orders(order_ids, order_hashes) -> list:
+    orders = []
+    for oid, h in zip(order_ids, order_hashes):
+        od = unpack_order(h)
+        if not od:
+            continue
+        orders.append(
+            {
+                "id": oid,
+                **order_summary(od),  # items_total / shipping_fee / grand_total / items_count
+                "created_at": od.get("created_at", ""),
+                "status": od.get("status", "已建立"),
+            }
+        )
+    return orders
+
+
+def _seckill_pids(seckill_orders) -> list:
+    """同一頁重複的商品只查一次名稱。"""
+    return sorted({sod.get("product_id") for _, sod in seckill_orders if sod.get("product_id")})
+
+
+def _build_seckill_records(seckill_orders, names: dict) -> list:
+    seckill_records = []
+    for soid, sod in seckill_orders:
+        pid = sod.get("product_id")
+        seckill_records.append(
+            {
+                "order_id": soid,
+                "product_id": pid,
+                "product_name": (names.get(pid) or f"商品 {pid}") if pid else "商品",
+                "created_at": sod.get("created_at", ""),
+            }
+        )
+    return seckill_records
+
+
+def _profile_result(user_info, summary, orders, orders_len, orders_next, seckill_records, seckill_len, seckill_next):
+    return {
+        "user": user_info or {},
+        # projector 維護的累計數字（訂單數 / 消費 / 件數 / 搶購次數）
+        "summary": parse_summary(summary),
+        "orders": orders,
+        "orders_total": orders_len,
+        "orders_next": orders_next,
+        "seckill_records": seckill_records,
+        "seckill_total": seckill_len,
+        "seckill_next": seckill_next,
+    }
+
+
+def load_profile(r, user_id: str, orders_before=None, seckill_before=None, limit: int = PROFILE_PAGE_SIZE) -> dict:
+    """
+    讀個人頁需要的所有資料。orders_before / seckill_before 是上一頁給的 cursor。
+    回傳 user / orders / seckill_records，以及兩個列表的 next cursor 與總筆數。
+    """
+    orders_before = _parse_cursor(orders_before)
+    seckill_before = _parse_cursor(seckill_before)
+
+    # 1) 使用者資料 + 兩條 list 的這一頁（MULTI：長度跟內容是同一個時間點）
+    with r.pipeline(transaction=True) as pipe:
+        _queue_first_round(pipe, user_id, orders_before, seckill_before, limit)
+        user_info, summary, orders_len, order_ids, seckill_len, seckill_ids = pipe.execute()
+
+    order_ids, orders_next = _window_result(orders_len, order_ids, orders_before, limit)
+    seckill_ids, seckill_next = _window_result(seckill_len, seckill_ids, seckill_before, limit)
+
+    # 2) 這一頁的訂單 + 搶購訂單
+    with r.pipeline(transaction=False) as pipe:
+        for oid in order_ids:
+            pipe.hgetall(schema.order(oid))
+        for soid in seckill_ids:
+            pipe.hgetall(schema.seckill_order(soid))
+        hashes = pipe.execute() if order_ids or seckill_ids else []
+
+    order_hashes = hashes[: len(order_ids)]
+    seckill_hashes = hashes[len(order_ids):]
+
+    orders = _build_orders(order_ids, order_hashes)
+    seckill_orders = [(soid, unpack_seckill_order(h)) for soid, h in zip(seckill_ids, seckill_hashes) if h]
+
+    # 3) 搶購紀錄的商品名稱
+    pids = _seckill_pids(seckill_orders)
+    names = {}
+    if pids:
+        with r.pipeline(transaction=False) as pipe:
+            for pid in pids:
+                pipe.hget(schema.product(pid), "name")
+            names = dict(zip(pids, pipe.execute()))
+
+    return _profile_result(
+        user_info, summary,
+        orders, orders_len, orders_next,
+        _build_seckill_records(seckill_orders, names), seckill_len, seckill_next,
+    )
+
+
+async def _hgetall_many(r, keys) -> list:
+    if not keys:
+        return []
+    async with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        return await pipe.execute()
+
+
+async def load_profile_async(r, user_id: str, orders_before=None, seckill_before=None, limit: int = PROFILE_PAGE_SIZE) -> dict:
+    """
+    load_profile 的 redis.asyncio 版（app_async.py 用）：
+    第 2 步的訂單和搶購訂單分成兩個 pipeline 用 asyncio.gather 同時送，
+    搶購訂單一回來就接著查商品名稱，不用等一般訂單那邊。
+    """
+    orders_before = _parse_cursor(orders_before)
+    seckill_before = _parse_cursor(seckill_before)
+
+    async with r.pipeline(transaction=True) as pipe:
+        _queue_first_round(pipe, user_id, orders_before, seckill_before, limit)
+        user_info, summary, orders_len, order_ids, seckill_len, seckill_ids = await pipe.execute()
+
+    order_ids, orders_next = _window_result(orders_len, order_ids, orders_before, limit)
+    seckill_ids, seckill_next = _window_result(seckill_len, seckill_ids, seckill_before, limit)
+
+    async def load_seckill_records():
+        hashes = await _hgetall_many(r, [schema.seckill_order(soid) for soid in seckill_ids])
+        seckill_orders = [(soid, unpack_seckill_order(h)) for soid, h in zip(seckill_ids, hashes) if h]
+        pids = _seckill_pids(seckill_orders)
+        names = {}
+        if pids:
+            async with r.pipeline(transaction=False) as pipe:
+                for pid in pids:
+                    pipe.hget(schema.product(pid), "name")
+                names = dict(zip(pids, await pipe.execute()))
+        return _build_seckill_records(seckill_orders, names)
+
+    order_hashes, seckill_records = await asyncio.gather(
+        _hgetall_many(r, [schema.order(oid) for oid in order_ids]),
+        load_seckill_records(),
+    )
+
+    return _profile_result(
+        user_info, summary,
+        _build_orders(order_ids, order_hashes), orders_len, orders_next,
+        seckill_records, seckill_len, seckill_next,
+    )
@@ -0,0 +1,210 @@
+"""
+每個使用者的訂單摘要（物化視圖），由 projector_user_summary.py 從事件 stream 維護。
+
+    user:{uid}:summary   hash
+        orders          一般訂單數
+        spend           累計消費（含運費）
+        items           累計件數
+        last_order_at   最近一筆訂單時間（ISO）
+        last_order_id   最近一筆訂單編號
+        seckill_wins    搶購成功次數
+        last_seckill_at 最近一次搶購成功時間
+
+來源是 stream:orders / stream:seckill，用 consumer group SUMMARY_GROUP 讀。
+每個事件用一個 Lua script 套用：先 XACK，XACK 回傳 0（已經處理過）就什麼都不做，
+所以 projector 重開、XAUTOCLAIM 撿回、兩個 consumer 同時拿到同一筆，都不會重複計算。
+
+REDIS_CLUSTER=1 時 stream 和摘要不在同一個 slot，不能放進同一個 script：
+改成在使用者自己的 slot 裡記「套用過哪些事件」（user:{uid}:summary:applied，sorted set，
+score = 事件時間，只留最近 APPLIED_KEEP_MS），script 只動這個使用者的 key，XACK 另外送。
+cluster 的 pipeline 不會先載入 script（遇到 NOSCRIPT 也不會重試），所以 script 逐筆直接執行，
+pipeline 只用來送 XACK。
+"""
+from datetime import datetime, timedelta, timezone
+
+from redis.exceptions import ResponseError
+
+from key_schema import CLUSTER, schema
+from order_records import order_summary, unpack_order
+
+ORDER_EVENTS_STREAM = schema.order_events_stream
+SECKILL_EVENTS_STREAM = schema.seckill_events_stream
+SUMMARY_GROUP = "user-summary"
+SUMMARY_STREAMS = (ORDER_EVENTS_STREAM, SECKILL_EVENTS_STREAM)
+
+TW = timezone(timedelta(hours=8))
+
+APPLIED_KEEP_MS = 7 * 24 * 3600 * 1000  # cluster 模式的去重紀錄保留多久（比事件最久會被撿回的時間長就好）
+
+# 把事件加到摘要（兩種模式共用）：KEYS[2] = user:{uid}:summary
+#   ARGV = [..., ..., kind（order / seckill）, 金額, 件數, 時間, 訂單編號]
+_APPLY_BODY = """
+if ARGV[3] == 'order' then
+  redis.call('HINCRBY', KEYS[2], 'orders', 1)
+  redis.call('HINCRBY', KEYS[2], 'spend', ARGV[4])
+  redis.call('HINCRBY', KEYS[2], 'items', ARGV[5])
+  local last = redis.call('HGET', KEYS[2], 'last_order_at')
+  if not last or ARGV[6] > last then
+    redis.call('HSET', KEYS[2], 'last_order_at', ARGV[6], 'last_order_id', ARGV[7])
+  end
+else
+  redis.call('HINCRBY', KEYS[2], 'seckill_wins', 1)
+  local last = redis.call('HGET', KEYS[2], 'last_seckill_at')
+  if not last or ARGV[6] > last then
+    redis.call('HSET', KEYS[2], 'last_seckill_at', ARGV[6])
+  end
+end
+return 1
+"""
+
+# 一般模式：KEYS = [stream, user:{uid}:summary]；ARGV[1..2] = [group, entry id]
+# 回傳 1 = 已套用；0 = 之前就處理過（XACK 回 0），略過
+_APPLY_SCRIPT = """
+if redis.call('XACK', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+  return 0
+end
+""" + _APPLY_BODY
+
+# cluster 模式：KEYS = [user:{uid}:summary:applied, user:{uid}:summary]；ARGV[1..2] = [stream|entry id, 事件毫秒]
+# 去重紀錄裡已經有這個事件就略過；順便清掉比這個事件早 ARGV[8] 毫秒以上的紀錄
+_APPLY_SCRIPT_CLUSTER = """
+if redis.call('ZADD', KEYS[1], 'NX', ARGV[2], ARGV[1]) == 0 then
+  return 0
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[2]) - tonumber(ARGV[8]))
+""" + _APPLY_BODY
+
+
+def summary_key(user_id: str) -> str:
+    return schema.user_summary(user_id)
+
+
+def ensure_summary_group(r):
+    """兩條 stream 都建立 consumer group，從頭（0）開始讀，第一次啟動就會把歷史事件補上。"""
+    for stream in SUMMARY_STREAMS:
+        try:
+            r.xgroup_create(stream, SUMMARY_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+def _event_time(entry_id: str, fields: dict) -> str:
+    """事件上的 created_at；舊事件沒有的話用 stream id 的毫秒時間（台灣時間）。"""
+    if fields.get("created_at"):
+        return fields["created_at"]
+    ms = int(entry_id.split("-")[0])
+    return datetime.fromtimestamp(ms / 1000, TW).isoformat(timespec="seconds")
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _legacy_order_amounts(r, entries) -> dict:
+    """
+    舊的訂單事件沒有 grand_total（只有不含運費的 total）：
+    一個 pipeline 讀回訂單 hash，用 order_summary() 算出含運費的金額和件數；
+    訂單已經刪掉的話，用事件上的 total / items 照同一套規則算。
+    回傳 {entry_id: (grand_total, items_count)}。
+    """
+    legacy = [
+        (entry_id, fields)
+        for entry_id, fields in entries
+        if fields and fields.get("user_id") and not fields.get("grand_total")
+    ]
+    if not legacy:
+        return {}
+    with r.pipeline(transaction=False) as pipe:
+        for _, fields in legacy:
+            pipe.hgetall(schema.order(fields.get("order_id", "")))
+        orders = pipe.execute()
+
+    amounts = {}
+    for (entry_id, fields), h in zip(legacy, orders):
+        summary = order_summary(unpack_order(h) if h else fields)
+        amounts[entry_id] = (summary["grand_total"], summary["items_count"])
+    return amounts
+
+
+def apply_events(r, stream: str, entries) -> int:
+    """
+    把一批 [(entry_id, fields)] 套用到摘要（一個 pipeline；cluster 模式 script 逐筆直接執行），
+    回傳實際套用幾筆。
+    消費金額一律用含運費的 grand_total（跟後台營收同一個定義）。
+    """
+    if not entries:
+        return 0
+    script = r.register_script(_APPLY_SCRIPT_CLUSTER if CLUSTER else _APPLY_SCRIPT)
+    kind = "order" if stream == ORDER_EVENTS_STREAM else "seckill"
+    legacy = _legacy_order_amounts(r, entries) if kind == "order" else {}
+
+    applied = 0  # cluster 模式直接執行的 script 裡套用了幾筆
+    script_calls = []  # 哪幾個 pipeline 結果是 script 的回傳值
+    with r.pipeline(transaction=False) as pipe:
+        for entry_id, fields in entries:
+            user_id = (fields or {}).get("user_id")
+            if not user_id:
+                # 沒有使用者的事件（或已被刪除的 entry）直接 ack
+                pipe.xack(stream, SUMMARY_GROUP, entry_id)
+                continue
+            if entry_id in legacy:
+                amount, items = legacy[entry_id]
+            else:
+                amount, items = _to_int(fields.get("grand_total")), _to_int(fields.get("items_count"))
+            event_args = [
+                kind,
+                amount,
+                items,
+                _event_time(entry_id, fields),
+                fields.get("order_id", ""),
+            ]
+            if CLUSTER:
+                result = script(
+                    keys=[schema.user_summary_applied(user_id), summary_key(user_id)],
+                    args=[f"{stream}|{entry_id}", entry_id.split("-")[0], *event_args, APPLIED_KEEP_MS],
+                )
+                applied += result == 1
+                pipe.xack(stream, SUMMARY_GROUP, entry_id)
+            else:
+                script_calls.append(len(pipe))
+                script(keys=[stream, summary_key(user_id)], args=[SUMMARY_GROUP, entry_id, *event_args], client=pipe)
+        results = pipe.execute()
+
+    return applied + sum(1 for i in script_calls if results[i] == 1)
+
+
+def rebuild(r):
+    """重建：刪掉所有摘要，consumer group 砍掉重建（從頭重讀）。projector 要先停掉。"""
+    keys = [k for k in r.scan_iter(summary_key("*"), count=500)]
+    keys += [k for k in r.scan_iter(schema.user_summary_applied("*"), count=500)]
+    for start in range(0, len(keys), 500):
+        r.delete(*keys[start:start + 500])
+    for stream in SUMMARY_STREAMS:
+        try:
+            r.xgroup_destroy(stream, SUMMARY_GROUP)
+        except ResponseError:
+            pass
+    ensure_summary_group(r)
+    return len(keys)
+
+
+def read_summary(r, user_id: str) -> dict:
+    """一次 HGETALL；數字欄位轉成 int，沒有資料的使用者回傳全 0。"""
+    return parse_summary(r.hgetall(summary_key(user_id)))
+
+
+def parse_summary(h: dict) -> dict:
+    h = h or {}
+    return {
+        "orders": _to_int(h.get("orders")),
+        "spend": _to_int(h.get("spend")),
+        "items": _to_int(h.get("items")),
+        "seckill_wins": _to_int(h.get("seckill_wins")),
+        "last_order_at": h.get("last_order_at", ""),
+        "last_order_id": h.get("last_order_id", ""),
+        "last_seckill_at": h.get("last_seckill_at", ""),
+    }
@@ -1,4 +1,5 @@
 from config_redis import get_redis_client
+from key_schema import schema
 
 r = get_redis_client()
 
@@ -14,8 +15,8 @@ def print_stream(name: str, count: int = 10):
 
 
 def main():
-    print_stream("stream:orders", 10)
-    print_stream("stream:seckill", 10)
+    print_stream(schema.order_events_stream, 10)
+    print_stream(schema.seckill_events_stream, 10)
 
 
 if __name__ == "__main__":
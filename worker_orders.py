@@ -1,16 +1,105 @@
+import argparse
+import queue
+import signal
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from config_redis import get_redis_client
+from key_schema import CLUSTER, schema
+from order_queue import (
+    LEGACY_QUEUE_KEY,
+    ORDER_STREAM,
+    ack_entries,
+    default_consumer_name,
+    drain_legacy_queue,
+    ensure_group,
+    move_due_retries,
+    read_batch,
+    reclaim_stuck,
+    remove_idle_consumers,
+    requeue_stuck,
+    schedule_retry,
+)
+from order_index import set_order_status
+from order_metrics import observe_order, rolling_summary, serve_metrics
+from order_records import unpack_order
 
-r = get_redis_client()
+r = get_redis_client("worker")
 
-QUEUE_KEY = "queue:orders"
+QUEUE_KEY = LEGACY_QUEUE_KEY
+
+DEFAULT_CONCURRENCY = 8
+POP_TIMEOUT = 1  # BLPOP / XREADGROUP 最多卡幾秒，好讓 worker 定期檢查是否要關閉
+MAINTENANCE_INTERVAL = 5  # 每隔幾秒搬一次舊 list 佇列、到期的重試、撿回卡住的訊息
+SIDE_EFFECT_SECONDS = 1  # 模擬寄信等副作用要花的時間（benchmark 會調成 0）
+
+# 批次模式：依佇列長度調整一次拿幾筆
+MIN_BATCH_SIZE = 10
+DEFAULT_MAX_BATCH_SIZE = 500
+
+SUMMARY_INTERVAL = 30  # 每隔幾秒在 log 印一次最近的延遲摘要
+
+# 收到 SIGTERM / Ctrl+C 時設起來，主迴圈就不再拿新訂單
+shutdown_event = threading.Event()
+
+# 由 supervisor.py 設成共享計數器（multiprocessing.Value），用來彙總各 process 的吞吐量
+processed_counter = None
+
+
+def _count_processed(n: int):
+    if processed_counter is None or n <= 0:
+        return
+    with processed_counter.get_lock():
+        processed_counter.value += n
+
+
+def send_order_email(order_id: str, order: dict):
+    """模擬花一點時間處理（例如寄信），之後換成真的副作用。"""
+    if SIDE_EFFECT_SECONDS:
+        time.sleep(SIDE_EFFECT_SECONDS)
+
+
+def processed_fields(picked_at: float = None) -> dict:
+    """訂單處理完成時要寫回的欄位（狀態 + 拿到 / 處理完成時間一次寫入）。"""
+    fields = {
+        "status": "processed",
+        "processed_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    if picked_at is not None:
+        fields["picked_at"] = datetime.fromtimestamp(picked_at).isoformat(timespec="seconds")
+    return fields
+
+
+def mark_processed(order_id: str, picked_at: float = None, pipe=None, old_status=None):
+    """
+    寫回處理完成的欄位，狀態索引（orders:status:*）在同一個 script 裡一起更新。
+    old_status 是已經讀到的目前狀態（批次模式從 HGETALL 的結果拿，省一次往返）。
+    """
+    fields = processed_fields(picked_at)
+    status = fields.pop("status")
+    return set_order_status(r, order_id, status, fields, pipe=pipe, old_status=old_status)
+
+
+_last_summary = time.monotonic()
+
+
+def _maybe_log_summary():
+    """每 SUMMARY_INTERVAL 秒印一次最近的排隊 / 端到端延遲。"""
+    global _last_summary
+    if time.monotonic() - _last_summary < SUMMARY_INTERVAL:
+        return
+    _last_summary = time.monotonic()
+    print(f"[{datetime.now()}] {rolling_summary()}")
 
 
 def process_order(order_id: str):
-    order_key = f"order:{order_id}"
-    order = r.hgetall(order_key)
+    started = time.perf_counter()
+    picked_at = time.time()
+
+    order_key = schema.order(order_id)
+    order = unpack_order(r.hgetall(order_key))
     if not order:
         print(f"[{datetime.now()}] 找不到訂單 {order_id}，可能已被刪除。")
         return
@@ -19,22 +108,397 @@ def process_order(order_id: str):
     print(f"  使用者：{order.get('user_id')}")
     print(f"  金額：${order.get('total')}")
 
-    # 模擬花一點時間處理（例如寄信）
-    time.sleep(1)
+    send_order_email(order_id, order)
 
-    # 更新訂單狀態
-    r.hset(order_key, "status", "processed")
-    r.hset(order_key, "processed_at", datetime.now().isoformat(timespec="seconds"))
+    # 更新訂單狀態（狀態 + 處理時間一次寫入）
+    mark_processed(order_id, picked_at)
 
-    print(f"[{datetime.now()}] 訂單 {order_id} 處理完成，狀態改為 processed")
+    _count_processed(1)
+    observe_order(order.get("enqueued_at"), picked_at, time.time(), order.get("requeued_at"))
 
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"[{datetime.now()}] 訂單 {order_id} 處理完成，狀態改為 processed"
+        f"（耗時 {elapsed_ms:.0f} ms）"
+    )
 
-def main():
-    print(f"訂單 worker 啟動，等待處理佇列：{QUEUE_KEY} ...")
-    while True:
-        # BLPOP：如果 queue 裡沒東西就會在這裡卡住，等有新訂單
-        _, order_id = r.blpop(QUEUE_KEY)
+
+def process_order_batch(order_ids, pool=None, entry_ids=None):
+    """
+    批次處理一組訂單：
+      1) 一個 pipeline 把所有訂單 hash 撈回來
+      2) 執行副作用（有給 pool 就並行）
+      3) 一個 pipeline 寫回所有狀態（stream 模式順便 XACK 成功的訊息；
+         cluster 模式的狀態 / 重試 script 逐筆直接執行，pipeline 只送 XACK）
+    失敗的訂單在同一個 pipeline 排進延遲重試佇列（stream 訊息照樣 ack，
+    重試交給延遲佇列負責）。回傳 (成功筆數, 失敗的訂單編號)。
+    """
+    if not order_ids:
+        return 0, []
+    entry_ids = entry_ids or [None] * len(order_ids)
+    picked_at = time.time()
+
+    with r.pipeline(transaction=False) as pipe:
+        for order_id in order_ids:
+            pipe.hgetall(schema.order(order_id))
+        orders = [unpack_order(h) for h in pipe.execute()]
+
+    def run_side_effects(args):
+        order_id, order = args
+        if not order:
+            # 找不到的訂單沒得處理，直接當作完成（ack 掉，不要一直重試）
+            return None
+        try:
+            send_order_email(order_id, order)
+            return None
+        except Exception as e:
+            print(f"[{datetime.now()}] 訂單 {order_id} 處理失敗，排入重試：{e!r}")
+            return repr(e)
+
+    jobs = list(zip(order_ids, orders))
+    errors = list(pool.map(run_side_effects, jobs)) if pool else [run_side_effects(j) for j in jobs]
+
+    done_entries = []
+    ok = 0
+    failed = []
+    status_writes = []  # (order_id, 在 pipeline 結果裡的位置)
+    with r.pipeline(transaction=False) as pipe:
+        # cluster 的 pipeline 不會先載入 Lua script（遇到 NOSCRIPT 也不會重試），script 改成直接執行
+        script_pipe = None if CLUSTER else pipe
+        for (order_id, order), entry_id, error in zip(jobs, entry_ids, errors):
+            if error is not None:
+                failed.append(order_id)
+                schedule_retry(r, order_id, error, pipe=script_pipe)
+            else:
+                ok += 1
+                if order:
+                    old_status = order.get("status") or ""
+                    if script_pipe is None:
+                        mark_processed(order_id, picked_at, old_status=old_status)
+                    else:
+                        status_writes.append((order_id, len(pipe)))
+                        mark_processed(order_id, picked_at, pipe=pipe, old_status=old_status)
+            if entry_id:
+                done_entries.append(entry_id)
+        ack_entries(pipe, done_entries)
+        results = pipe.execute()
+
+    # 讀出來之後狀態被後台改過（script 回傳 -1）：重讀目前狀態再寫一次
+    for order_id, pos in status_writes:
+        if results[pos] == -1:
+            mark_processed(order_id, picked_at)
+
+    _count_processed(ok)
+
+    done_at = time.time()
+    for (order_id, order), error in zip(jobs, errors):
+        if order and error is None:
+            observe_order(order.get("enqueued_at"), picked_at, done_at, order.get("requeued_at"))
+
+    return ok, failed
+
+
+def adaptive_batch_size(depth: int, max_batch: int) -> int:
+    """佇列越長一次拿越多：大約拿積壓量的 1/10，介於 MIN_BATCH_SIZE 和 max_batch 之間。"""
+    return min(max_batch, max(MIN_BATCH_SIZE, depth // 10))
+
+
+def queue_depth(source: str) -> int:
+    if source == "list":
+        return int(r.llen(QUEUE_KEY) or 0)
+    return int(r.xlen(ORDER_STREAM) or 0)
+
+
+def pop_order_ids(count: int, timeout: int = POP_TIMEOUT):
+    """list 模式：BLMPOP 一次最多拿 count 筆。"""
+    item = r.blmpop(timeout, 1, QUEUE_KEY, direction="LEFT", count=count)
+    if not item:
+        return []
+    _, order_ids = item
+    return order_ids
+
+
+def run_batch_worker(source: str, concurrency: int, consumer: str, max_batch: int):
+    """
+    批次模式：每一輪依佇列長度決定拿幾筆，HGETALL / 狀態寫入都各只有一次往返。
+    一整批做完才拿下一批，所以收到 SIGTERM 時手上那一批一定會做完。
+    """
+    if source == "stream":
+        ensure_group(r)
+    last_maintenance = 0.0
+
+    print(
+        f"訂單 worker 啟動（批次模式，最多 {max_batch} 筆 / 批，副作用並行 {concurrency}），"
+        f"等待處理佇列：{ORDER_STREAM if source == 'stream' else QUEUE_KEY} ..."
+    )
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not shutdown_event.is_set():
+            _maybe_log_summary()
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+                move_due_retries(r, target=source)
+                if source == "stream":
+                    drain_legacy_queue(r)
+                    retry, _ = reclaim_stuck(r, consumer, count=max_batch)
+                    if retry:
+                        process_order_batch(
+                            [order_id for _, order_id in retry],
+                            pool,
+                            [entry_id for entry_id, _ in retry],
+                        )
+
+            batch_size = adaptive_batch_size(queue_depth(source), max_batch)
+
+            if source == "stream":
+                entries = read_batch(r, consumer, count=batch_size, block_ms=POP_TIMEOUT * 1000)
+                order_ids = [order_id for _, order_id in entries]
+                entry_ids = [entry_id for entry_id, _ in entries]
+            else:
+                order_ids = pop_order_ids(batch_size)
+                entry_ids = None
+
+            if not order_ids:
+                continue
+
+            started = time.perf_counter()
+            ok, failed = process_order_batch(order_ids, pool, entry_ids)
+            elapsed = time.perf_counter() - started
+
+            print(
+                f"[{datetime.now()}] 批次完成：{ok} 筆成功、{len(failed)} 筆失敗"
+                f"（批次大小 {batch_size}，耗時 {elapsed * 1000:.0f} ms，"
+                f"{len(order_ids) / elapsed:.0f} 筆/秒）"
+            )
+
+
+def _run_one(order_id: str, slots: threading.Semaphore):
+    try:
         process_order(order_id)
+    except Exception as e:
+        _retry_later(order_id, e)
+    finally:
+        slots.release()
+
+
+def _retry_later(order_id: str, error: Exception):
+    """副作用失敗：記下失敗次數，依指數退避排進延遲佇列（太多次就進 dead-letter）。"""
+    delay = schedule_retry(r, order_id, repr(error))
+    if delay == -1:
+        print(f"[{datetime.now()}] 訂單 {order_id} 失敗太多次，已移到 dead-letter：{error!r}")
+    elif delay >= 0:
+        print(f"[{datetime.now()}] 訂單 {order_id} 處理失敗，{delay} 秒後重試：{error!r}")
+
+
+def _run_entry(entry_id: str, order_id: str, slots: threading.Semaphore, done: queue.SimpleQueue):
+    """
+    stream 版：處理完放進 done 等待批次 ack。副作用失敗就排進延遲重試佇列後一樣 ack；
+    如果連排重試都失敗（例如 Redis 斷線），就不 ack，留在 pending 之後會被撿回重做。
+    """
+    try:
+        if order_id:
+            try:
+                process_order(order_id)
+            except Exception as e:
+                _retry_later(order_id, e)
+        done.put(entry_id)
+    except Exception as e:
+        print(f"[{datetime.now()}] 訂單 {order_id} 無法排入重試，留待稍後撿回：{e!r}")
+    finally:
+        slots.release()
+
+
+def _acquire_slots(slots: threading.Semaphore, limit: int) -> int:
+    """先等到至少一個空位，再把其他現成的空位一起拿走，回傳拿到幾個。"""
+    if not slots.acquire(timeout=POP_TIMEOUT):
+        return 0
+    got = 1
+    while got < limit and slots.acquire(blocking=False):
+        got += 1
+    return got
+
+
+def _flush_acks(done: queue.SimpleQueue):
+    entry_ids = []
+    while True:
+        try:
+            entry_ids.append(done.get_nowait())
+        except queue.Empty:
+            break
+    if entry_ids:
+        with r.pipeline(transaction=False) as pipe:
+            ack_entries(pipe, entry_ids)
+            pipe.execute()
+
+
+def run_stream_worker(concurrency: int, consumer: str):
+    """從 stream consumer group 批次讀取訂單，處理完再批次 XACK。"""
+    ensure_group(r)
+
+    slots = threading.Semaphore(concurrency)
+    done = queue.SimpleQueue()
+    last_maintenance = 0.0
+
+    print(
+        f"訂單 worker 啟動（consumer={consumer}，同時處理 {concurrency} 筆），"
+        f"等待處理佇列：{ORDER_STREAM} ..."
+    )
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not shutdown_event.is_set():
+            _maybe_log_summary()
+            _flush_acks(done)
+
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+
+                move_due_retries(r, target="stream")
+                moved = drain_legacy_queue(r)
+                if moved:
+                    print(f"[{datetime.now()}] 從舊佇列 {LEGACY_QUEUE_KEY} 搬了 {moved} 筆到 stream")
+
+                retry, dead = reclaim_stuck(r, consumer, count=concurrency)
+                if dead:
+                    print(f"[{datetime.now()}] {dead} 筆訂單重試太多次，已移到 dead-letter")
+                for entry_id, order_id in retry:
+                    print(f"[{datetime.now()}] 撿回卡住的訂單 {order_id}（{entry_id}）")
+                    slots.acquire()
+                    pool.submit(_run_entry, entry_id, order_id, slots, done)
+
+            got = _acquire_slots(slots, concurrency)
+            if not got:
+                continue
+
+            entries = read_batch(r, consumer, count=got, block_ms=POP_TIMEOUT * 1000)
+            for _ in range(got - len(entries)):
+                slots.release()
+
+            for entry_id, order_id in entries:
+                pool.submit(_run_entry, entry_id, order_id, slots, done)
+
+    # 等手上的訂單做完後，把最後一批 ack 掉
+    _flush_acks(done)
+
+
+def run_list_worker(concurrency: int):
+    """舊版：直接 BLPOP list 佇列（worker 當掉時手上的訂單會遺失）。"""
+    # 有空位才去拿下一筆，這樣關閉時不會有「拿出來卻沒處理」的訂單
+    slots = threading.Semaphore(concurrency)
+
+    last_maintenance = 0.0
+
+    print(f"訂單 worker 啟動（同時處理 {concurrency} 筆），等待處理佇列：{QUEUE_KEY} ...")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not shutdown_event.is_set():
+            _maybe_log_summary()
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+                move_due_retries(r, target="list")
+
+            if not slots.acquire(timeout=POP_TIMEOUT):
+                continue
+
+            # BLPOP：如果 queue 裡沒東西就會在這裡卡住，等有新訂單（最多 POP_TIMEOUT 秒）
+            item = r.blpop(QUEUE_KEY, timeout=POP_TIMEOUT)
+            if item is None:
+                slots.release()
+                continue
+
+            _, order_id = item
+            pool.submit(_run_one, order_id, slots)
+
+
+def run_reaper(consumer: str):
+    """
+    只做維護、不處理訂單（給 supervisor 的 reapers 用）：
+      - 舊 list 佇列搬到 stream
+      - 到期的重試搬回工作佇列
+      - 已掛掉的 consumer 手上卡住的訊息重新排回 stream 尾端，讓活著的 worker 去拿；
+        同一筆重新排隊太多次（每次都讓 worker 當掉）就送進 dead-letter
+      - 清掉手上已經沒有 pending、很久沒出現的 consumer
+    """
+    ensure_group(r)
+    print(f"訂單 reaper 啟動（consumer={consumer}），每 {MAINTENANCE_INTERVAL} 秒檢查一次 ...")
+    while not shutdown_event.is_set():
+        moved = drain_legacy_queue(r)
+        due = move_due_retries(r, target="stream")
+
+        requeued, dead = requeue_stuck(r, consumer, count=DEFAULT_MAX_BATCH_SIZE)
+        removed = remove_idle_consumers(r)
+        _count_processed(moved + due + requeued + dead)
+
+        if moved or due or requeued or dead or removed:
+            print(
+                f"[{datetime.now()}] 舊佇列 {moved} 筆、到期重試 {due} 筆、"
+                f"重新排隊 {requeued} 筆、dead-letter {dead} 筆、清掉 consumer {removed} 個"
+            )
+        shutdown_event.wait(MAINTENANCE_INTERVAL)
+
+
+def _request_shutdown(signum, frame):
+    print(f"\n[{datetime.now()}] 收到結束訊號，處理完手上的訂單就停止 ...")
+    shutdown_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="訂單處理 worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"同時處理幾筆訂單（預設 {DEFAULT_CONCURRENCY}）",
+    )
+    parser.add_argument(
+        "--source",
+        choices=["stream", "list"],
+        default="stream",
+        help="stream：consumer group（預設）；list：舊版 BLPOP 佇列",
+    )
+    parser.add_argument(
+        "--consumer",
+        default=default_consumer_name(),
+        help="consumer group 裡的名稱（預設 主機名-pid）",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="批次模式：一次拿多筆，HGETALL 與狀態寫入都用 pipeline",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=DEFAULT_MAX_BATCH_SIZE,
+        help=f"批次模式一次最多拿幾筆（預設 {DEFAULT_MAX_BATCH_SIZE}）",
+    )
+    parser.add_argument(
+        "--reaper",
+        action="store_true",
+        help="只做維護（搬舊佇列、到期重試、撿回卡住的訊息），不處理訂單",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="開啟 Prometheus /metrics（佇列長度、最舊等待時間、延遲 histogram）",
+    )
+    args = parser.parse_args(argv)
+    concurrency = max(args.concurrency, 1)
+
+    if args.metrics_port:
+        serve_metrics(r, args.metrics_port)
+        print(f"監控指標：http://127.0.0.1:{args.metrics_port}/metrics")
+
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    signal.signal(signal.SIGINT, _request_shutdown)
+
+    if args.reaper:
+        run_reaper(args.consumer)
+    elif args.batch:
+        run_batch_worker(args.source, concurrency, args.consumer, max(args.max_batch, 1))
+    elif args.source == "list":
+        run_list_worker(concurrency)
+    else:
+        run_stream_worker(concurrency, args.consumer)
+
+    print(f"[{datetime.now()}] worker 已停止。")
 
 
 if __name__ == "__main__":